@@ -4,18 +4,34 @@
 # This script scrapes apartment data from Zillow and processes it to extract relevant details
 # such as apartment name, rent, pet policies, and nearby schools. The data is either scraped
 # fresh or loaded from a predownloaded file based on user input. The resulting data is saved
-# as a CSV file in the raw folder for further processing.
+# through `storage.py` as the raw stage for further processing.
 
 # This file imports configuration settings from the `config.py` module and uses predefined
 # functions to extract apartment details and handle pet policy, school information, and
 # appliances. The scraped or predownloaded data is returned as a DataFrame for further processing.
+# Pages are downloaded through `fetch_engine.FetchEngine`, so search-result pages and detail pages are
+# fetched concurrently over pooled connections and paced by a per-host rate limit. Responses are kept in
+# the shared on-disk cache, so pages that did not change since the last crawl are served from disk.
+# In incremental mode the search cards are compared with the previous raw snapshot, and only new or
+# changed listings have their detail page fetched; listings that disappeared are marked as removed.
+# Detail pages are parsed once with a filter that keeps only the elements the extraction helpers use,
+# in a separate process pool so parsing does not hold up downloads.
+# The crawl covers every market in `ZILLOW_MARKETS` and bedroom filter in `CRAWL_BEDROOMS`. These searches
+# are split into shards of a few pages that worker processes take from a shared queue (`crawl_shards`),
+# and the listings of all shards are merged into one raw dataset without duplicates.
 
-import requests
 from bs4 import BeautifulSoup
+from bs4.filter import ElementFilter
 import pandas as pd
-import time
-import random
+import multiprocessing
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from config import *  
+from fetch_engine import FetchEngine
+from http_cache import ResponseCache
+import storage
+import profiling
+from profiling import profiled
 
 # Define headers to mimic a real browser request
 headers = {
@@ -32,203 +48,502 @@ headers = {
     'Sec-Fetch-Dest': 'document'
 }
 
-def scrape_apartment_data(pages_to_scrape=20):
-    """Scrapes apartment data from Zillow or loads predownloaded data based on user choice."""
-    
-    # Ask user whether they want to use predownloaded data or scrape fresh data
-    predownload_or_not = input(
-        "It may take around 15 minutes to scrape fresh apartment data.\n"
-        "Do you want to use predownloaded apartment data instead? (y/n): "
-    ).strip().lower()
+# Search card fields compared against the previous snapshot to detect changed listings
+CARD_COLUMNS = ['Card Name', 'Card Price']
 
-    if predownload_or_not == "y" and os.path.exists(PREDOWNLOAD_APARTMENT_DATA_PATH):
-        print("Loading predownloaded apartment data...")
-        apartment_df = pd.read_csv(PREDOWNLOAD_APARTMENT_DATA_PATH)
-        return apartment_df
-    else:
-        print("Scraping fresh apartment data from Zillow...")
-
-        # Initialize an empty list to store apartment data
-        apartment_data = []
-
-    def extract_text(soup, selectors, default='N/A'):
-        """Helper function to extract text using multiple selectors."""
-        for selector in selectors:
-            element = soup.select_one(selector)
-            if element and element.text.strip():
-                return element.text.strip()
-        return default
-
-    def extract_pet_policy(soup, data_test_id):
-        """Helper function to extract pet policy from the specified div."""
-        try:
-            policy_div = soup.find('div', {'data-test-id': data_test_id})
-            if policy_div:
-                li_items = policy_div.find_all('li', class_='ListItem-c11n-8-101-4__sc-13rwu5a-0 fxuoli')
-                policies = [li.find('span', class_='Text-c11n-8-101-4__sc-aiai24-0 gtFYdd').text.strip() for li in li_items if li.find('span', class_='Text-c11n-8-101-4__sc-aiai24-0 gtFYdd')]
-                return ', '.join(policies) if policies else 'N/A'
-            return 'N/A'
-        except Exception:
-            return 'N/A'
-
-    def extract_pets_allowed(soup):
-        """Helper function to extract pets allowed policy under 'Management' heading."""
-        try:
-            management_section = soup.find('h6', text='Management')
-            if management_section:
-                parent_div = management_section.find_parent('div', {'data-testid': 'fact-category'})
-                if parent_div:
-                    li_items = parent_div.find_all('li', class_='ListItem-c11n-8-100-1__sc-13rwu5a-0 dWrjmG')
-                    for li in li_items:
-                        pets_allowed = li.find('span', class_='Text-c11n-8-100-1__sc-aiai24-0 jbRdkh')
-                        if pets_allowed and 'Pets allowed' in pets_allowed.text:
-                            return 'Yes' if 'Yes' in pets_allowed.text else 'No'
-            return 'N/A'
-        except Exception:
-            return 'N/A'
-
-    def extract_appliances(soup):
-        """Extract appliance information from different possible structures and return as a comma-separated string."""
-        appliances_list = []
-        try:
-            appliances_div = soup.find('div', {'data-test-id': 'building-amenity-appliances'})
-            if appliances_div:
-                li_items = appliances_div.find_all('li', class_='ListItem-c11n-8-101-4__sc-13rwu5a-0 fxuoli')
+# Elements the detail page helpers start their lookups from; everything else is skipped while parsing
+DETAIL_PAGE_TAGS = {'h1', 'h2', 'h5', 'h6'}
+DETAIL_PAGE_ATTRIBUTES = ('data-test-id', 'data-testid')
+DETAIL_PAGE_CLASSES = {
+    'AtAGlanceFactsHollywood__StyledContainer-sc-34d077-0',  # Features, structure 1
+    'hdp__sc-1nwbd1e-0',  # Features, structure 2
+    'TriggerText-c11n-8-100-1__sc-d96jze-0',  # Rent button
+    'fact-category',  # Appliances
+    'qjARs',  # Schools, structure 1
+    'dQqFYn',  # Schools, structure 2
+}
+
+
+class DetailPageFilter(ElementFilter):
+    """
+    Parse-time filter for detail pages. Only elements the extraction helpers can match are kept,
+    together with their whole subtree, so the page is parsed once into a small tree and every
+    helper lookup runs over a few dozen elements instead of the full document.
+    Every element a helper could return is kept, so the extracted values are the same as with a full parse.
+    """
+
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        if name in DETAIL_PAGE_TAGS:
+            return True
+        if not attrs:
+            return False
+        if any(attribute in attrs for attribute in DETAIL_PAGE_ATTRIBUTES):
+            return True
+        classes = attrs.get('class')
+        if isinstance(classes, str):
+            classes = classes.split()
+        return bool(classes) and not DETAIL_PAGE_CLASSES.isdisjoint(classes)
+
+    def allow_string_creation(self, string):
+        # Text outside the kept elements is never read
+        return False
+
+
+DETAIL_PAGE_FILTER = DetailPageFilter()
+
+
+def extract_text(soup, selectors, default='N/A'):
+    """Helper function to extract text using multiple selectors."""
+    for selector in selectors:
+        element = soup.select_one(selector)
+        if element and element.text.strip():
+            return element.text.strip()
+    return default
+
+
+def extract_pet_policy(soup, data_test_id):
+    """Helper function to extract pet policy from the specified div."""
+    try:
+        policy_div = soup.find('div', {'data-test-id': data_test_id})
+        if policy_div:
+            li_items = policy_div.find_all('li', class_='ListItem-c11n-8-101-4__sc-13rwu5a-0 fxuoli')
+            policies = [li.find('span', class_='Text-c11n-8-101-4__sc-aiai24-0 gtFYdd').text.strip() for li in li_items if li.find('span', class_='Text-c11n-8-101-4__sc-aiai24-0 gtFYdd')]
+            return ', '.join(policies) if policies else 'N/A'
+        return 'N/A'
+    except Exception:
+        return 'N/A'
+
+
+def extract_pets_allowed(soup):
+    """Helper function to extract pets allowed policy under 'Management' heading."""
+    try:
+        management_section = soup.find('h6', text='Management')
+        if management_section:
+            parent_div = management_section.find_parent('div', {'data-testid': 'fact-category'})
+            if parent_div:
+                li_items = parent_div.find_all('li', class_='ListItem-c11n-8-100-1__sc-13rwu5a-0 dWrjmG')
                 for li in li_items:
-                    appliance = li.find('span', class_='Text-c11n-8-101-4__sc-aiai24-0 gtFYdd')
+                    pets_allowed = li.find('span', class_='Text-c11n-8-100-1__sc-aiai24-0 jbRdkh')
+                    if pets_allowed and 'Pets allowed' in pets_allowed.text:
+                        return 'Yes' if 'Yes' in pets_allowed.text else 'No'
+        return 'N/A'
+    except Exception:
+        return 'N/A'
+
+
+def extract_appliances(soup):
+    """Extract appliance information from different possible structures and return as a comma-separated string."""
+    appliances_list = []
+    try:
+        appliances_div = soup.find('div', {'data-test-id': 'building-amenity-appliances'})
+        if appliances_div:
+            li_items = appliances_div.find_all('li', class_='ListItem-c11n-8-101-4__sc-13rwu5a-0 fxuoli')
+            for li in li_items:
+                appliance = li.find('span', class_='Text-c11n-8-101-4__sc-aiai24-0 gtFYdd')
+                if appliance and appliance.text.strip():
+                    appliances_list.append(appliance.text.strip())
+
+        appliances_category_div = soup.find('div', class_='fact-category')
+        if appliances_category_div:
+            ul_items = appliances_category_div.find_all('ul', class_='List-c11n-8-100-1__sc-1smrmqp-0 styles__StyledFactCategoryFactsList-fshdp-8-100-2__sc-1i5yjpk-1 nZbpv bREKeA')
+            for ul in ul_items:
+                li_items = ul.find_all('li', class_='ListItem-c11n-8-100-1__sc-13rwu5a-0 dWrjmG')
+                for li in li_items:
+                    appliance = li.find('span', class_='Text-c11n-8-100-1__sc-aiai24-0 jbRdkh')
                     if appliance and appliance.text.strip():
                         appliances_list.append(appliance.text.strip())
 
-            appliances_category_div = soup.find('div', class_='fact-category')
-            if appliances_category_div:
-                ul_items = appliances_category_div.find_all('ul', class_='List-c11n-8-100-1__sc-1smrmqp-0 styles__StyledFactCategoryFactsList-fshdp-8-100-2__sc-1i5yjpk-1 nZbpv bREKeA')
-                for ul in ul_items:
-                    li_items = ul.find_all('li', class_='ListItem-c11n-8-100-1__sc-13rwu5a-0 dWrjmG')
-                    for li in li_items:
-                        appliance = li.find('span', class_='Text-c11n-8-100-1__sc-aiai24-0 jbRdkh')
-                        if appliance and appliance.text.strip():
-                            appliances_list.append(appliance.text.strip())
-
-            return ', '.join(appliances_list) if appliances_list else 'N/A'
-        except Exception:
-            return 'N/A'
-
-    def extract_schools_structure_1(soup):
-        """Extract school information from the first structure."""
-        school_info = {}
-        school_list = soup.find('ul', class_='List-c11n-8-101-4__sc-1smrmqp-0 qjARs')
-        if school_list:
-            school_items = school_list.find_all('li', class_='ListItem-c11n-8-101-4__sc-13rwu5a-0 sc-eVZGIO knfXza jZa-dWq')
+        return ', '.join(appliances_list) if appliances_list else 'N/A'
+    except Exception:
+        return 'N/A'
+
+
+def extract_schools_structure_1(soup):
+    """Extract school information from the first structure."""
+    school_info = {}
+    school_list = soup.find('ul', class_='List-c11n-8-101-4__sc-1smrmqp-0 qjARs')
+    if school_list:
+        school_items = school_list.find_all('li', class_='ListItem-c11n-8-101-4__sc-13rwu5a-0 sc-eVZGIO knfXza jZa-dWq')
+        for i in range(min(3, len(school_items))):  # Limit to 3 schools
+            school_item = school_items[i]
+            school_name_tag = school_item.find('a', class_='StyledTextButton-c11n-8-101-4__sc-1nwmfqo-0 fvRKOm notranslate')
+            school_name = school_name_tag.text.strip() if school_name_tag else 'N/A'
+            grades_div_parent = school_item.find('div', class_='Spacer-c11n-8-101-4__sc-17suqs2-0 dVGeMt')
+            grades_span = grades_div_parent.find('span', class_='Text-c11n-8-101-4__sc-aiai24-0 jyAa-dJ') if grades_div_parent else None
+            grades = grades_span.text.strip() if grades_span else 'N/A'
+            rank_span = school_item.find('span', class_='Text-c11n-8-101-4__sc-aiai24-0 kcINhd')
+            rank = rank_span.text.strip() if rank_span else 'N/A'
+            school_info[f'school_name_{i+1}'] = school_name
+            school_info[f'Grades_{i+1}'] = grades
+            school_info[f'Rank_{i+1}'] = rank
+    return school_info
+
+
+def extract_schools_structure_2(soup):
+    """Extract school information from the second structure (GreatSchools rating)."""
+    school_info = {}
+    schools_section = soup.find('h5', text='GreatSchools rating')
+    if schools_section:
+        parent_div = schools_section.find_next('div', class_='Spacer-c11n-8-100-1__sc-17suqs2-0 sc-jRWcDx dQqFYn')
+        if parent_div:
+            school_items = parent_div.find_all('li', class_='ListItem-c11n-8-100-1__sc-13rwu5a-0 sc-fiDBSu sjBJu ekjldB')
             for i in range(min(3, len(school_items))):  # Limit to 3 schools
                 school_item = school_items[i]
-                school_name_tag = school_item.find('a', class_='StyledTextButton-c11n-8-101-4__sc-1nwmfqo-0 fvRKOm notranslate')
+                school_name_tag = school_item.find('a', class_='StyledTextButton-c11n-8-100-1__sc-1nwmfqo-0 hcHpXi notranslate')
                 school_name = school_name_tag.text.strip() if school_name_tag else 'N/A'
-                grades_div_parent = school_item.find('div', class_='Spacer-c11n-8-101-4__sc-17suqs2-0 dVGeMt')
-                grades_span = grades_div_parent.find('span', class_='Text-c11n-8-101-4__sc-aiai24-0 jyAa-dJ') if grades_div_parent else None
-                grades = grades_span.text.strip() if grades_span else 'N/A'
-                rank_span = school_item.find('span', class_='Text-c11n-8-101-4__sc-aiai24-0 kcINhd')
-                rank = rank_span.text.strip() if rank_span else 'N/A'
+                grades_tag = school_item.find('span', class_='Text-c11n-8-100-1__sc-aiai24-0 kbVOjR')
+                grades = grades_tag.text.strip() if grades_tag else 'N/A'
+                rating_tag = school_item.find('span', class_='Text-c11n-8-100-1__sc-aiai24-0 bENqXR')
+                rating = rating_tag.text.strip() if rating_tag else 'N/A'
                 school_info[f'school_name_{i+1}'] = school_name
                 school_info[f'Grades_{i+1}'] = grades
-                school_info[f'Rank_{i+1}'] = rank
-        return school_info
-
-    def extract_schools_structure_2(soup):
-        """Extract school information from the second structure (GreatSchools rating)."""
-        school_info = {}
-        schools_section = soup.find('h5', text='GreatSchools rating')
-        if schools_section:
-            parent_div = schools_section.find_next('div', class_='Spacer-c11n-8-100-1__sc-17suqs2-0 sc-jRWcDx dQqFYn')
-            if parent_div:
-                school_items = parent_div.find_all('li', class_='ListItem-c11n-8-100-1__sc-13rwu5a-0 sc-fiDBSu sjBJu ekjldB')
-                for i in range(min(3, len(school_items))):  # Limit to 3 schools
-                    school_item = school_items[i]
-                    school_name_tag = school_item.find('a', class_='StyledTextButton-c11n-8-100-1__sc-1nwmfqo-0 hcHpXi notranslate')
-                    school_name = school_name_tag.text.strip() if school_name_tag else 'N/A'
-                    grades_tag = school_item.find('span', class_='Text-c11n-8-100-1__sc-aiai24-0 kbVOjR')
-                    grades = grades_tag.text.strip() if grades_tag else 'N/A'
-                    rating_tag = school_item.find('span', class_='Text-c11n-8-100-1__sc-aiai24-0 bENqXR')
-                    rating = rating_tag.text.strip() if rating_tag else 'N/A'
-                    school_info[f'school_name_{i+1}'] = school_name
-                    school_info[f'Grades_{i+1}'] = grades
-                    school_info[f'Rating_{i+1}'] = rating
-        return school_info
-
-    for page_number in range(1, pages_to_scrape + 1):  # Adjust the range to the number of pages you want to scrape
-        if page_number == 1:
-            url = 'https://www.zillow.com/new-york-ny/apartments/1-bedrooms/'
-        else:
-            url = f'https://www.zillow.com/new-york-ny/apartments/1-bedrooms/{page_number}_p/'
-
-        try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            ul = soup.find('ul', class_='List-c11n-8-105-0__sc-1smrmqp-0 StyledSearchListWrapper-srp-8-105-0__sc-1ieen0c-0 fNTnXQ dtRiBi photo-cards photo-cards_extra-attribution')
-
-            if ul:
-                li_items = ul.find_all('li', class_='ListItem-c11n-8-105-0__sc-13rwu5a-0 StyledListCardWrapper-srp-8-105-0__sc-wtsrtn-0 gpgmwS cXzrsE')
+                school_info[f'Rating_{i+1}'] = rating
+    return school_info
 
-                for li in li_items:
-                    link_tag = li.find('a', href=True)
-                    if link_tag:
-                        apartment_url = link_tag['href']
-                        if not apartment_url.startswith('http'):
-                            apartment_url = "https://www.zillow.com" + apartment_url
-
-                        try:
-                            apartment_response = requests.get(apartment_url, headers=headers)
-                            apartment_response.raise_for_status()
-
-                            apartment_soup = BeautifulSoup(apartment_response.text, 'html.parser')
-
-                            apartment_name = extract_text(apartment_soup, ['h1[data-test-id="bdp-building-title"]', 'h1.Text-c11n-8-100-1__sc-aiai24-0.jbRdkh'])
-                            apartment_address = extract_text(apartment_soup, ['h2[data-test-id="bdp-building-address"]', 'h1.Text-c11n-8-100-1__sc-aiai24-0.jbRdkh'])
-                            apartment_rent = extract_text(apartment_soup, ['span[data-test-id="base-rent"]', 'button.TriggerText-c11n-8-100-1__sc-d96jze-0.BpPaS.TooltipPopper-c11n-8-100-1__sc-1v2hxhd-0.dYtaCG'])
-                            features = extract_text(apartment_soup, [
-                                'div.AtAGlanceFactsHollywood__StyledContainer-sc-34d077-0.jevfwQ',  # Structure 1
-                                'div.hdp__sc-1nwbd1e-0.dcGsBQ'  # Structure 2
-                            ])
-                            appliances = extract_appliances(apartment_soup)
-
-                            dog_policy = extract_pet_policy(apartment_soup, 'building-null-dogs-policy')
-                            cat_policy = extract_pet_policy(apartment_soup, 'building-null-cats-policy')
-                            large_dog_policy = extract_pet_policy(apartment_soup, 'building-large-dogs-policy')
-                            small_dog_policy = extract_pet_policy(apartment_soup, 'building-small-dogs-policy')
-                            pets_allowed = extract_pets_allowed(apartment_soup)
-
-                            school_info_1 = extract_schools_structure_1(apartment_soup)
-                            school_info_2 = extract_schools_structure_2(apartment_soup)
-                            school_info_combined = {**school_info_1, **school_info_2}
-
-                            apartment_data.append({
-                                'Apartment Name': apartment_name,
-                                'Address': apartment_address,
-                                'Rent': apartment_rent,
-                                'Features': features,
-                                'Appliances': appliances,
-                                'Dogs Policy': dog_policy,
-                                'Cats Policy': cat_policy,
-                                'Large Dogs Policy': large_dog_policy,
-                                'Small Dogs Policy': small_dog_policy,
-                                'Pets Allowed': pets_allowed,
-                                **school_info_combined
-                            })
-
-                            time.sleep(random.uniform(2, 5))
-
-                        except requests.exceptions.RequestException as e:
-                            print(f"Failed to retrieve apartment data from {apartment_url}: {e}")
-
-        except requests.exceptions.RequestException as e:
-            print(f"Failed to retrieve page {page_number}: {e}")
-
-    # Store the apartment data in a DataFrame
+
+def search_page_url(page_number, market=ZILLOW_MARKETS[0], bedrooms='1', base_url=ZILLOW_BASE_URL):
+    """Build the URL of one search-result page of a market, for one bedroom filter (a `ZILLOW_BEDROOM_PATHS` key)."""
+    url = base_url + ZILLOW_SEARCH_PATH.format(market=market, bedrooms=ZILLOW_BEDROOM_PATHS[bedrooms])
+    if page_number == 1:
+        return url
+    return f"{url}{page_number}_p/"
+
+
+def parse_search_page(html):
+    """
+    Return one summary per listing card on a search-result page.
+    Each summary holds the detail page URL and the name and price shown on the card.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    cards = []
+
+    ul = soup.find('ul', class_='List-c11n-8-105-0__sc-1smrmqp-0 StyledSearchListWrapper-srp-8-105-0__sc-1ieen0c-0 fNTnXQ dtRiBi photo-cards photo-cards_extra-attribution')
+
+    if ul:
+        li_items = ul.find_all('li', class_='ListItem-c11n-8-105-0__sc-13rwu5a-0 StyledListCardWrapper-srp-8-105-0__sc-wtsrtn-0 gpgmwS cXzrsE')
+
+        for li in li_items:
+            link_tag = li.find('a', href=True)
+            if link_tag:
+                apartment_url = link_tag['href']
+                if not apartment_url.startswith('http'):
+                    apartment_url = ZILLOW_BASE_URL + apartment_url
+                cards.append({
+                    'Listing URL': apartment_url,
+                    'Card Name': extract_text(li, ['address[data-test="property-card-addr"]', 'a.property-card-link']),
+                    'Card Price': extract_text(li, ['span[data-test="property-card-price"]']),
+                })
+
+    return cards
+
+
+def parse_apartment_page(html, parse_only=DETAIL_PAGE_FILTER):
+    """
+    Extract all fields of one apartment detail page into a dictionary.
+    Pass parse_only=None to parse the full document instead of only the elements the helpers use.
+    """
+    apartment_soup = BeautifulSoup(html, 'html.parser', parse_only=parse_only)
+
+    apartment_name = extract_text(apartment_soup, ['h1[data-test-id="bdp-building-title"]', 'h1.Text-c11n-8-100-1__sc-aiai24-0.jbRdkh'])
+    apartment_address = extract_text(apartment_soup, ['h2[data-test-id="bdp-building-address"]', 'h1.Text-c11n-8-100-1__sc-aiai24-0.jbRdkh'])
+    apartment_rent = extract_text(apartment_soup, ['span[data-test-id="base-rent"]', 'button.TriggerText-c11n-8-100-1__sc-d96jze-0.BpPaS.TooltipPopper-c11n-8-100-1__sc-1v2hxhd-0.dYtaCG'])
+    features = extract_text(apartment_soup, [
+        'div.AtAGlanceFactsHollywood__StyledContainer-sc-34d077-0.jevfwQ',  # Structure 1
+        'div.hdp__sc-1nwbd1e-0.dcGsBQ'  # Structure 2
+    ])
+    appliances = extract_appliances(apartment_soup)
+
+    dog_policy = extract_pet_policy(apartment_soup, 'building-null-dogs-policy')
+    cat_policy = extract_pet_policy(apartment_soup, 'building-null-cats-policy')
+    large_dog_policy = extract_pet_policy(apartment_soup, 'building-large-dogs-policy')
+    small_dog_policy = extract_pet_policy(apartment_soup, 'building-small-dogs-policy')
+    pets_allowed = extract_pets_allowed(apartment_soup)
+
+    school_info_1 = extract_schools_structure_1(apartment_soup)
+    school_info_2 = extract_schools_structure_2(apartment_soup)
+    school_info_combined = {**school_info_1, **school_info_2}
+
+    return {
+        'Apartment Name': apartment_name,
+        'Address': apartment_address,
+        'Rent': apartment_rent,
+        'Features': features,
+        'Appliances': appliances,
+        'Dogs Policy': dog_policy,
+        'Cats Policy': cat_policy,
+        'Large Dogs Policy': large_dog_policy,
+        'Small Dogs Policy': small_dog_policy,
+        'Pets Allowed': pets_allowed,
+        **school_info_combined
+    }
+
+
+def card_changed(card, previous_row):
+    """A listing needs a detail fetch when it is new or its card name/price differs from the last snapshot."""
+    if previous_row is None:
+        return True
+    return any(str(card[column]) != str(previous_row.get(column)) for column in CARD_COLUMNS)
+
+
+def crawl_listings(search_urls, engine, parser, previous=None, max_in_flight=PARSE_QUEUE_SIZE):
+    """
+    Crawl search pages and their detail pages as one pipeline.
+    All search pages are queued at once. Detail pages found on them are fetched by the engine's threads
+    and their HTML is handed to the `parser` executor (a process pool), so parsing runs on other cores
+    while the next pages download. At most `max_in_flight` detail pages are being fetched or parsed at any
+    time; the rest wait as URLs, which keeps memory flat however many pages are crawled.
+    :param previous: Optional dict of Listing URL -> row from the previous raw snapshot. Listings whose
+                     card is unchanged reuse that row instead of fetching the detail page again.
+    :return: List of apartment dictionaries in search-page order, the set of listing URLs seen on the
+             search pages, and the number of search pages that failed to load.
+    """
+    previous = previous or {}
+    pending = {}  # Future -> ('page', page_index), ('fetch', key, card) or ('parse', key, card)
+    for page_index, url in enumerate(search_urls):
+        pending[engine.submit(url)] = ('page', page_index)
+
+    waiting = deque()  # (key, card) of detail pages not yet submitted
+    in_flight = 0
+    results = {}
+    seen_urls = set()
+    failed_pages = 0
+    failed_listings = 0
+    reused = 0
+    while pending or waiting:
+        # Top up the detail stage without exceeding the in-flight bound
+        while waiting and in_flight < max_in_flight:
+            key, card = waiting.popleft()
+            pending[engine.submit(card['Listing URL'])] = ('fetch', key, card)
+            in_flight += 1
+
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            kind, key, *card = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                # A failed page or listing is counted and skipped; the rest of the crawl goes on
+                if kind == 'page':
+                    failed_pages += 1
+                    print(f"Failed to retrieve page {search_urls[key]}: {e}")
+                else:
+                    in_flight -= 1
+                    failed_listings += 1
+                    action = 'retrieve' if kind == 'fetch' else 'parse'
+                    print(f"Failed to {action} apartment data from {card[0]['Listing URL']}: {e!r}")
+                continue
+
+            if kind == 'page':
+                for position, card in enumerate(parse_search_page(result)):
+                    seen_urls.add(card['Listing URL'])
+                    previous_row = previous.get(card['Listing URL'])
+                    if card_changed(card, previous_row):
+                        waiting.append(((key, position), card))
+                    else:
+                        results[(key, position)] = {**previous_row, 'Listing Status': 'Active'}
+                        reused += 1
+            elif kind == 'fetch':
+                try:
+                    pending[parser.submit(parse_apartment_page, result)] = ('parse', key, card[0])
+                except Exception as e:  # e.g. BrokenProcessPool after a parser process died
+                    in_flight -= 1
+                    failed_listings += 1
+                    print(f"Failed to parse apartment data from {card[0]['Listing URL']}: {e!r}")
+            else:
+                in_flight -= 1
+                results[key] = {**result, **card[0], 'Listing Status': 'Active'}
+
+    if failed_listings:
+        print(f"{failed_listings} listings could not be retrieved or parsed.")
+    apartment_data = [results[key] for key in sorted(results)]
+    if previous:
+        print(f"{reused} unchanged listings reused, {len(apartment_data) - reused} fetched.")
+    return apartment_data, seen_urls, failed_pages
+
+
+def mark_removed(apartment_data, previous, seen_urls, failed_pages):
+    """
+    Append the listings of the previous snapshot that were not seen on any search page.
+    They are kept but marked as removed, unless a page failed to load, in which case we cannot tell
+    whether they are really gone.
+    """
+    previous = previous or {}
+    unseen = [row for url, row in previous.items() if url not in seen_urls]
+    if failed_pages == 0:
+        unseen = [{**row, 'Listing Status': 'Removed'} for row in unseen]
+    if previous:
+        print(f"{sum(row['Listing Status'] == 'Removed' for row in unseen)} listings marked as removed.")
+    return apartment_data + unseen
+
+
+# %%
+# Sharded crawl: every (market, bedroom filter, page range) is a shard, and worker processes take shards
+# from a shared queue until it is empty. Each worker runs its own fetch engine, with an equal share of the
+# per-host request rate so all workers together stay within `CRAWL_REQUESTS_PER_SECOND`.
+
+CrawlShard = namedtuple('CrawlShard', ['market', 'bedrooms', 'first_page', 'last_page'])
+
+
+def plan_shards(markets=ZILLOW_MARKETS, bedrooms=CRAWL_BEDROOMS, pages=CRAWL_PAGES_PER_SEARCH,
+                pages_per_shard=CRAWL_PAGES_PER_SHARD):
+    """Split the search pages of every market and bedroom filter into shards of `pages_per_shard` pages."""
+    return [CrawlShard(market, bedroom, first_page, min(first_page + pages_per_shard - 1, pages))
+            for market in markets for bedroom in bedrooms
+            for first_page in range(1, pages + 1, pages_per_shard)]
+
+
+def shard_urls(shard, base_url=ZILLOW_BASE_URL):
+    return [search_page_url(page_number, shard.market, shard.bedrooms, base_url)
+            for page_number in range(shard.first_page, shard.last_page + 1)]
+
+
+def crawl_worker(tasks, results, previous, settings):
+    """
+    Worker process: crawl shards from `tasks` until a None arrives, putting each result on `results`.
+    Detail pages are parsed on a thread of the worker, as the worker processes already use the cores.
+    """
+    with FetchEngine(workers=settings['workers'], rate=settings['rate'], headers=headers,
+                     cache=ResponseCache(settings['cache_dir']),
+                     revalidate_rate=settings['revalidate_rate']) as engine, ThreadPoolExecutor(max_workers=1) as parser:
+        for index, shard in iter(tasks.get, None):
+            http_start = profiling.current_run().http.totals()
+            try:
+                apartment_data, seen_urls, failed_pages = crawl_listings(
+                    shard_urls(shard, settings['base_url']), engine, parser, previous)
+            except Exception as e:
+                print(f"Failed to crawl {shard}: {e}")
+                apartment_data, seen_urls, failed_pages = [], set(), shard.last_page - shard.first_page + 1
+            http = [end - start for end, start in zip(profiling.current_run().http.totals(), http_start)]
+            results.put((index, apartment_data, seen_urls, failed_pages, http))
+
+
+def merge_shards(shard_results):
+    """
+    Concatenate shard results in shard order, keeping the first row of every listing URL.
+    :return: Deduplicated rows, all listing URLs seen, total failed pages and duplicates dropped.
+    """
+    apartment_data, seen_urls, failed_pages, duplicates = [], set(), 0, 0
+    kept_urls = set()
+    for rows, shard_seen, shard_failed in shard_results:
+        for row in rows:
+            if row['Listing URL'] in kept_urls:
+                duplicates += 1
+                continue
+            kept_urls.add(row['Listing URL'])
+            apartment_data.append(row)
+        seen_urls |= shard_seen
+        failed_pages += shard_failed
+    return apartment_data, seen_urls, failed_pages, duplicates
+
+
+@profiled('apartments: sharded crawl')
+def crawl_shards(shards, processes=CRAWL_PROCESSES, workers=CRAWL_WORKERS, rate=CRAWL_REQUESTS_PER_SECOND,
+                 previous=None, base_url=ZILLOW_BASE_URL, cache_dir=HTTP_CACHE_DIR):
+    """
+    Crawl `shards` on `processes` worker processes sharing one work queue, and merge their listings.
+    Listings of `previous` no longer on any search page are marked as removed.
+    :return: List of apartment dictionaries in shard order, without duplicate listing URLs.
+    """
+    processes = max(1, min(processes, len(shards)))
+    settings = {'workers': workers, 'rate': rate / processes if rate else rate, 'base_url': base_url,
+                'revalidate_rate': CRAWL_REVALIDATIONS_PER_SECOND / processes, 'cache_dir': cache_dir}
+    tasks, results = multiprocessing.Queue(), multiprocessing.Queue()
+    for item in enumerate(shards):
+        tasks.put(item)
+    for _ in range(processes):
+        tasks.put(None)  # One stop signal per worker
+
+    print(f"Crawling {len(shards)} shards on {processes} worker processes...")
+    if processes == 1:
+        crawl_worker(tasks, results, previous, settings)
+        workers_started = []
+    else:
+        workers_started = [multiprocessing.Process(target=crawl_worker, args=(tasks, results, previous, settings),
+                                                   daemon=True) for _ in range(processes)]
+        for process in workers_started:
+            process.start()
+
+    # Results are collected before joining, so workers never block on a full result queue
+    shard_results = [None] * len(shards)
+    for _ in shards:
+        index, rows, seen_urls, failed_pages, http = results.get()
+        shard_results[index] = (rows, seen_urls, failed_pages)
+        if workers_started:
+            profiling.current_run().http.add_totals(*http)  # Traffic of the worker processes
+        print(f"Shard {index + 1}/{len(shards)} done: {shards[index]} ({len(rows)} listings)")
+    for process in workers_started:
+        process.join()
+
+    apartment_data, seen_urls, failed_pages, duplicates = merge_shards(shard_results)
+    print(f"{len(apartment_data)} listings crawled; {duplicates} duplicates across shards dropped.")
+    return mark_removed(apartment_data, previous, seen_urls, failed_pages)
+
+
+def load_previous_snapshot():
+    """Load the last raw snapshot as a dict of Listing URL -> row, or an empty dict if there is none."""
+    if not storage.stage_exists('raw'):
+        return {}
+    snapshot = storage.load_stage('raw')
+    if 'Listing URL' not in snapshot.columns:
+        return {}
+    return {row['Listing URL']: row for row in snapshot.to_dict('records')}
+
+
+def ask_use_predownloaded():
+    """Ask whether to use predownloaded apartment data instead of scraping fresh data."""
+    predownload_or_not = input(
+        "It may take around 15 minutes to scrape fresh apartment data.\n"
+        "Do you want to use predownloaded apartment data instead? (y/n): "
+    ).strip().lower()
+    return predownload_or_not == "y"
+
+
+def scrape_apartment_data(pages_to_scrape=CRAWL_PAGES_PER_SEARCH, workers=CRAWL_WORKERS, rate=CRAWL_REQUESTS_PER_SECOND,
+                          incremental=CRAWL_INCREMENTAL, parse_workers=PARSE_WORKERS, markets=ZILLOW_MARKETS,
+                          bedrooms=CRAWL_BEDROOMS, processes=CRAWL_PROCESSES, use_predownloaded=None):
+    """
+    Scrapes apartment data from Zillow or loads predownloaded data based on user choice.
+    Every market and bedroom filter is searched for `pages_to_scrape` pages; with several shards they are
+    crawled by `processes` worker processes (see `crawl_shards`).
+    In incremental mode only new or changed listings are fetched; the result is saved as the raw stage.
+    :param use_predownloaded: Answer to `ask_use_predownloaded`; asked here when None.
+    """
+    
+    # Ask user whether they want to use predownloaded data or scrape fresh data
+    if use_predownloaded is None:
+        use_predownloaded = ask_use_predownloaded()
+
+    if use_predownloaded and os.path.exists(PREDOWNLOAD_APARTMENT_DATA_PATH):
+        print("Loading predownloaded apartment data...")
+        apartment_df = pd.read_csv(PREDOWNLOAD_APARTMENT_DATA_PATH)
+        return apartment_df
+
+    print("Scraping fresh apartment data from Zillow...")
+    previous = load_previous_snapshot() if incremental else {}
+    shards = plan_shards(markets, bedrooms, pages_to_scrape)
+    if len(shards) > 1 and processes > 1:
+        apartment_data = crawl_shards(shards, processes, workers, rate, previous)
+    else:
+        apartment_data = crawl_single_process(shards, workers, rate, parse_workers, previous)
+
+    # Store the apartment data in a DataFrame and keep it as the snapshot for the next run
     df = pd.DataFrame(apartment_data)
+    storage.save_stage(df, 'raw')
     
     return df
 
+
+@profiled('apartments: crawl')
+def crawl_single_process(shards, workers, rate, parse_workers, previous):
+    """Crawl all shards in this process, parsing detail pages on a process pool."""
+    with FetchEngine(workers=workers, rate=rate, headers=headers, cache=ResponseCache()) as engine, \
+            ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context('forkserver')) as parser:
+        search_urls = [url for shard in shards for url in shard_urls(shard)]
+        apartment_data, seen_urls, failed_pages = crawl_listings(search_urls, engine, parser, previous)
+    apartment_data, _, _, duplicates = merge_shards([(apartment_data, seen_urls, failed_pages)])
+    print(f"{len(apartment_data)} listings crawled; {duplicates} duplicates dropped.")
+    return mark_removed(apartment_data, previous, seen_urls, failed_pages)
+
 if __name__ == '__main__':
   # Call the function to scrape and save the data
   apartment_df = scrape_apartment_data()
@@ -0,0 +1,564 @@
+#%%
+# File: benchmark.py
+# Group members: rivenl, leylal, chengkac, bangminp
+
+# This file holds micro-benchmarks for the slow parts of the pipeline. Every benchmark builds its own
+# synthetic NYC-shaped data (see `synthetic_data.py`), so nothing has to be downloaded before running it.
+# Run all benchmarks with `python benchmark.py`, or a single one with `python benchmark.py <name>`.
+# The `pipeline` benchmark runs processing, merging and filtering on generated data at several scales:
+# end to end on a first run, each stage alone, and end to end again with warm caches. Time and peak memory
+# per stage are appended to `BENCHMARK_RESULTS_PATH` and compared with a stored baseline, so a regression
+# in any stage is caught:
+#   python benchmark.py pipeline --scales 10k,100k,1m [--save-baseline]
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+import requests
+from config import (SERVICE_P99_TARGET_MS, BENCHMARK_SCALES, BENCHMARK_RESULTS_PATH, BENCHMARK_BASELINE_PATH,
+                    BENCHMARK_TOLERANCE)
+from spatial_index import GridIndex
+from facility_features import FacilityCounts
+import apartment_crawler
+import processing_zillow
+import storage
+from filter_engine import FilterEngine
+from ranking import Ranker, top_k
+import service
+import dedup
+import merger
+import data_filter
+import interactive_page
+import profiling
+import synthetic_data
+from synthetic_data import (FACTYPES, synthetic_points, synthetic_detail_page, synthetic_search_page,
+                            synthetic_raw, synthetic_merged)
+
+def timed(func, *args, **kwargs):
+    """Run `func` once and return (result, elapsed seconds)."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def pivot_facility_counts(apartments, facilities):
+    """The original borough cross-join followed by a pivot table, kept here as the reference path."""
+    merged = pd.merge(apartments, facilities, on='BORO', how='left')
+    return pd.pivot_table(merged, index=['ADDRESS'], columns='FACTYPE', aggfunc='size', fill_value=0)
+
+
+def benchmark_facility_counts(sizes=(1000, 5000, 20000), n_facilities=5000, radius=1000):
+    """Compare the borough cross-join + pivot path with the exact grid index radius query used by the merge."""
+    facilities = synthetic_points(n_facilities, seed=1)
+    facilities['FACTYPE'] = np.random.default_rng(2).choice(FACTYPES, n_facilities)
+
+    print(f"Facility counts ({n_facilities} facilities, radius {radius} m)")
+    counts, index_seconds = timed(FacilityCounts, facilities['LATITUDE'], facilities['LONGITUDE'],
+                                  facilities['FACTYPE'], radii=[radius])
+    print(f"Grid index built once in {index_seconds:.3f} s")
+    print(f"{'apartments':>12} {'pivot (s)':>12} {'grid (s)':>12} {'speedup':>10}")
+    for n in sizes:
+        apartments = synthetic_points(n, seed=3)
+        apartments['ADDRESS'] = [f"{i} Main St" for i in range(n)]
+
+        _, pivot_seconds = timed(pivot_facility_counts, apartments, facilities[['BORO', 'FACTYPE']])
+        _, grid_seconds = timed(counts.count_within, apartments['LATITUDE'], apartments['LONGITUDE'], radius)
+        print(f"{n:>12} {pivot_seconds:>12.3f} {grid_seconds:>12.4f} {pivot_seconds / grid_seconds:>9.1f}x")
+
+
+def benchmark_detail_parsing(fixture_dir=None, n_pages=50):
+    """
+    Per-page cost of extracting a detail page with a full parse versus the filtered parse.
+    Pass a directory of saved detail pages (*.html) to measure real pages instead of synthetic ones.
+    """
+    if fixture_dir:
+        pages = [open(path, encoding='utf-8').read() for path in sorted(glob.glob(os.path.join(fixture_dir, '*.html')))]
+    else:
+        pages = [synthetic_detail_page(i) for i in range(n_pages)]
+
+    full_results, full_seconds = timed(lambda: [apartment_crawler.parse_apartment_page(page, parse_only=None) for page in pages])
+    filtered_results, filtered_seconds = timed(lambda: [apartment_crawler.parse_apartment_page(page) for page in pages])
+
+    print(f"Detail page extraction ({len(pages)} pages)")
+    print(f"{'full parse':>16}: {1000 * full_seconds / len(pages):8.2f} ms/page")
+    print(f"{'filtered parse':>16}: {1000 * filtered_seconds / len(pages):8.2f} ms/page")
+    print(f"{'identical output':>16}: {full_results == filtered_results}")
+
+
+def stand_in_server(cards_per_page=10, shared_every=5, latency=0.05):
+    """
+    Local stand-in for the Zillow search and detail pages, answering every request after `latency` seconds.
+    Every `shared_every`-th card of a page shows a listing that also appears under the other bedroom filters
+    of the market, so the crawl has duplicates to drop.
+    :return: The running server; its URL is `http://host:port`.
+    """
+    bedrooms = list(apartment_crawler.ZILLOW_BEDROOM_PATHS.values())
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            parts = [part for part in self.path.split('/') if part]
+            base_url = f"http://{self.headers['Host']}"
+            if parts[0] == 'homedetails':
+                body = synthetic_detail_page(int(parts[1]), filler_blocks=20)
+            else:  # /<market>/apartments/<bedrooms>/[<page>_p/]
+                market, bedroom = parts[0], bedrooms.index(parts[2] + '/')
+                page = int(parts[3][:-2]) if len(parts) > 3 else 1
+                first = (zlib.crc32(market.encode()) % 1000 * 1000 + page * 100) * len(bedrooms)
+                body = synthetic_search_page(base_url, [
+                    first + k if k % shared_every == 0 else first + (bedroom + 1) * cards_per_page + k
+                    for k in range(cards_per_page)])
+            data = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('ETag', f'"{zlib.crc32(data):08x}"')
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def benchmark_crawl(process_counts=(1, 2, 4), markets=('new-york-ny', 'jersey-city-nj'), pages=6, rate=200.0):
+    """
+    Sharded crawl of a local stand-in server with 1, 2 and 4 worker processes. The request rate budget
+    `rate` is shared by all worker processes, so the speedup shows how well the shards spread the latency.
+    """
+    server = stand_in_server()
+    base_url = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    shards = apartment_crawler.plan_shards(list(markets), list(apartment_crawler.ZILLOW_BEDROOM_PATHS), pages,
+                                           pages_per_shard=2)
+
+    print(f"Sharded crawl ({len(shards)} shards, {len(markets)} markets, {pages} pages per search, "
+          f"rate budget {rate:.0f}/s)")
+    baseline = None
+    for processes in process_counts:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            rows, seconds = timed(apartment_crawler.crawl_shards, shards, processes, workers=4, rate=rate,
+                                  base_url=base_url, cache_dir=cache_dir)
+        baseline = baseline or seconds
+        urls = [row['Listing URL'] for row in rows]
+        print(f"{processes:>3} processes: {seconds:6.2f} s  ({baseline / seconds:.1f}x)  {len(rows)} listings, "
+              f"unique {len(set(urls)) == len(urls)}")
+    server.shutdown()
+
+
+def apply_process_apartment_data(df):
+    """The original row-by-row processing (`Series.apply` and `DataFrame.apply`), kept here as the reference path."""
+    df = df.dropna(subset=['Address'])
+    df['ZIP Code'] = df['Address'].str[-5:]
+    df['City'] = df['Address'].str.split(',').str[1].str.strip()
+
+    def find_borough(zip_code):
+        try:
+            zip_code = int(zip_code)
+            for borough, zip_range in processing_zillow.boroughs.items():
+                if zip_code in zip_range:
+                    return borough
+        except ValueError:
+            return "Unknown"
+        return "Unknown"
+
+    df['BORO'] = df['ZIP Code'].apply(find_borough)
+
+    def calculate_average_rent(rent):
+        if pd.isna(rent) or not isinstance(rent, str):
+            return None
+        rent_range = rent.replace('$', '').replace('/mo', '').replace(',', '').replace('+', '').split('-')
+        try:
+            if len(rent_range) == 2:
+                return (int(rent_range[0].strip()) + int(rent_range[1].strip())) / 2
+            elif len(rent_range) == 1:
+                return int(rent_range[0].strip())
+        except ValueError:
+            return None
+        return None
+
+    df['Average Rent'] = df['Rent'].apply(calculate_average_rent)
+
+    def process_pet_policy(row):
+        if 'Allowed' in str(row['Dogs Policy']) or 'Allowed' in str(row['Cats Policy']) or 'Allowed' in str(row['Large Dogs Policy']) or 'Allowed' in str(row['Small Dogs Policy']):
+            return 'Allowed'
+        elif 'Yes' in str(row['Pets Allowed']):
+            return 'Allowed'
+        elif 'Not allowed' in str(row['Dogs Policy']) or 'Not allowed' in str(row['Cats Policy']) or 'Not allowed' in str(row['Large Dogs Policy']) or 'Not allowed' in str(row['Small Dogs Policy']):
+            return 'Not Allowed'
+        elif 'No' in str(row['Pets Allowed']):
+            return 'Not Allowed'
+        else:
+            return 'N/A'
+
+    df['If_Pets_Allowed'] = df.apply(process_pet_policy, axis=1)
+    return df.drop(columns=['Dogs Policy', 'Cats Policy', 'Large Dogs Policy', 'Small Dogs Policy', 'Pets Allowed'])
+
+
+def benchmark_processing(sizes=(100_000, 1_000_000)):
+    """Row-by-row `apply` processing versus the vectorized `processing_zillow.process_apartment_data`."""
+    print("Apartment processing")
+    print(f"{'listings':>10} {'apply (s)':>10} {'vectorized (s)':>15} {'speedup':>8} {'identical':>10}")
+    for n in sizes:
+        raw = synthetic_raw(n)
+        expected, apply_seconds = timed(apply_process_apartment_data, raw)
+        result, vectorized_seconds = timed(processing_zillow.process_apartment_data, raw)
+        identical = expected.equals(result.drop(columns=['Min Rent', 'Max Rent']))
+        print(f"{n:>10} {apply_seconds:>10.2f} {vectorized_seconds:>15.2f} {apply_seconds / vectorized_seconds:>7.1f}x "
+              f"{str(identical):>10}")
+
+
+def benchmark_storage(n=1_000_000):
+    """File size and load time of the merged stage as CSV versus typed Parquet, with and without projection."""
+    df = storage.apply_schema(synthetic_merged(n), 'merged')
+    projection = ['BORO', 'AVERAGE RENT', 'IF_PETS_ALLOWED', 'Safety_level']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'merged.csv')
+        parquet_path = os.path.join(tmp, 'merged.parquet')
+        df.to_csv(csv_path, index=False)
+        df.to_parquet(parquet_path, index=False, compression=storage.STAGE_COMPRESSION)
+
+        def load_csv():
+            loaded = pd.read_csv(csv_path)
+            loaded['AVERAGE RENT'] = pd.to_numeric(loaded['AVERAGE RENT'], errors='coerce')
+            return loaded
+
+        _, csv_seconds = timed(load_csv)
+        _, csv_projected_seconds = timed(pd.read_csv, csv_path, usecols=projection)
+        _, parquet_seconds = timed(pd.read_parquet, parquet_path)
+        _, parquet_projected_seconds = timed(pd.read_parquet, parquet_path, columns=projection)
+
+        print(f"Merged stage storage ({n} listings)")
+        print(f"{'format':>10} {'size (MB)':>10} {'load (s)':>10} {'4 cols (s)':>11}")
+        print(f"{'CSV':>10} {os.path.getsize(csv_path) / 1e6:>10.1f} {csv_seconds:>10.2f} {csv_projected_seconds:>11.2f}")
+        print(f"{'Parquet':>10} {os.path.getsize(parquet_path) / 1e6:>10.1f} {parquet_seconds:>10.2f} {parquet_projected_seconds:>11.2f}")
+
+
+def query_string_filter(df, query_params):
+    """The original filter path: build a query string and evaluate it with the python engine."""
+    query_string = " & ".join(
+        [
+            f"`{col}` {op} '{vals[0]}'" if isinstance(vals[0], str) else f"`{col}` {op} {vals[0]}"
+            if len(vals) == 1 else f"(`{col}` >= {vals[0]} & `{col}` <= {vals[1]})"
+            for col, condition in query_params.items() if condition is not None
+            for op, *vals in [condition]
+        ]
+    )
+    return df.query(query_string, engine='python') if query_string else df
+
+
+SAMPLE_QUERIES = [
+    {'AVERAGE RENT': ('between', 2000, 2800), 'IF_PETS_ALLOWED': ('==', 'Allowed'), 'Safety_level': ('==', 'Very Safe')},
+    {'BORO': ('==', 'BROOKLYN'), 'AVERAGE RENT': ('<', 2000)},
+    {'BORO': ('==', 'MANHATTAN'), 'AVERAGE RENT': ('>', 4400), 'IF_PETS_ALLOWED': ('==', 'Not Allowed')},
+    {'Safety_level': ('==', 'Caution Advised')},
+]
+
+
+def benchmark_filtering(sizes=(100_000, 1_000_000, 3_000_000)):
+    """Per-query latency of the query-string path versus the indexed filter engine."""
+    print("Filtering (average over sample queries)")
+    print(f"{'listings':>10} {'query str (ms)':>15} {'engine (ms)':>12} {'build (s)':>10} {'same rows':>10}")
+    for n in sizes:
+        df = storage.apply_schema(synthetic_merged(n), 'merged')
+        engine, build_seconds = timed(FilterEngine, df)
+
+        string_seconds = engine_seconds = 0.0
+        same = True
+        for query_params in SAMPLE_QUERIES:
+            expected, seconds = timed(query_string_filter, df, query_params)
+            string_seconds += seconds
+            row_ids, seconds = timed(engine.match, query_params)
+            engine_seconds += seconds
+            same &= np.array_equal(row_ids, np.flatnonzero(df.index.isin(expected.index)))
+
+        n_queries = len(SAMPLE_QUERIES)
+        print(f"{n:>10} {1000 * string_seconds / n_queries:>15.2f} {1000 * engine_seconds / n_queries:>12.3f} "
+              f"{build_seconds:>10.2f} {str(same):>10}")
+
+
+def random_preference_sets(n, seed=0):
+    """`n` preference sets drawn from the `interactive_page` options, as saved searches would be."""
+    rng = np.random.default_rng(seed)
+    options = [interactive_page.borough_options, interactive_page.price_range_options,
+               interactive_page.pet_policy_options, interactive_page.crime_options]
+    choices = [rng.integers(0, len(values), n) for values in options]
+    return [interactive_page.build_query_params(*(values[choice[i]] for values, choice in zip(options[:3], choices[:3])),
+                                                crime_level=options[3][choices[3][i]])
+            for i in range(n)]
+
+
+def benchmark_batch_filtering(n=1_000_000, batch_sizes=(10, 100, 1000, 10_000), k=20):
+    """Many preference sets answered by separate `match` calls versus one `match_batch` call."""
+    engine = FilterEngine(storage.apply_schema(synthetic_merged(n), 'merged'))
+    print(f"Batch filtering ({n} listings)")
+    print(f"{'queries':>8} {'separate (s)':>13} {'batch (s)':>10} {'speedup':>8} {f'top {k} (s)':>11} {'same rows':>10}")
+    for size in batch_sizes:
+        queries = [query_params for query_params, _ in random_preference_sets(size)]
+        separate, separate_seconds = timed(lambda: [engine.match(query_params) for query_params in queries])
+        batch, batch_seconds = timed(engine.match_batch, queries)
+        _, top_seconds = timed(engine.match_batch, queries, k)
+        same = all(np.array_equal(a, b) for a, b in zip(separate, batch))
+        print(f"{size:>8} {separate_seconds:>13.3f} {batch_seconds:>10.3f} {separate_seconds / batch_seconds:>7.1f}x "
+              f"{top_seconds:>11.3f} {str(same):>10}")
+
+
+def benchmark_ranking(sizes=(100_000, 1_000_000, 3_000_000), k=20):
+    """Per-query cost of scoring, and of selecting the top k with argpartition versus a full sort."""
+    print(f"Ranking top {k} (average over sample queries)")
+    print(f"{'listings':>10} {'score (ms)':>11} {'sort (ms)':>10} {'top-k (ms)':>11} {'ns/listing':>11} {'same top':>9}")
+    for n in sizes:
+        ranker = Ranker(storage.apply_schema(synthetic_merged(n), 'merged'))
+
+        score_seconds = sort_seconds = select_seconds = 0.0
+        same = True
+        for query_params in SAMPLE_QUERIES:
+            scores, seconds = timed(ranker.scores, query_params)
+            score_seconds += seconds
+            by_sort, seconds = timed(lambda: np.argsort(-scores, kind='stable')[:k])
+            sort_seconds += seconds
+            by_partition, seconds = timed(top_k, scores, k)
+            select_seconds += seconds
+            same &= np.array_equal(scores[by_sort], scores[by_partition])
+
+        n_queries = len(SAMPLE_QUERIES)
+        total_seconds = (score_seconds + select_seconds) / n_queries
+        print(f"{n:>10} {1000 * score_seconds / n_queries:>11.2f} {1000 * sort_seconds / n_queries:>10.2f} "
+              f"{1000 * select_seconds / n_queries:>11.2f} {1e9 * total_seconds / n:>11.1f} {str(same):>9}")
+
+
+SERVICE_REQUESTS = [
+    {'boro': 'BROOKLYN', 'price': '2000-2800', 'pets': 'Yes', 'mode': 'rank'},
+    {'price': '> 4400', 'crime': 'Very Safe', 'facilities': 'MUSEUM,BUS STATION', 'mode': 'rank'},
+    {'boro': 'QUEENS', 'pets': 'No', 'mode': 'filter'},
+    {'boro': 'MANHATTAN', 'price': '3600-4400', 'crime': 'Relatively Safe', 'mode': 'filter'},
+]
+
+
+def benchmark_service(n=200_000, n_requests=2000, clients=4):
+    """
+    Load test of the recommendation service: concurrent clients against a local server, with a data
+    refresh swapped in halfway through. Reports latency percentiles against `SERVICE_P99_TARGET_MS`.
+    """
+    versions = {'current': 1}
+    datasets = {1: synthetic_merged(n, seed=1), 2: synthetic_merged(n, seed=2)}
+    recommender = service.RecommendationService(load=lambda: datasets[versions['current']],
+                                                version=lambda: versions['current'])
+    server = service.make_server(recommender, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://{server.server_address[0]}:{server.server_address[1]}/recommendations"
+
+    local = threading.local()
+
+    def send(i):
+        if i == n_requests // 2:
+            versions['current'] = 2
+            recommender.refresh_in_background()
+        local.session = getattr(local, 'session', None) or requests.Session()
+        start = time.perf_counter()
+        response = local.session.get(url, params=SERVICE_REQUESTS[i % len(SERVICE_REQUESTS)])
+        elapsed = time.perf_counter() - start
+        return elapsed, response.status_code, response.json()['version']
+
+    with ThreadPoolExecutor(clients) as pool:
+        results, total_seconds = timed(lambda: list(pool.map(send, range(n_requests))))
+    server.shutdown()
+
+    latencies = 1000 * np.array([elapsed for elapsed, _, _ in results])
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    print(f"Recommendation service ({n} listings, {clients} clients, {n_requests} requests)")
+    print(f"{'throughput':>14}: {n_requests / total_seconds:.0f} requests/s")
+    print(f"{'latency (ms)':>14}: p50 {p50:.1f}  p95 {p95:.1f}  p99 {p99:.1f}  max {latencies.max():.1f}")
+    print(f"{'p99 target':>14}: {SERVICE_P99_TARGET_MS} ms -> {'met' if p99 <= SERVICE_P99_TARGET_MS else 'MISSED'}")
+    print(f"{'errors':>14}: {sum(status != 200 for _, status, _ in results)}")
+    print(f"{'versions seen':>14}: {sorted({version for _, _, version in results})}")
+
+
+def run_pipeline_stages(n, seed=0):
+    """
+    Process, merge and filter `n` synthetic listings below the current directory. 'end to end' runs all
+    stages in a fresh directory, with no cache or index built yet, as a first run does. Then, in another
+    fresh directory, every stage runs alone on the output of the one before, and finally all of them again
+    as 'end to end (warm caches)', with the geocoder, facility and crime caches and the listing index
+    already filled, as in a repeated run.
+    :return: The run profile with one stage per step.
+    """
+    raw = synthetic_data.synthetic_raw(n, seed)
+    run = profiling.start_run(f'benchmark-{n}')
+
+    def process():
+        with profiling.stage('process', rows_in=len(raw)) as record:
+            processed = processing_zillow.process_apartment_data(raw)
+            record.rows_out = len(processed)
+        with profiling.stage('deduplicate', rows_in=len(processed)) as record:
+            processed = dedup.deduplicate_listings(processed)
+            record.rows_out = len(processed)
+        with profiling.stage('save processed', rows_in=len(processed)):
+            storage.save_stage(processed, 'processed')
+
+    def merge():
+        with profiling.stage('merge'):
+            merger.merge_datasets_with_pivot()
+
+    def filter_listings():
+        with profiling.stage('filter') as record:
+            matches = [data_filter.filter_dataframe(query_params, []) for query_params in SAMPLE_QUERIES]
+            record.rows_out = sum(len(matched) for matched in matches)
+
+    def end_to_end(name):
+        with profiling.stage(name, rows_in=len(raw)):
+            for step in [process, merge, filter_listings]:
+                step()
+
+    cwd = os.getcwd()
+    for workdir, steps in [('end_to_end', [lambda: end_to_end('end to end')]),
+                           ('stages', [process, merge, filter_listings,
+                                       lambda: end_to_end('end to end (warm caches)')])]:
+        os.makedirs(workdir)
+        os.chdir(workdir)
+        try:
+            synthetic_data.write_sources(seed=seed)
+            for step in steps:
+                step()
+        finally:
+            os.chdir(cwd)
+    return run
+
+
+def parse_scale(text):
+    """'10k', '1m' or '10000' -> number of listings."""
+    text = text.strip().lower()
+    factor = {'k': 1_000, 'm': 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip('km')) * factor)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare_with_baseline(results, baseline, tolerance=BENCHMARK_TOLERANCE):
+    """
+    Print every stage against the baseline of the same scale.
+    :return: List of regressions, as (scale, stage, measure, ratio).
+    """
+    regressions = []
+    print(f"{'scale':>10} {'stage':<28} {'wall (s)':>9} {'baseline':>9} {'ratio':>6} {'peak MB':>8} {'baseline':>9} {'ratio':>6}")
+    for scale, stages in results.items():
+        for name, measured in stages.items():
+            base = baseline.get(str(scale), {}).get(name)
+            ratios = {}
+            for measure in ['wall_seconds', 'peak_rss_mb']:
+                if base and base.get(measure) and measured.get(measure) is not None:
+                    ratios[measure] = measured[measure] / base[measure]
+                    # Stages of a few milliseconds jitter by more than the tolerance, so they need a real slowdown
+                    slower = measure != 'wall_seconds' or measured[measure] - base[measure] > 0.05
+                    if ratios[measure] > tolerance and slower:
+                        regressions.append((scale, name, measure, ratios[measure]))
+            base = base or {}
+            print(f"{scale:>10} {name:<28} {measured['wall_seconds']:>9.2f} {_format(base.get('wall_seconds'), '.2f'):>9} "
+                  f"{_format(ratios.get('wall_seconds'), '.2f'):>6} {_format(measured['peak_rss_mb'], '.0f'):>8} "
+                  f"{_format(base.get('peak_rss_mb'), '.0f'):>9} {_format(ratios.get('peak_rss_mb'), '.2f'):>6}")
+    return regressions
+
+
+def _format(value, spec):
+    return '-' if value is None else format(value, spec)
+
+
+def benchmark_pipeline(scales=BENCHMARK_SCALES, save_baseline=False, results_path=BENCHMARK_RESULTS_PATH,
+                       baseline_path=BENCHMARK_BASELINE_PATH):
+    """
+    Time and peak memory of every pipeline stage at each scale, appended to the results file and compared
+    with the baseline. Each scale runs in a fresh temporary directory.
+    :param save_baseline: Store these results as the new baseline (for the scales measured).
+    :return: List of regressions against the baseline.
+    """
+    results_path, baseline_path = os.path.abspath(results_path), os.path.abspath(baseline_path)
+    results = {}
+    cwd = os.getcwd()
+    for n in scales:
+        print(f"Pipeline benchmark with {n} listings...")
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            try:
+                run = run_pipeline_stages(n)
+            finally:
+                os.chdir(cwd)
+        results[n] = {record.name: {'wall_seconds': record.wall_seconds, 'cpu_seconds': record.cpu_seconds,
+                                    'peak_rss_mb': record.peak_rss_mb, 'rows_in': record.rows_in,
+                                    'rows_out': record.rows_out}
+                      for record in run.records if record.depth == 0}
+
+    os.makedirs(os.path.dirname(results_path), exist_ok=True)
+    with open(results_path, 'a') as f:
+        f.write(json.dumps({'started': profiling.current_run().stamp, 'commit': git_commit(),
+                            'python': sys.version.split()[0], 'results': results}) + '\n')
+
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+    print(f"\nPipeline benchmark (results appended to {results_path})")
+    regressions = compare_with_baseline(results, baseline)
+    for scale, stage, measure, ratio in regressions:
+        print(f"REGRESSION: {stage} at {scale} listings, {measure} {ratio:.2f}x the baseline")
+
+    if save_baseline:
+        baseline.update({str(scale): stages for scale, stages in results.items()})
+        with open(baseline_path, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Baseline saved to {baseline_path}")
+    return regressions
+
+
+BENCHMARKS = {
+    'facility_counts': benchmark_facility_counts,
+    'detail_parsing': benchmark_detail_parsing,
+    'crawl': benchmark_crawl,
+    'processing': benchmark_processing,
+    'storage': benchmark_storage,
+    'filtering': benchmark_filtering,
+    'batch_filtering': benchmark_batch_filtering,
+    'ranking': benchmark_ranking,
+    'service': benchmark_service,
+    'pipeline': benchmark_pipeline,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run benchmarks on synthetic data.")
+    parser.add_argument('names', nargs='*', help=f"Benchmarks to run (default: all): {', '.join(BENCHMARKS)}")
+    parser.add_argument('--scales', help="Pipeline benchmark scales, e.g. 10k,100k,1m,10m")
+    parser.add_argument('--save-baseline', action='store_true', help="Store the pipeline results as the baseline")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks {unknown}; choose from {list(BENCHMARKS)}")
+
+    regressions = []
+    for name in args.names or list(BENCHMARKS):
+        if name == 'pipeline':
+            scales = [parse_scale(scale) for scale in args.scales.split(',')] if args.scales else BENCHMARK_SCALES
+            regressions = benchmark_pipeline(scales, args.save_baseline)
+        else:
+            BENCHMARKS[name]()
+        print()
+    sys.exit(1 if regressions else 0)
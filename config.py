@@ -15,7 +15,7 @@ FACILITIES_FILE_NAME = 'facilities_24v1.csv'
 APARTMENT_DATA_FILE = 'apartment_data_raw.csv'
 PREDOWNLOAD_APARTMENT_DATA_FILE = '[predownload]apartment_data_raw.csv'
 PROCESSED_APARTMENT_DATA_FILE = 'apartment_data_processed.csv'
-SHOOTING_FILE_NAME = "shooting_data.csv"
+SHOOTING_FILE_NAME = "shooting_data.parquet"  # Directory of Parquet parts
 COMPLAINT_FILE_NAME = "complaint_data.csv"
 MERGED_DATA = 'final_grouped_apartment_data_with_pivot.csv'
 
@@ -24,5 +24,104 @@ APARTMENT_DATA_PATH = os.path.join(DOWNLOAD_DIR, APARTMENT_DATA_FILE)
 PREDOWNLOAD_APARTMENT_DATA_PATH= os.path.join(DOWNLOAD_DIR, PREDOWNLOAD_APARTMENT_DATA_FILE)
 PROCESSED_APARTMENT_DATA_PATH = os.path.join(DOWNLOAD_DIR, PROCESSED_APARTMENT_DATA_FILE) 
 FACILITIES_DATA_PATH = os.path.join(FACILITIES_EXTRACT_DIR, FACILITIES_FILE_NAME)
+FACILITIES_TABLE_PATH = os.path.join(PROCESSED_DIR, 'facilities.parquet')  # Compact table built from the archive
+FACILITIES_MANIFEST_PATH = os.path.join(DOWNLOAD_DIR, 'facilities.manifest.json')  # Checksums of archive and table
 SHOOTING_DATA_PATH = os.path.join(DOWNLOAD_DIR, SHOOTING_FILE_NAME)
 MERGED_DATA_PATH = os.path.join(PROCESSED_DIR, MERGED_DATA)
+
+# Facility catalog (see facility_catalog.py): what is counted around each apartment, one column per entry.
+FACILITY_TYPES = ['BUS STATION', 'MUSEUM', 'COMMERCIAL GARAGE AND PARKING LOT', 'PUBLIC LIBRARY']  # FACTYPE values, or '*' for all
+FACILITY_GROUPS = []  # FACGROUP values (every facility of the group), or '*' for all
+FACILITY_CATALOG_PATH = os.path.join(PROCESSED_DIR, 'facility_catalog.json')
+
+# Facility proximity settings (see facility_features.py)
+FACILITY_RADIUS_METERS = 1000  # Radius of the plain facility count columns
+FACILITY_RADII_METERS = [500, 1000, 2000]  # Radii counted around each apartment; must include the one above
+
+# Crime density surface settings
+CRIME_SURFACE_PATH = os.path.join(PROCESSED_DIR, 'crime_surface.npz')
+CRIME_CELL_METERS = 100  # Grid cell edge length
+CRIME_BANDWIDTH_METERS = 300  # Gaussian smoothing bandwidth
+
+# Apartment crawler settings
+ZILLOW_BASE_URL = 'https://www.zillow.com'
+ZILLOW_SEARCH_PATH = '/{market}/apartments/{bedrooms}'
+ZILLOW_MARKETS = ['new-york-ny']  # Search areas, as they appear in the search URL
+ZILLOW_BEDROOM_PATHS = {'studio': 'studios/', '1': '1-bedrooms/', '2': '2-bedrooms/', '3': '3-bedrooms/'}
+CRAWL_BEDROOMS = ['1']  # Bedroom filters searched in every market (keys of ZILLOW_BEDROOM_PATHS)
+CRAWL_PAGES_PER_SEARCH = 20  # Search-result pages crawled per market and bedroom filter
+CRAWL_PAGES_PER_SHARD = 5  # Search-result pages in one unit of work of the sharded crawl
+CRAWL_PROCESSES = min(4, os.cpu_count() or 1)  # Worker processes of the sharded crawl
+CRAWL_WORKERS = 4  # Concurrent fetch threads
+CRAWL_REQUESTS_PER_SECOND = 1.0  # Allowed request rate per host
+CRAWL_BURST = 2  # Requests a host may receive back to back
+CRAWL_REVALIDATIONS_PER_SECOND = 20.0  # Allowed rate per host of conditional requests for cached pages
+
+# HTTP response cache shared by the crawlers
+HTTP_CACHE_DIR = os.path.join(DOWNLOAD_DIR, 'http_cache')
+HTTP_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # 1 GB
+HTTP_CACHE_FLUSH_EVERY = 100  # Index updates kept in memory before index.json is rewritten
+CRAWL_INCREMENTAL = True  # Only fetch detail pages of new or changed listings
+PARSE_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # Processes parsing detail pages
+PARSE_QUEUE_SIZE = 32  # Detail pages being fetched or parsed at once
+
+# Shooting data download settings
+SOCRATA_DOMAIN = "data.cityofnewyork.us"
+SHOOTING_PAGE_SIZE = 50000  # Records per API request
+SHOOTING_STATE_PATH = os.path.join(DOWNLOAD_DIR, 'shooting_data.state.json')
+
+# Columnar storage for pipeline stages (see storage.py)
+STAGE_COMPRESSION = 'zstd'
+STAGE_PATHS = {
+    'raw': os.path.join(DOWNLOAD_DIR, 'apartment_data_raw.parquet'),
+    'processed': os.path.join(PROCESSED_DIR, 'apartment_data_processed.parquet'),
+    'merged': os.path.join(PROCESSED_DIR, 'final_grouped_apartment_data_with_pivot.parquet'),
+}
+CSV_EXPORT_PATHS = {
+    'raw': APARTMENT_DATA_PATH,
+    'processed': PROCESSED_APARTMENT_DATA_PATH,
+    'merged': MERGED_DATA_PATH,
+}
+CSV_EXPORT_STAGES = ['merged']  # Stages also written as CSV for people to open
+
+# Recommendation settings (see ranking.py)
+RECOMMENDATION_MODE = 'rank'  # 'rank' scores and keeps the best apartments, 'filter' keeps every exact match
+RANKING_TOP_K = 20  # Apartments returned in 'rank' mode
+RANKING_RENT_TOLERANCE = 1000  # Dollars outside the preferred range at which the rent score reaches 0
+RANKING_WEIGHTS = {
+    'rent': 3.0,
+    'boro': 2.0,
+    'pets': 2.0,
+    'safety': 1.5,
+    'facilities': 1.0,
+    'schools': 1.0,
+}
+
+# Recommendation service settings (see service.py)
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8000
+SERVICE_REFRESH_SECONDS = 60  # How often the merged stage is checked for a newer version
+SERVICE_MAX_RESULTS = 100  # Rows returned per request in 'filter' mode
+SERVICE_P99_TARGET_MS = 100  # p99 latency target (4 concurrent clients, 200k listings), checked by `python benchmark.py service`
+
+# Streaming pipeline settings (see streaming.py)
+PIPELINE_CHUNK_SIZE = 100_000  # Apartments processed at a time; also the row group size of stored stages
+
+# Geocoding cache (see geocoder.py)
+GEOCODE_CACHE_PATH = os.path.join(PROCESSED_DIR, 'geocode_cache.parquet')
+
+# Rent history (see rent_history.py)
+RENT_HISTORY_DIR = os.path.join(PROCESSED_DIR, 'rent_history')  # Snapshots by crawl date and borough, and rollups
+
+# Listing deduplication (see dedup.py)
+LISTING_INDEX_PATH = os.path.join(PROCESSED_DIR, 'listing_index.parquet')  # Listing key hashes seen by earlier runs
+
+# Pipeline profiling (see profiling.py)
+PROFILE_REPORT_DIR = os.path.join(PROCESSED_DIR, 'profiles')  # JSON run reports (and cProfile dumps)
+PROFILE_CPROFILE = False  # Also dump cProfile statistics for every top-level stage
+
+# Pipeline benchmark (see benchmark.py and synthetic_data.py)
+BENCHMARK_SCALES = [10_000, 100_000, 1_000_000]  # Synthetic listings per run; pass --scales 10m for more
+BENCHMARK_RESULTS_PATH = os.path.join(PROCESSED_DIR, 'benchmarks', 'results.jsonl')  # One line per benchmark run
+BENCHMARK_BASELINE_PATH = os.path.join(PROCESSED_DIR, 'benchmarks', 'baseline.json')
+BENCHMARK_TOLERANCE = 1.25  # A stage slower or larger than this multiple of the baseline is a regression
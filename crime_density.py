@@ -0,0 +1,133 @@
+#%%
+# File: crime_density.py
+# Group members: rivenl, leylal, chengkac, bangminp
+
+# This file turns the shooting incidents downloaded by `shooting_crawler.py` into a crime density surface.
+# Incidents are binned once into a fixed grid over NYC and smoothed with a Gaussian kernel, giving the
+# number of incidents per square kilometer around every cell. The surface is cached on disk together with
+# a signature of the source files, so it is only rebuilt when the shooting data changes.
+# Scoring an apartment is then a single array lookup, done for all apartments at once with NumPy, and the
+# score is mapped to the `Safety_level` labels used by `interactive_page.py`.
+# It imports the paths and grid settings from `config.py` and the projection from `spatial_index.py`.
+
+import json
+import os
+import numpy as np
+import pandas as pd
+from config import SHOOTING_DATA_PATH, CRIME_SURFACE_PATH, CRIME_CELL_METERS, CRIME_BANDWIDTH_METERS
+from spatial_index import project_to_meters
+
+# Fixed grid extent (NYC bounding box) so cached surfaces always line up
+NYC_LAT_RANGE = (40.49, 40.92)
+NYC_LON_RANGE = (-74.27, -73.68)
+
+# Density quantiles (over cells that saw any incidents) separating the safety labels
+SAFETY_QUANTILES = [0.5, 0.85]
+SAFETY_LABELS = ['Very Safe', 'Relatively Safe', 'Caution Advised']
+
+
+def _smooth(grid, sigma_cells):
+    """Separable Gaussian blur of a 2-D array, truncated at three standard deviations."""
+    if sigma_cells <= 0:
+        return grid
+    radius = int(np.ceil(3 * sigma_cells))
+    offsets = np.arange(-radius, radius + 1)
+    weights = np.exp(-0.5 * (offsets / sigma_cells) ** 2)
+    weights /= weights.sum()
+
+    for axis in (0, 1):
+        padded = np.pad(grid, [(radius, radius) if a == axis else (0, 0) for a in (0, 1)])
+        length = grid.shape[axis]
+        grid = sum(w * np.take(padded, np.arange(length) + radius + k, axis=axis) for k, w in zip(offsets, weights))
+    return grid
+
+
+class CrimeSurface:
+    """
+    Smoothed incident density on a regular grid.
+
+    :param density: 2-D array of incidents per square kilometer, indexed [x cell, y cell].
+    :param origin: (x, y) in projected meters of the grid's lower-left corner.
+    :param cell_size: Cell edge length in meters.
+    :param thresholds: Density values separating the `SAFETY_LABELS`.
+    """
+
+    def __init__(self, density, origin, cell_size, thresholds):
+        self.density = density
+        self.origin = origin
+        self.cell_size = cell_size
+        self.thresholds = thresholds
+
+    @classmethod
+    def from_incidents(cls, lat, lon, cell_size=CRIME_CELL_METERS, bandwidth=CRIME_BANDWIDTH_METERS):
+        """Bin incident coordinates into the NYC grid and smooth them into a density surface."""
+        x_min, y_min = project_to_meters(NYC_LAT_RANGE[0], NYC_LON_RANGE[0])
+        x_max, y_max = project_to_meters(NYC_LAT_RANGE[1], NYC_LON_RANGE[1])
+        x_edges = np.arange(x_min, x_max + cell_size, cell_size)
+        y_edges = np.arange(y_min, y_max + cell_size, cell_size)
+
+        x, y = project_to_meters(lat, lon)
+        valid = np.isfinite(x) & np.isfinite(y)
+        counts, _, _ = np.histogram2d(x[valid], y[valid], bins=[x_edges, y_edges])
+
+        cell_area_km2 = (cell_size / 1000.0) ** 2
+        density = _smooth(counts, bandwidth / cell_size) / cell_area_km2
+
+        populated = density[density > 0]
+        thresholds = np.quantile(populated, SAFETY_QUANTILES) if len(populated) else np.zeros(len(SAFETY_QUANTILES))
+        return cls(density.astype(np.float32), (float(x_min), float(y_min)), float(cell_size), thresholds)
+
+    def score(self, lat, lon):
+        """Density at each point (incidents per km²); NaN for points without coordinates or outside NYC."""
+        x, y = project_to_meters(lat, lon)
+        ix = np.floor((x - self.origin[0]) / self.cell_size)
+        iy = np.floor((y - self.origin[1]) / self.cell_size)
+        inside = (np.isfinite(ix) & np.isfinite(iy) & (ix >= 0) & (iy >= 0)
+                  & (ix < self.density.shape[0]) & (iy < self.density.shape[1]))
+
+        scores = np.full(len(x), np.nan)
+        scores[inside] = self.density[ix[inside].astype(np.int64), iy[inside].astype(np.int64)]
+        return scores
+
+    def safety_level(self, scores):
+        """Map density scores to safety labels; points without a score are 'Unknown'."""
+        missing = np.isnan(scores)
+        levels = np.searchsorted(self.thresholds, np.where(missing, 0, scores), side='left')
+        return np.where(missing, 'Unknown', np.array(SAFETY_LABELS, dtype=object)[levels])
+
+    def save(self, path, signature):
+        np.savez(path, density=self.density, origin=np.array(self.origin), cell_size=self.cell_size,
+                 thresholds=self.thresholds, signature=json.dumps(signature))
+
+    @classmethod
+    def load(cls, path):
+        """Load a cached surface and return it with the signature it was built from."""
+        with np.load(path) as data:
+            surface = cls(data['density'], tuple(data['origin']), float(data['cell_size']), data['thresholds'])
+            return surface, json.loads(str(data['signature']))
+
+
+def source_signature(data_path=SHOOTING_DATA_PATH, cell_size=CRIME_CELL_METERS, bandwidth=CRIME_BANDWIDTH_METERS):
+    """Describe the shooting data files and surface settings; the cache is valid while this is unchanged."""
+    if os.path.isdir(data_path):
+        paths = sorted(os.path.join(data_path, name) for name in os.listdir(data_path))
+    else:
+        paths = [data_path]
+    files = [[os.path.basename(p), os.path.getsize(p), os.path.getmtime(p)] for p in paths if os.path.isfile(p)]
+    return {'files': files, 'cell_size': cell_size, 'bandwidth': bandwidth}
+
+
+def load_crime_surface(data_path=SHOOTING_DATA_PATH, cache_path=CRIME_SURFACE_PATH):
+    """Return the crime density surface, rebuilding and caching it only if the shooting data changed."""
+    signature = source_signature(data_path)
+    if os.path.exists(cache_path):
+        surface, cached_signature = CrimeSurface.load(cache_path)
+        if cached_signature == signature:
+            print("Loaded cached crime density surface.")
+            return surface
+
+    print("Building crime density surface from shooting data...")
+    incidents = pd.read_parquet(data_path, columns=['latitude', 'longitude'])
+    surface = CrimeSurface.from_incidents(incidents['latitude'], incidents['longitude'])
+    surface.save(cache_path, signature)
+    return surface
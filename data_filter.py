@@ -7,13 +7,46 @@
 # This file imports configuration settings from the `config.py` module and uses the 
 # `timestamp.py` module to generate a timestamped filename for the output.
 # The code dynamically filters the DataFrame rows and selected columns for facilities.
+# Filtering goes through a `filter_engine.FilterEngine` that is built once per merged dataset and reused
+# by every later call, so repeated queries do not reload or rescan the data.
+# `rank_dataframe` scores apartments against the same preferences (see `ranking.py`) and keeps only the
+# best `RANKING_TOP_K` instead of every exact match.
+# `filter_batch` answers many saved preference sets in one pass over the index (see `FilterEngine.match_batch`).
 
-import pandas as pd
 import os
 import sys
 sys.path.append('./')  # Add current directory to sys.path
 from config import *
 import timestamp as timestamp
+import storage
+from filter_engine import FilterEngine
+from ranking import Ranker
+
+
+# Filter engine and ranker over the merged stage, built on first use and rebuilt only when the stage file changes
+_engine = None
+_ranker = None
+_engine_mtime = None
+
+
+def get_filter_engine():
+    """Return the shared FilterEngine, loading the merged stage if it is new or has changed on disk."""
+    global _engine, _ranker, _engine_mtime
+    mtime = os.path.getmtime(STAGE_PATHS['merged'])
+    if _engine is None or mtime != _engine_mtime:
+        _engine = FilterEngine(storage.load_stage('merged'))
+        _ranker = None
+        _engine_mtime = mtime
+    return _engine
+
+
+def get_ranker():
+    """Return the shared Ranker over the same merged dataset as the filter engine."""
+    global _ranker
+    engine = get_filter_engine()
+    if _ranker is None:
+        _ranker = Ranker(engine.df)
+    return _ranker
 
 
 def filter_dataframe(query_params, facilities):
@@ -24,51 +57,55 @@ def filter_dataframe(query_params, facilities):
     :param facilities: List of selected facility column names for filtering columns.
     :return: Filtered DataFrame with only selected facility columns.
     """
-    file_path = os.path.join(PROCESSED_DIR, MERGED_DATA)
-    df = pd.read_csv(file_path)
-
-    # Make sure columns like 'Average Rent' are numeric
-    df['AVERAGE RENT'] = pd.to_numeric(df['AVERAGE RENT'], errors='coerce')
-
-    # Construct query string for row filtering based on query_params
-    query_string = " & ".join(
-        [
-            f"`{col}` {op} '{vals[0]}'" if isinstance(vals[0], str) else f"`{col}` {op} {vals[0]}"
-            if len(vals) == 1 else f"(`{col}` >= {vals[0]} & `{col}` <= {vals[1]})"
-            for col, condition in query_params.items() if condition is not None
-            for op, *vals in [condition]  # Unpack operator and value(s)
-        ]
-    )
-
-    # Print the generated query string for debugging
-    print(f"Generated query string: {query_string}")
-
-    # If there is a valid query string, apply it
-    if query_string:
-        try:
-            # Use the 'python' engine to bypass numexpr issues
-            filtered_df = df.query(query_string, engine='python')
-        except Exception as e:
-            print(f"Error applying query: {query_string}")
-            raise e
-    else:
-        filtered_df = df  # No filtering, keep all rows if no conditions were specified
-
-    # For Facilities, only keep the columns the user selected
-    if facilities:
-        # Ensure we don't lose the core columns (like Address, Rent, etc.)
-        base_columns = ['ADDRESS', 'APARTMENT NAME', 'AVERAGE RENT', 'ZIP CODE', 'CITY']
-        # Add facility columns to the base columns
-        selected_columns = base_columns + facilities
-        filtered_df = filtered_df[selected_columns]
+    engine = get_filter_engine()
+
+    # Print the active conditions for debugging
+    conditions = {col: condition for col, condition in query_params.items() if condition is not None}
+    print(f"Filter conditions: {conditions}")
+
+    # Row filtering uses the engine's indexes; for Facilities, only the selected columns are kept
+    filtered_df = engine.query(query_params, facilities)
 
-    print(f"Selected columns: {selected_columns}")
+    if facilities:
+        print(f"Selected columns: {list(filtered_df.columns)}")
     print(f"{len(filtered_df)} apartments match your preferences.")
     return filtered_df
 
-def to_csv_with_timestamp(filtered_df):
+
+def filter_batch(preference_sets, top_k=None):
+    """
+    Apply many users' preferences together, e.g. for a nightly alert job over saved searches.
+    :param preference_sets: List of (query_params, facilities) pairs, as returned by `collect_preferences`.
+    :param top_k: Keep only the `top_k` cheapest matches of each preference set.
+    :return: One filtered DataFrame per preference set, projected like `filter_dataframe`.
+    """
+    engine = get_filter_engine()
+    matches = engine.match_batch([query_params for query_params, _ in preference_sets], top_k)
+    results = [engine.query_rows(row_ids, facilities) for row_ids, (_, facilities) in zip(matches, preference_sets)]
+    print(f"{len(preference_sets)} preference sets filtered; {sum(len(result) for result in results)} matches in total.")
+    return results
+
+
+def rank_dataframe(query_params, facilities, top_k=RANKING_TOP_K):
+    """
+    Score every apartment against the preferences and keep the best ones.
+    :param query_params: Dictionary where keys are column names and values are preferred conditions.
+    :param facilities: List of selected facility column names; also used to score nearby facilities.
+    :param top_k: Number of apartments to return.
+    :return: The best `top_k` apartments, best first, with a 'SCORE' column.
+    """
+    ranker = get_ranker()
+    ranked_df = ranker.rank(query_params, facilities, top_k)
+    print(f"Top {len(ranked_df)} of {len(ranker)} apartments ranked by your preferences.")
+    return ranked_df
+
+def recommendation_path():
+    """Timestamped path of a new recommendation file."""
     stamp = timestamp.generate_timestamp()
-    file_path = f"{FINAL_DIR}/[{stamp}]recommendation_for_user.csv"
+    return f"{FINAL_DIR}/[{stamp}]recommendation_for_user.csv"
+
+def to_csv_with_timestamp(filtered_df):
+    file_path = recommendation_path()
     
     # The columns to keep for final output
     # keep_columns = ['Address','Apartment Name','Rent','Features','ZIP Code','City']
@@ -0,0 +1,138 @@
+#%%
+# File: dedup.py
+# Group members: rivenl, leylal, chengkac, bangminp
+
+# This file removes duplicate listings between processing and merging. The same building is often listed
+# several times, with spelling variants of its address ('1 Dutch Street' and '1 DUTCH ST APT 7A') or with the
+# address as the apartment name, and every duplicate is geocoded, counted, stored and ranked again.
+# Each address is canonicalized into a listing key: the street part normalized like the geocoder does it
+# (`geocoder.normalize_street`: case, unit suffixes, punctuation, ordinals, STREET -> ST) followed by the
+# 5-digit ZIP code. Keys are hashed to 64-bit integers, and duplicates are collapsed in one pass over a hash
+# table, keeping the most complete row of each listing.
+# A persistent index of key hashes records when every listing was first and last seen, and a hash of its
+# row, so each run reports how many listings are new, changed or unchanged since earlier runs, besides the
+# duplicate rate within the run. The index also spans the chunks of `streaming.py`.
+
+import os
+import time
+import numpy as np
+import pandas as pd
+from config import LISTING_INDEX_PATH
+from geocoder import normalize_street
+
+KEY_COLUMN = 'Listing Key'
+STATUSES = ['new', 'changed', 'unchanged']
+
+
+def listing_keys(df):
+    """Canonical 'NUMBER STREET ZIP' key of each listing, from its 'Address' ('street, city, state zip')."""
+    # Repeated address texts are normalized once
+    codes, addresses = pd.factorize(df['Address'].astype('str'))
+    addresses = pd.Series(addresses, dtype='str')
+    street = normalize_street(addresses.str.split(',', n=1).str[0])
+    zip_codes = addresses.str.extract(r'(\d{5})(?:-\d{4})?\s*$', expand=False).fillna('')
+    keys = (street + ' ' + zip_codes).str.strip()
+    return pd.Series(keys.to_numpy()[codes], index=df.index, dtype='str')
+
+
+def hash_keys(keys):
+    """64-bit hash of each key (the same text always gives the same hash)."""
+    return pd.util.hash_array(keys.to_numpy(dtype=object))
+
+
+def completeness(df):
+    """Filled fields per row, plus one for a real apartment name (not just the address)."""
+    named = df['Apartment Name'].astype('str') != df['Address'].astype('str') if 'Apartment Name' in df else False
+    return df.notna().sum(axis=1).to_numpy() + np.asarray(named, dtype=int)
+
+
+class ListingIndex:
+    """
+    Listings seen in this and earlier runs, by key hash.
+
+    :param path: Parquet file holding the index of earlier runs (KEY_HASH, ROW_HASH, FIRST_SEEN, LAST_SEEN).
+    """
+
+    def __init__(self, path=LISTING_INDEX_PATH):
+        self.path = path
+        if path and os.path.exists(path):
+            self.entries = pd.read_parquet(path).set_index('KEY_HASH')
+        else:
+            self.entries = pd.DataFrame({'ROW_HASH': pd.Series([], dtype='uint64'),
+                                         'FIRST_SEEN': pd.Series([], dtype='str'),
+                                         'LAST_SEEN': pd.Series([], dtype='str')},
+                                        index=pd.Index([], name='KEY_HASH', dtype='uint64'))
+        self.today = time.strftime('%Y-%m-%d')
+        self.run_keys = set()  # Key hashes kept so far in this run
+        self.kept = []  # (key hashes, row hashes) of kept listings, per batch
+        self.stats = {'rows': 0, 'duplicates': 0, **{status: 0 for status in STATUSES}}
+
+    def deduplicate(self, df):
+        """
+        Add the listing key to processed apartments and drop duplicates, within `df` and of listings already
+        kept in this run; the most complete row of each listing is kept, in the original order.
+        :param df: Processed apartment data (columns as written by `processing_zillow.py`).
+        :return: DataFrame with one row per listing and a `KEY_COLUMN` column.
+        """
+        df = df.assign(**{KEY_COLUMN: listing_keys(df)})
+        key_hashes = hash_keys(df[KEY_COLUMN])
+
+        # One pass over a hash table: factorize the key hashes, then take the most complete row of each code
+        codes, unique = pd.factorize(key_hashes)
+        best = pd.Series(completeness(df)).groupby(codes, sort=False).idxmax().to_numpy()
+        keep = np.zeros(len(df), dtype=bool)
+        keep[best] = True
+        if self.run_keys:
+            keep &= ~pd.Series(key_hashes).isin(self.run_keys).to_numpy()
+
+        deduplicated = df[keep]
+        kept_hashes = key_hashes[keep]
+        row_hashes = pd.util.hash_pandas_object(deduplicated, index=False).to_numpy()
+        self.run_keys.update(kept_hashes.tolist())
+        self.kept.append((kept_hashes, row_hashes))
+
+        # Compare with earlier runs
+        positions = self.entries.index.get_indexer(kept_hashes)
+        known = positions >= 0
+        unchanged = known.copy()
+        unchanged[known] = self.entries['ROW_HASH'].to_numpy()[positions[known]] == row_hashes[known]
+        self.stats['rows'] += len(df)
+        self.stats['duplicates'] += len(df) - len(deduplicated)
+        self.stats['new'] += int((~known).sum())
+        self.stats['changed'] += int((known & ~unchanged).sum())
+        self.stats['unchanged'] += int(unchanged.sum())
+        return deduplicated
+
+    def save(self):
+        """Record the listings kept in this run in the index file."""
+        if not self.path or not self.kept:
+            return
+        key_hashes = np.concatenate([keys for keys, _ in self.kept])
+        seen = pd.DataFrame({'ROW_HASH': np.concatenate([rows for _, rows in self.kept]),
+                             'FIRST_SEEN': self.today, 'LAST_SEEN': self.today},
+                            index=pd.Index(key_hashes, name='KEY_HASH'))
+        known = seen.index.isin(self.entries.index)
+        seen.loc[known, 'FIRST_SEEN'] = self.entries.loc[seen.index[known], 'FIRST_SEEN'].to_numpy()
+        entries = pd.concat([self.entries[~self.entries.index.isin(seen.index)], seen])
+
+        temp_path = self.path + '.tmp'
+        entries.reset_index().to_parquet(temp_path, index=False)
+        os.replace(temp_path, self.path)
+        self.entries = entries
+        self.kept = []
+
+    def report(self):
+        """Print the duplicate rate of this run and how many listings are new since earlier runs."""
+        stats = self.stats
+        rate = stats['duplicates'] / stats['rows'] if stats['rows'] else 0.0
+        print(f"Deduplicated {stats['rows']} listings: {stats['duplicates']} duplicates dropped ({rate:.1%})")
+        print("Since earlier runs: " + ", ".join(f"{status} {stats[status]}" for status in STATUSES))
+
+
+def deduplicate_listings(df, path=LISTING_INDEX_PATH):
+    """Drop duplicate listings of a processed dataset, update the listing index and report duplicate rates."""
+    index = ListingIndex(path)
+    deduplicated = index.deduplicate(df)
+    index.save()
+    index.report()
+    return deduplicated
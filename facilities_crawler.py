@@ -2,65 +2,238 @@
 # File: facilities_crawler.py
 # Group members: rivenl, leylal, chengkac, bangminp
 
-# This file downloads a zip file containing NYC facility data, extracts its contents, 
-# and saves it to a specified directory. It uses `requests` to download the file 
-# and `zipfile` to extract it.
-# The script imports constants like `DOWNLOAD_DIR`, `ZIP_FILE_NAME`, and `FACILITIES_EXTRACT_DIR`
-# from the `config.py` module. This file can be run independently.
+# This file downloads a zip file containing NYC facility data and turns it into a compact facilities table
+# for `merger.py`. It uses `requests` to download the file and `zipfile` to read it. Downloads go through
+# the shared HTTP response cache (`http_cache.py`) and are streamed to disk in chunks, never held in memory;
+# the archive file is a hard link to the cached body, so it is not stored twice.
+# A small manifest records the checksum, size and modification time of the archive and of the table built
+# from it, so an unchanged archive is neither written again nor parsed again: the facilities CSV is read
+# straight out of the zip (nothing is extracted) only when the archive changed, and only the columns the
+# merge uses are kept, for facilities with coordinates. Later runs load that Parquet table in a fraction
+# of a second. The script imports constants like `DOWNLOAD_DIR` and `ZIP_FILE_NAME` from the `config.py`
+# module. This file can be run independently.
 
 
-import requests
-import zipfile
+import hashlib
+import json
 import os
+import shutil
+import zipfile
+import pandas as pd
 from config import *
+from http_cache import ResponseCache, cached_session
+from profiling import profiled
 
 #%%
 # URL of the zip file
 URL = "https://s-media.nyc.gov/agencies/dcp/assets/files/zip/data-tools/bytes/facilities_24v1_csv.zip"
 
+# Columns of the facilities table; every facility with coordinates is kept because the geocoder uses
+# all of them as address points
+FACILITIES_COLUMNS = ['ADDRESS', 'FACTYPE', 'FACGROUP', 'BORO', 'ZIPCODE', 'LATITUDE', 'LONGITUDE']
+FACILITIES_CATEGORIES = ['FACTYPE', 'FACGROUP', 'BORO']
+_CHUNK_SIZE = 1024 * 1024
+
+
+def load_manifest(manifest_path=FACILITIES_MANIFEST_PATH):
+    """Load the manifest, or an empty one if there is none."""
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(manifest, manifest_path=FACILITIES_MANIFEST_PATH):
+    """Write the manifest atomically."""
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, manifest_path)
+
+
+def file_checksum(file_path):
+    """SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 
-def download_file(url, download_dir, file_name):
-    """Downloads a file from the specified URL to the given directory."""
+def file_stamp(file_path):
+    return {'size': os.path.getsize(file_path), 'mtime': os.path.getmtime(file_path)}
+
+
+def source_checksum(file_path, manifest):
+    """
+    Checksum of `file_path`, taken from the manifest when its size and modification time are unchanged.
+    The manifest is updated when the file had to be read.
+    """
+    entry = manifest.get('source', {})
+    if entry.get('path') == file_path and {k: entry.get(k) for k in ('size', 'mtime')} == file_stamp(file_path):
+        return entry['sha256']
+    manifest['source'] = {'path': file_path, 'sha256': file_checksum(file_path), **file_stamp(file_path)}
+    return manifest['source']['sha256']
+
+
+@profiled('facilities: download')
+def download_file(url, download_dir, file_name, manifest_path=FACILITIES_MANIFEST_PATH):
+    """
+    Downloads a file from the specified URL to the given directory, in chunks.
+    The file is left untouched when the server reports it unchanged and the copy on disk is intact.
+    A response kept in the HTTP cache is not stored twice: the file is a hard link to the cached body.
+    """
     if not os.path.exists(download_dir):
         os.makedirs(download_dir)  # Create directory if it doesn't exist
     file_path = os.path.join(download_dir, file_name)
+    temp_path = file_path + '.part'
+    manifest = load_manifest(manifest_path)
+    cache = ResponseCache()
 
     print(f"Downloading {file_name}...")
-    response = requests.get(url)
-    response.raise_for_status()  # Check for request errors
+    with cached_session(cache) as session:
+        response = session.get(url, stream=True)
+        response.raise_for_status()  # Check for request errors
+        from_cache = getattr(response, 'from_cache', False)
+
+        entry = cache.lookup(url)
+        if entry:
+            # The cache already streamed the body to disk and hashed it on the way
+            response.close()
+            digest = entry['digest']
+            if os.path.exists(file_path) and manifest.get('source', {}).get('path') == file_path and \
+                    manifest['source'].get('sha256') == digest and \
+                    {k: manifest['source'].get(k) for k in ('size', 'mtime')} == file_stamp(file_path):
+                print(f"{file_name} is unchanged; keeping the copy on disk")
+                return file_path
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            if not (os.path.exists(file_path) and os.path.samefile(file_path, cache.body_path(digest))):
+                try:
+                    os.link(cache.body_path(digest), temp_path)
+                except OSError:
+                    shutil.copyfile(cache.body_path(digest), temp_path)  # Cache on another file system
+        else:
+            # Not cacheable (no validators): stream to a temporary file and hash on the way, so a failed
+            # download never replaces a good archive
+            digest = hashlib.sha256()
+            with open(temp_path, 'wb') as f:
+                for chunk in response.iter_content(_CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+            response.close()
+            digest = digest.hexdigest()
+
+    if not os.path.exists(temp_path):
+        pass  # The file already is the cached body
+    elif not entry and os.path.exists(file_path) and manifest.get('source', {}).get('sha256') == digest:
+        os.remove(temp_path)  # Same content; keep the old file and its modification time
+    else:
+        os.replace(temp_path, file_path)
+    manifest['source'] = {'path': file_path, 'sha256': digest, **file_stamp(file_path)}
+    save_manifest(manifest, manifest_path)
+    source = "served from cache" if from_cache else "downloaded"
+    print(f"Downloaded {file_name} ({source})")
+
+    return file_path
 
-    with open(file_name, 'wb') as f:
-        f.write(response.content)
-    print(f"Downloaded {file_name}")
 
-    return file_name
+def find_member(zip_ref, file_name=FACILITIES_FILE_NAME):
+    """Name of the facilities CSV inside the archive."""
+    names = [name for name in zip_ref.namelist() if name.lower().endswith('.csv')]
+    for name in names:
+        if os.path.basename(name) == file_name:
+            return name
+    if not names:
+        raise ValueError(f"No CSV file in {zip_ref.filename}")
+    return names[0]
 
-def extract_zip(zip_file_path, extract_dir):
-    """Extracts the contents of a zip file to the specified directory."""
-    if not os.path.exists(extract_dir):
-        os.makedirs(extract_dir)  # Create directory if it doesn't exist
 
-    with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-        zip_ref.extractall(extract_dir)
-    print("Extracted contents ")
+def read_facilities_csv(source_path):
+    """Read the used columns of the facilities CSV, straight from the zip archive if `source_path` is one."""
+    def usecols(column):
+        return column.upper() in FACILITIES_COLUMNS
 
-def run_crawler():
-    """Main function to run the facilities data crawler, with an option for using predownloaded data."""
-    
+    if zipfile.is_zipfile(source_path):
+        with zipfile.ZipFile(source_path) as zip_ref, zip_ref.open(find_member(zip_ref)) as f:
+            facilities_data = pd.read_csv(f, usecols=usecols)
+    else:
+        facilities_data = pd.read_csv(source_path, usecols=usecols)
+    facilities_data.columns = facilities_data.columns.str.upper()
+    return facilities_data
+
+
+@profiled('facilities: build table')
+def build_facilities_table(source_path, table_path=FACILITIES_TABLE_PATH):
+    """Write the compact facilities table: used columns only, facilities with coordinates only."""
+    facilities_data = read_facilities_csv(source_path)
+    facilities_data = facilities_data.dropna(subset=['LATITUDE', 'LONGITUDE'])[FACILITIES_COLUMNS]
+    facilities_data = facilities_data.astype({column: 'category' for column in FACILITIES_CATEGORIES})
+    facilities_data = facilities_data.reset_index(drop=True)
+
+    temp_path = table_path + '.tmp'
+    facilities_data.to_parquet(temp_path, index=False, compression=STAGE_COMPRESSION)
+    os.replace(temp_path, table_path)
+    return facilities_data
+
+
+def default_source():
+    """The downloaded archive, or an already extracted CSV if there is no archive."""
+    zip_path = os.path.join(DOWNLOAD_DIR, ZIP_FILE_NAME)
+    return zip_path if os.path.exists(zip_path) else FACILITIES_DATA_PATH
+
+
+def load_facilities(source_path=None, table_path=FACILITIES_TABLE_PATH, manifest_path=FACILITIES_MANIFEST_PATH):
+    """
+    Load the compact facilities table, rebuilding it only if the source or the table layout changed.
+    :param source_path: Facilities zip archive or CSV file; defaults to the downloaded archive.
+    :return: DataFrame with `FACILITIES_COLUMNS`.
+    """
+    source_path = source_path or default_source()
+    manifest = load_manifest(manifest_path)
+    checksum = source_checksum(source_path, manifest)
+
+    table = manifest.get('table', {})
+    if (os.path.exists(table_path) and table.get('source_sha256') == checksum
+            and table.get('columns') == FACILITIES_COLUMNS):
+        return pd.read_parquet(table_path)
+
+    print(f"Building facilities table from {source_path}...")
+    facilities_data = build_facilities_table(source_path, table_path)
+    manifest['table'] = {'path': table_path, 'source_sha256': checksum, 'columns': FACILITIES_COLUMNS,
+                         'rows': len(facilities_data)}
+    save_manifest(manifest, manifest_path)
+    return facilities_data
+
+
+def ask_use_predownloaded():
+    """Ask whether to use predownloaded facilities data."""
     predownload_or_not = input("It takes less than one minute to scrape fresh facilities data.\n"
                                "Do you want to use predownloaded facilities data? (y/n): ").strip().lower()
-    
+    return predownload_or_not == "y"
+
+
+def run_crawler(use_predownloaded=None):
+    """
+    Main function to run the facilities data crawler, with an option for using predownloaded data.
+    :param use_predownloaded: Answer to `ask_use_predownloaded`; asked here when None.
+    """
+    if use_predownloaded is None:
+        use_predownloaded = ask_use_predownloaded()
+
     predownloaded_zip_path = os.path.join(DOWNLOAD_DIR, ZIP_FILE_NAME)
 
     # Use predownloaded data if available and chosen
-    if predownload_or_not == "y" and os.path.exists(predownloaded_zip_path):
+    if use_predownloaded and os.path.exists(predownloaded_zip_path):
         print(f"Loading predownloaded facilities data from {predownloaded_zip_path}")
-        extract_zip(predownloaded_zip_path, FACILITIES_EXTRACT_DIR)
+        zip_file_path = predownloaded_zip_path
     else:
         print("Downloading fresh facilities data from the web...")
-        # Download and extract fresh data
         zip_file_path = download_file(URL, DOWNLOAD_DIR, ZIP_FILE_NAME)
-        extract_zip(zip_file_path, FACILITIES_EXTRACT_DIR)
+
+    # Parse the archive only if it changed since the table was last built
+    facilities_data = load_facilities(zip_file_path)
+    print(f"Facilities table ready with {len(facilities_data)} facilities")
 
 if __name__ == "__main__":
     run_crawler()
@@ -0,0 +1,123 @@
+#%%
+# File: facility_catalog.py
+# Group members: rivenl, leylal, chengkac, bangminp
+
+# This file decides which facilities are counted around each apartment. Instead of a hard-coded list,
+# the catalog is configured in `config.py` with FACTYPE values (`FACILITY_TYPES`) and FACGROUP values
+# (`FACILITY_GROUPS`), where '*' stands for every value found in the facilities data (see
+# `facilities_datadictionary.xlsx`). Every catalog entry becomes one facility count column of the merged
+# dataset; a group column counts all facilities of that group.
+# Each facility is mapped to the columns it counts towards with categorical codes, one level (FACTYPE or
+# FACGROUP) at a time, so all columns are counted together by `facility_features.FacilityCounts` in one
+# pass. The catalog is saved next to the merged dataset, and the interactive page, the service and the
+# ranking read the available facility columns from it.
+
+import json
+import os
+import numpy as np
+import pandas as pd
+from config import FACILITY_TYPES, FACILITY_GROUPS, FACILITY_CATALOG_PATH, FACILITY_RADIUS_METERS
+
+_loaded = {}  # Catalog file path -> (modification time, catalog)
+
+
+class FacilityCatalog:
+    """
+    Facility count columns of the merged dataset.
+
+    :param types: FACTYPE values counted around apartments.
+    :param groups: FACGROUP values counted around apartments (a group name equal to a type is skipped).
+    :param type_groups: FACGROUP of each FACTYPE in the facilities data.
+    """
+
+    def __init__(self, types, groups=(), type_groups=None):
+        self.types = list(types)
+        self.groups = [group for group in groups if group not in self.types]
+        self.type_groups = dict(type_groups or {})
+
+    @property
+    def columns(self):
+        return self.types + self.groups
+
+    @classmethod
+    def from_facilities(cls, facilities_data, types=FACILITY_TYPES, groups=FACILITY_GROUPS):
+        """Resolve the configured types and groups ('*' for all of them) against the facilities data."""
+        known_types = sorted(facilities_data['FACTYPE'].dropna().astype('str').unique())
+        has_groups = 'FACGROUP' in facilities_data.columns
+        known_groups = sorted(facilities_data['FACGROUP'].dropna().astype('str').unique()) if has_groups else []
+
+        types = known_types if types == '*' else list(types)
+        groups = known_groups if groups == '*' else list(groups)
+        unknown = sorted(set(types) - set(known_types)) + sorted(set(groups) - set(known_groups))
+        if unknown:
+            print(f"Not in the facilities data, counted as 0: {unknown}")
+
+        type_groups = {}
+        if has_groups:
+            pairs = facilities_data[['FACTYPE', 'FACGROUP']].dropna().astype('str').drop_duplicates('FACTYPE')
+            type_groups = dict(zip(pairs['FACTYPE'], pairs['FACGROUP']))
+        return cls(types, groups, type_groups)
+
+    def points(self, facilities_data):
+        """
+        One row per facility and catalog column it counts towards.
+        :return: DataFrame with LATITUDE, LONGITUDE and CATEGORY (categorical over `columns`).
+        """
+        parts = []
+        for level, names in [('FACTYPE', self.types), ('FACGROUP', self.groups)]:
+            if not names or level not in facilities_data.columns:
+                continue
+            # Codes against this level's own names, so a FACTYPE equal to a group name is not counted as the group
+            codes = pd.Categorical(facilities_data[level].astype('str'), categories=names).codes
+            counted = codes >= 0
+            positions = np.array([self.columns.index(name) for name in names])
+            parts.append(pd.DataFrame({
+                'LATITUDE': facilities_data['LATITUDE'].to_numpy()[counted],
+                'LONGITUDE': facilities_data['LONGITUDE'].to_numpy()[counted],
+                'CATEGORY': pd.Categorical.from_codes(positions[codes[counted]], categories=self.columns),
+            }))
+        if not parts:
+            return pd.DataFrame({'LATITUDE': [], 'LONGITUDE': [],
+                                 'CATEGORY': pd.Categorical([], categories=self.columns)})
+        return pd.concat(parts, ignore_index=True)
+
+    def column_names(self, radius):
+        """Names of the count columns for `radius` meters; only `FACILITY_RADIUS_METERS` uses the plain names."""
+        if radius == FACILITY_RADIUS_METERS:
+            return self.columns
+        return [f"{column} {radius}M" for column in self.columns]
+
+    def save(self, path=FACILITY_CATALOG_PATH):
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'types': self.types, 'groups': self.groups, 'type_groups': self.type_groups}, f, indent=2)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path=FACILITY_CATALOG_PATH):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data['types'], data['groups'], data['type_groups'])
+
+
+def load_catalog(path=FACILITY_CATALOG_PATH):
+    """
+    The catalog saved by the last merge, or the configured names if there is none yet.
+    The file is read again only after it changed.
+    """
+    if not os.path.exists(path):
+        return FacilityCatalog([] if FACILITY_TYPES == '*' else FACILITY_TYPES,
+                               [] if FACILITY_GROUPS == '*' else FACILITY_GROUPS)
+    mtime = os.path.getmtime(path)
+    if path not in _loaded or _loaded[path][0] != mtime:
+        _loaded[path] = (mtime, FacilityCatalog.load(path))
+    return _loaded[path][1]
+
+
+if __name__ == "__main__":
+    # List every facility type with its group, to choose the catalog entries in config.py
+    from facilities_crawler import load_facilities
+    facilities_data = load_facilities()
+    sizes = facilities_data.groupby(['FACGROUP', 'FACTYPE'], observed=True).size()
+    for (group, factype), size in sizes.items():
+        print(f"{group:<45} {factype:<50} {size:>6}")
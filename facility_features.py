@@ -0,0 +1,58 @@
+#%%
+# File: facility_features.py
+# Group members: rivenl, leylal, chengkac, bangminp
+
+# This file counts the facilities of every catalog column around each apartment, at every radius in
+# `FACILITY_RADII_METERS`. The counts are exact: each apartment is measured from its own coordinates to
+# every facility within the radius, with the grid index of `spatial_index.py`. One `GridIndex` is built per
+# radius, with cells as wide as the radius, so a query only visits the 3 x 3 cells around the apartment.
+# Building the indexes sorts the facility points once and takes milliseconds, so they are built once per
+# pipeline run (or per `streaming.py` run) and reused for every batch of apartments; nothing is cached on
+# disk. Their size grows with the number of facility points, and a lookup costs one distance test per
+# facility near each apartment, whatever the number of catalog columns.
+# It imports the radii from `config.py`.
+
+import pandas as pd
+from config import FACILITY_RADII_METERS
+from spatial_index import GridIndex
+
+
+class FacilityCounts:
+    """
+    Exact facility counts of every category around any point, at a fixed set of radii.
+
+    :param lat: Latitude of each facility point.
+    :param lon: Longitude of each facility point.
+    :param categories: Category (catalog column) of each facility point.
+    :param radii: Search radii in meters that can be queried.
+    """
+
+    def __init__(self, lat, lon, categories, radii=FACILITY_RADII_METERS):
+        categories = pd.Categorical(categories)
+        self.categories = list(categories.categories)
+        self.indexes = {radius: GridIndex(lat, lon, categories, cell_size=radius) for radius in radii}
+
+    @property
+    def radii(self):
+        return list(self.indexes)
+
+    def count_within(self, lat, lon, radius):
+        """
+        Facilities of every category within `radius` meters (one of `radii`) of each point.
+        :return: Integer array of shape (points, categories). Points without coordinates get zeros.
+        """
+        return self.indexes[radius].count_within(lat, lon, radius)
+
+    def count_frame(self, lat, lon, radius, categories=None):
+        """Same as `count_within`, returned as a DataFrame with one column per category."""
+        return self.indexes[radius].count_frame(lat, lon, radius, categories)
+
+
+def load_facility_counts(points, radii=FACILITY_RADII_METERS):
+    """
+    Build the facility count indexes.
+    :param points: LATITUDE, LONGITUDE and CATEGORY (the count column) of each facility, as returned by
+                   `facility_catalog.FacilityCatalog.points`.
+    """
+    print(f"Indexing {len(points)} facility points for radii {list(radii)} meters...")
+    return FacilityCounts(points['LATITUDE'], points['LONGITUDE'], points['CATEGORY'], radii)
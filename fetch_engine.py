@@ -0,0 +1,129 @@
+#%%
+# File: fetch_engine.py
+# Group members: rivenl, leylal, chengkac, bangminp
+
+# This file provides a small concurrent HTTP fetch engine for the crawlers. All requests go through one
+# pooled keep-alive `requests.Session`, run on a configurable number of worker threads, and are paced by
+# a token-bucket rate limiter per host instead of a fixed sleep after every request. Total crawl time
+# therefore depends on the allowed request rate rather than on a serial per-page cost. With a response
+# cache attached (see `http_cache.py`), unchanged pages are revalidated and served from disk.
+# Conditional requests for cached pages are paced by a separate, higher limit
+# (`CRAWL_REVALIDATIONS_PER_SECOND`), as a 304 answer costs the host little; a page that turns out to have
+# changed is then also charged to the normal limit. A warm re-crawl is therefore not held to the full rate.
+# It imports the crawl settings (`CRAWL_WORKERS`, `CRAWL_REQUESTS_PER_SECOND`, `CRAWL_BURST`,
+# `CRAWL_REVALIDATIONS_PER_SECOND`) from `config.py`.
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from config import CRAWL_WORKERS, CRAWL_REQUESTS_PER_SECOND, CRAWL_BURST, CRAWL_REVALIDATIONS_PER_SECOND
+from http_cache import CachingAdapter
+import profiling
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. `rate` tokens are added per second up to `capacity`;
+    each request takes one token and waits while the bucket is empty.
+    A rate of None or 0 disables limiting.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class FetchEngine:
+    """
+    Concurrent page fetcher with a shared connection pool and per-host rate limiting.
+    Use it as a context manager so the worker threads and connections are released.
+
+    :param workers: Number of worker threads (and pooled connections per host).
+    :param rate: Allowed requests per second for each host.
+    :param burst: Number of requests a host may receive back to back.
+    :param headers: Default headers sent with every request.
+    :param cache: Optional `http_cache.ResponseCache`; pages are then revalidated instead of re-downloaded.
+    :param revalidate_rate: Allowed conditional requests per second for each host, for pages in `cache`.
+    """
+
+    def __init__(self, workers=CRAWL_WORKERS, rate=CRAWL_REQUESTS_PER_SECOND, burst=CRAWL_BURST, headers=None,
+                 cache=None, revalidate_rate=CRAWL_REVALIDATIONS_PER_SECOND):
+        self.workers = workers
+        self.rate = rate
+        self.burst = burst
+        self.cache = cache
+        self.revalidate_rate = revalidate_rate
+
+        self.session = requests.Session()
+        if cache is not None:
+            adapter = CachingAdapter(cache, pool_connections=workers, pool_maxsize=workers)
+        else:
+            adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+            self.session.hooks['response'].append(profiling.count_response)  # The cache counts its own traffic
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+
+    def _bucket_for(self, url, revalidate=False):
+        """Return the rate limiter shared by all requests (or all revalidations) to the host of `url`."""
+        key = (urlsplit(url).netloc, revalidate)
+        with self._buckets_lock:
+            if key not in self._buckets:
+                rate = self.revalidate_rate if revalidate and self.rate else self.rate
+                self._buckets[key] = TokenBucket(rate, self.burst)
+            return self._buckets[key]
+
+    def get(self, url, **kwargs):
+        """Fetch `url` on the calling thread once the host's rate limit allows it."""
+        revalidate = self.cache is not None and self.cache.lookup(url) is not None
+        self._bucket_for(url, revalidate).acquire()
+        response = self.session.get(url, **kwargs)
+        if revalidate and not getattr(response, 'from_cache', False):
+            self._bucket_for(url).acquire()  # The page changed and was sent in full
+        response.raise_for_status()
+        return response
+
+    def fetch_text(self, url, **kwargs):
+        """Fetch `url` and return the response body as text."""
+        return self.get(url, **kwargs).text
+
+    def submit(self, url, **kwargs):
+        """Schedule a fetch on the worker pool and return a Future resolving to the page text."""
+        return self.executor.submit(self.fetch_text, url, **kwargs)
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,285 @@
+#%%
+# File: filter_engine.py
+# Group members: rivenl, leylal, chengkac, bangminp
+
+# This file provides a long-lived, indexed filter over the merged apartment dataset. The dataset is loaded
+# once and indexed on the columns users filter by: borough, pet policy and safety level are stored as
+# compact category codes, and all rows are sorted by (combination of those codes, 'AVERAGE RENT').
+# Every combination therefore owns one contiguous block of rows ordered by rent, and a query is answered
+# by picking the blocks whose codes match and binary-searching the rent range inside each of them.
+# No row outside the answer is ever looked at, so latency follows the size of the answer, not of the dataset.
+# Queries use the same `query_params` format that `interactive_page.collect_preferences` produces.
+# `match_batch` answers many queries at once (e.g. every saved search of a nightly alert job): the queries
+# are compiled into a matrix of allowed index blocks and arrays of rent bounds, every block is binary-searched
+# for all queries in one call, and the matching rows of all queries are gathered with a single vectorized
+# expansion, so the per-query Python work of `match` is paid once per block instead of once per query.
+
+import itertools
+import numpy as np
+import pandas as pd
+
+RANGE_COLUMN = 'AVERAGE RENT'
+INDEXED_COLUMNS = ['BORO', 'IF_PETS_ALLOWED', 'Safety_level']
+BASE_COLUMNS = ['ADDRESS', 'APARTMENT NAME', 'AVERAGE RENT', 'ZIP CODE', 'CITY']
+BATCH_SIZE = 1024  # Queries expanded together by `match_batch`; bounds the memory of the expansion
+
+
+def range_bounds(condition):
+    """
+    Turn a comparison condition into bounds.
+    :return: (low, low_inclusive, high, high_inclusive); None means unbounded.
+    """
+    op, *values = condition
+    if op == 'between':
+        return values[0], True, values[1], True
+    if op == '<':
+        return None, True, values[0], False
+    if op == '<=':
+        return None, True, values[0], True
+    if op == '>':
+        return values[0], False, None, True
+    if op == '>=':
+        return values[0], True, None, True
+    if op == '==':
+        return values[0], True, values[0], True
+    raise ValueError(f"Unsupported operator: {op}")
+
+
+def check_condition(values, condition):
+    """Vectorized test of one condition against an array of values."""
+    if condition[0] == '==':
+        return values == condition[1]
+    low, low_inclusive, high, high_inclusive = range_bounds(condition)
+    keep = np.ones(len(values), dtype=bool)
+    if low is not None:
+        keep &= (values >= low) if low_inclusive else (values > low)
+    if high is not None:
+        keep &= (values <= high) if high_inclusive else (values < high)
+    return keep
+
+
+def filter_frame(df, query_params):
+    """Rows of `df` that satisfy every condition, without building an index (for one-off chunks)."""
+    keep = np.ones(len(df), dtype=bool)
+    for column, condition in query_params.items():
+        if condition is not None:
+            keep &= np.asarray(check_condition(df[column].to_numpy(), condition), dtype=bool)
+    return df[keep]
+
+
+class CategoryCodes:
+    """Category code of every row of one column; missing values get code -1."""
+
+    def __init__(self, values):
+        categorical = pd.Categorical(values)
+        self.codes = categorical.codes.astype(np.int64)
+        self.lookup = {value: code for code, value in enumerate(categorical.categories)}
+
+    def __len__(self):
+        return len(self.lookup)
+
+    def code_of(self, value):
+        return self.lookup.get(value, -2)  # -2 never matches a row
+
+
+class FilterEngine:
+    """
+    Indexed, in-memory filter over the merged dataset.
+
+    :param df: Merged apartment DataFrame (as stored by the 'merged' stage).
+    """
+
+    def __init__(self, df):
+        self.df = df.reset_index(drop=True)
+        self.indexed_columns = [column for column in INDEXED_COLUMNS if column in self.df.columns]
+        self.categories = {column: CategoryCodes(self.df[column]) for column in self.indexed_columns}
+
+        # Combined key of all indexed codes; missing values are shifted to code 0 of each column
+        self.radix = [len(self.categories[column]) + 1 for column in self.indexed_columns]
+        key = np.zeros(len(self.df), dtype=np.int64)
+        for column, radix in zip(self.indexed_columns, self.radix):
+            key = key * radix + (self.categories[column].codes + 1)
+        self.n_keys = int(np.prod(self.radix))
+
+        # Sort rows by key, then rent; rows without a rent go last inside their key block
+        self.rent = self.df[RANGE_COLUMN].to_numpy(dtype=float)
+        missing_rent = np.isnan(self.rent)
+        self.order = np.lexsort((self.rent, key))
+        self.sorted_rent = self.rent[self.order]
+        self.block_start = np.searchsorted(key[self.order], np.arange(self.n_keys + 1))
+        self.rent_end = self.block_start[1:] - np.bincount(key[missing_rent], minlength=self.n_keys)
+
+    def __len__(self):
+        return len(self.df)
+
+    def matching_keys(self, query_params):
+        """Combined keys of the index blocks allowed by the equality conditions on indexed columns."""
+        allowed = []
+        for column, radix in zip(self.indexed_columns, self.radix):
+            condition = query_params.get(column)
+            if condition is None:
+                allowed.append(range(radix))
+            else:
+                code = self.categories[column].code_of(condition[1])
+                if code < 0:
+                    return []
+                allowed.append([code + 1])
+
+        keys = []
+        for codes in itertools.product(*allowed):
+            key = 0
+            for code, radix in zip(codes, self.radix):
+                key = key * radix + code
+            keys.append(key)
+        return keys
+
+    def block_rows(self, key, rent_condition):
+        """Row ids in one key block, limited to a rent range by binary search."""
+        start, stop = self.block_start[key], self.block_start[key + 1]
+        if rent_condition is None:
+            return self.order[start:stop]
+
+        low, low_inclusive, high, high_inclusive = range_bounds(rent_condition)
+        rents = self.sorted_rent[start:self.rent_end[key]]
+        first = 0 if low is None else np.searchsorted(rents, low, side='left' if low_inclusive else 'right')
+        last = len(rents) if high is None else np.searchsorted(rents, high, side='right' if high_inclusive else 'left')
+        return self.order[start + first:start + max(first, last)]
+
+    def is_indexed(self, column, condition):
+        return (column == RANGE_COLUMN) or (column in self.categories and condition[0] == '==')
+
+    def match(self, query_params):
+        """
+        Row ids (in dataset order) that satisfy every condition in `query_params`.
+        :param query_params: Dictionary of column -> (op, value) or ('between', low, high).
+        """
+        conditions = {column: condition for column, condition in query_params.items() if condition is not None}
+        indexed = {column: condition for column, condition in conditions.items() if self.is_indexed(column, condition)}
+        others = {column: condition for column, condition in conditions.items() if column not in indexed}
+
+        blocks = [self.block_rows(key, indexed.get(RANGE_COLUMN)) for key in self.matching_keys(indexed)]
+        row_ids = np.concatenate(blocks) if blocks else np.empty(0, dtype=np.int64)
+
+        # Conditions the index does not cover are checked on the candidate rows only
+        for column, condition in others.items():
+            row_ids = row_ids[check_condition(self.df[column].to_numpy()[row_ids], condition)]
+        return np.sort(row_ids)
+
+    def allowed_blocks(self, queries):
+        """
+        Predicate matrix of a batch: which index blocks each query may match.
+        :return: Boolean array of shape (queries, blocks).
+        """
+        allowed = np.ones((len(queries), 1), dtype=bool)
+        for column, radix in zip(self.indexed_columns, self.radix):
+            column_allowed = np.ones((len(queries), radix), dtype=bool)
+            for i, query_params in enumerate(queries):
+                condition = query_params.get(column)
+                if condition is not None and condition[0] == '==':
+                    code = self.categories[column].code_of(condition[1])
+                    column_allowed[i] = False
+                    if code >= 0:
+                        column_allowed[i, code + 1] = True
+            # Blocks are numbered in mixed radix, so the next column varies fastest
+            allowed = (allowed[:, :, None] & column_allowed[:, None, :]).reshape(len(queries), -1)
+        return allowed
+
+    def rent_slices(self, queries):
+        """
+        Position range of each query inside each block, from the rent conditions of the batch.
+        :return: (first, last) arrays of shape (queries, blocks), positions into `order`.
+        """
+        bounds = [range_bounds(query_params[RANGE_COLUMN]) if query_params.get(RANGE_COLUMN) is not None else None
+                  for query_params in queries]
+        has_rent = np.array([bound is not None for bound in bounds])
+        low = np.array([-np.inf if bound is None or bound[0] is None else bound[0] for bound in bounds], dtype=float)
+        high = np.array([np.inf if bound is None or bound[2] is None else bound[2] for bound in bounds], dtype=float)
+        low_inclusive = np.array([bound is None or bound[1] for bound in bounds])
+        high_inclusive = np.array([bound is None or bound[3] for bound in bounds])
+
+        first = np.empty((len(queries), self.n_keys), dtype=np.int64)
+        last = np.empty((len(queries), self.n_keys), dtype=np.int64)
+        for key in range(self.n_keys):
+            start, stop = self.block_start[key], self.block_start[key + 1]
+            if start == stop:
+                first[:, key] = last[:, key] = start
+                continue
+            # One binary search per bound for all queries of the batch
+            rents = self.sorted_rent[start:self.rent_end[key]]
+            first[:, key] = start + np.where(low_inclusive, np.searchsorted(rents, low, side='left'),
+                                             np.searchsorted(rents, low, side='right'))
+            last[:, key] = start + np.where(high_inclusive, np.searchsorted(rents, high, side='right'),
+                                            np.searchsorted(rents, high, side='left'))
+            last[~has_rent, key] = stop  # Without a rent condition, rows without a rent match too
+        return first, np.maximum(first, last)
+
+    def match_batch(self, queries, top_k=None):
+        """
+        Row ids matching each of many queries, evaluated together.
+        :param queries: List of `query_params` dictionaries (the `match` format).
+        :param top_k: Keep only the `top_k` cheapest matches of each query, cheapest first.
+        :return: One array of row ids per query; in dataset order, or by rent with `top_k`.
+                 Identical queries share the same array.
+        """
+        # Saved searches repeat a small set of option combinations, so each distinct query is evaluated once
+        keys = [tuple(sorted((column, tuple(condition)) for column, condition in query_params.items()
+                             if condition is not None)) for query_params in queries]
+        distinct = {key: position for position, key in enumerate(dict.fromkeys(keys))}
+        unique = [dict(key) for key in distinct]
+
+        results = []
+        for batch_start in range(0, len(unique), BATCH_SIZE):
+            results.extend(self._match_batch(unique[batch_start:batch_start + BATCH_SIZE], top_k))
+        return [results[distinct[key]] for key in keys]
+
+    def _match_batch(self, queries, top_k):
+        others = [{column: condition for column, condition in query_params.items()
+                   if not self.is_indexed(column, condition)} for query_params in queries]
+
+        allowed = self.allowed_blocks(queries)
+        first, last = self.rent_slices(queries)
+        lengths = np.where(allowed, last - first, 0)
+        if top_k is not None:
+            # Blocks are sorted by rent, so only the first `top_k` rows of a block can make a query's top k
+            # (unless other conditions may still drop some of them)
+            capped = np.array([not conditions for conditions in others])
+            lengths[capped] = np.minimum(lengths[capped], top_k)
+
+        # Expand every (query, block) slice into row positions at once
+        lengths = lengths.ravel()
+        total = int(lengths.sum())
+        query_ids = np.repeat(np.repeat(np.arange(len(queries)), self.n_keys), lengths)
+        offsets = np.repeat(first.ravel() - (np.cumsum(lengths) - lengths), lengths)
+        positions = offsets + np.arange(total)
+        row_ids = self.order[positions]
+
+        # Conditions the index does not cover are checked once per distinct condition, on its queries' rows
+        checks = {}
+        for i, conditions in enumerate(others):
+            for column, condition in conditions.items():
+                checks.setdefault((column, tuple(condition)), []).append(i)
+        if checks:
+            keep = np.ones(total, dtype=bool)
+            for (column, condition), ids in checks.items():
+                rows = np.isin(query_ids, ids)
+                keep[rows] &= np.asarray(check_condition(self.df[column].to_numpy()[row_ids[rows]], condition), dtype=bool)
+            query_ids, row_ids = query_ids[keep], row_ids[keep]
+
+        # Rows are grouped by query already; order them inside each query
+        bounds = np.searchsorted(query_ids, np.arange(len(queries) + 1))
+        if top_k is None:
+            return [np.sort(row_ids[bounds[i]:bounds[i + 1]]) for i in range(len(queries))]
+        order = np.lexsort((row_ids, self.rent[row_ids], query_ids))  # At most top_k rows per block and query
+        row_ids = row_ids[order]
+        return [row_ids[bounds[i]:min(bounds[i + 1], bounds[i] + top_k)] for i in range(len(queries))]
+
+    def query(self, query_params, facilities=None):
+        """Matching rows as a DataFrame; with `facilities`, only the base and selected facility columns."""
+        return self.query_rows(self.match(query_params), facilities)
+
+    def query_rows(self, row_ids, facilities=None):
+        """Rows `row_ids` as a DataFrame, projected like `query`."""
+        result = self.df.take(row_ids)
+        if facilities:
+            result = result[BASE_COLUMNS + list(facilities)]
+        return result
@@ -0,0 +1,255 @@
+#%%
+# File: http_cache.py
+# Group members: rivenl, leylal, chengkac, bangminp
+
+# This file provides an on-disk HTTP response cache shared by all crawlers. Responses are keyed by
+# their full URL (including the query string) and their bodies are stored once per content hash.
+# When a cached entry exists, the next request is sent with If-None-Match / If-Modified-Since, and a
+# 304 answer is served from disk. The cache is bounded in size and evicts the least recently used
+# entries first. Index updates are kept in memory and written every `HTTP_CACHE_FLUSH_EVERY` updates and
+# when the cache (or the session using it) is closed, so a warm crawl does not rewrite the index per request.
+# The cache plugs into `requests` as a transport adapter, so it works for our own sessions as well as
+# the session inside the `sodapy` client. Paths and limits come from `config.py`.
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from config import HTTP_CACHE_DIR, HTTP_CACHE_MAX_BYTES, HTTP_CACHE_FLUSH_EVERY
+import profiling
+
+# Headers that describe the transfer rather than the body; bodies are stored decoded
+_TRANSFER_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection'}
+_CHUNK_SIZE = 1024 * 1024
+
+
+class ResponseCache:
+    """
+    Size-bounded, content-addressed store of HTTP response bodies and their validators.
+
+    :param cache_dir: Directory holding `index.json` and the `bodies/` folder.
+    :param max_bytes: Upper bound on the total size of stored bodies.
+    :param flush_every: Number of index updates kept in memory before the index is written.
+    """
+
+    def __init__(self, cache_dir=HTTP_CACHE_DIR, max_bytes=HTTP_CACHE_MAX_BYTES, flush_every=HTTP_CACHE_FLUSH_EVERY):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.flush_every = flush_every
+        self.body_dir = os.path.join(cache_dir, 'bodies')
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        os.makedirs(self.body_dir, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.evicted = set()  # Keys dropped here, not to be taken back from the index on disk
+        self.pending = 0  # Index updates not written yet
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def key_for(url):
+        """Cache key of a fully encoded URL (path and query string)."""
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def body_path(self, digest):
+        return os.path.join(self.body_dir, digest)
+
+    def lookup(self, url):
+        """Return the cached entry for `url`, or None if it is missing or its body is gone."""
+        with self.lock:
+            entry = self.entries.get(self.key_for(url))
+            if entry and os.path.exists(self.body_path(entry['digest'])):
+                return dict(entry)
+        return None
+
+    def touch(self, url):
+        """Mark the entry for `url` as recently used."""
+        with self.lock:
+            entry = self.entries.get(self.key_for(url))
+            if entry:
+                entry['last_used'] = time.time()
+                self._updated()
+
+    def store(self, url, response):
+        """
+        Stream the body of `response` to disk and record it under `url`.
+        :return: The new cache entry.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in response.raw.stream(_CHUNK_SIZE, decode_content=True):
+                f.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+        response.close()
+
+        digest = digest.hexdigest()
+        body_path = self.body_path(digest)
+        if os.path.exists(body_path):
+            os.remove(temp_path)  # Same content is already stored under another key
+        else:
+            os.replace(temp_path, body_path)
+
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in _TRANSFER_HEADERS}
+        entry = {
+            'url': url,
+            'digest': digest,
+            'size': size,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'headers': headers,
+            'encoding': response.encoding,
+            'last_used': time.time(),
+        }
+        with self.lock:
+            self.entries[self.key_for(url)] = entry
+            self._evict(keep=self.key_for(url))
+            self._updated()
+        return dict(entry)
+
+    def flush(self):
+        """Write pending index updates to disk."""
+        with self.lock:
+            if self.pending:
+                self._save_index()
+
+    def close(self):
+        self.flush()
+
+    def _updated(self):
+        """Count an index update (lock held) and write the index once enough have accumulated."""
+        self.pending += 1
+        if self.pending >= self.flush_every:
+            self._save_index()
+
+    def _evict(self, keep=None):
+        """
+        Drop least recently used entries until the stored bodies fit in `max_bytes`.
+        The entry under `keep` (the one just stored) is never dropped.
+        """
+        references = Counter(entry['digest'] for entry in self.entries.values())
+        sizes = {entry['digest']: entry['size'] for entry in self.entries.values()}
+        total = sum(sizes.values())
+
+        for key, entry in sorted(self.entries.items(), key=lambda item: item[1]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            del self.entries[key]
+            self.evicted.add(key)
+            references[entry['digest']] -= 1
+            if references[entry['digest']] == 0:
+                # No other URL shares this body, so its file can go
+                total -= entry['size']
+                if os.path.exists(self.body_path(entry['digest'])):
+                    os.remove(self.body_path(entry['digest']))
+
+    def _save_index(self):
+        """
+        Write the index atomically so a crash never leaves a half-written file.
+        Entries other processes wrote to the index since it was loaded are kept.
+        """
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path) as f:
+                    on_disk = json.load(f)
+            except ValueError:
+                on_disk = {}
+            for key, entry in on_disk.items():
+                if key not in self.entries and key not in self.evicted:
+                    self.entries[key] = entry
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(temp_path, self.index_path)
+        self.pending = 0
+
+
+class CachingAdapter(HTTPAdapter):
+    """
+    Transport adapter that revalidates GET requests against a `ResponseCache`.
+    Responses served from disk have `from_cache = True`.
+    """
+
+    def __init__(self, cache=None, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache if cache is not None else ResponseCache()
+
+    def close(self):
+        """Release pooled connections and write pending cache index updates."""
+        super().close()
+        self.cache.flush()
+
+    def send(self, request, stream=False, **kwargs):
+        if request.method != 'GET':
+            response = super().send(request, stream=stream, **kwargs)
+            profiling.record_http(profiling.content_length(response))
+            return response
+
+        entry = self.cache.lookup(request.url)
+        if entry:
+            if entry['etag']:
+                request.headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                request.headers['If-Modified-Since'] = entry['last_modified']
+
+        # Always stream so large bodies go straight to disk
+        response = super().send(request, stream=True, **kwargs)
+
+        if response.status_code == 304 and entry:
+            response.close()
+            self.cache.touch(request.url)
+            profiling.record_http(0, from_cache=True)
+            return self._cached_response(request, entry, stream)
+
+        validated = response.headers.get('ETag') or response.headers.get('Last-Modified')
+        if response.status_code == 200 and validated:
+            entry = self.cache.store(request.url, response)
+            profiling.record_http(entry['size'])
+            return self._cached_response(request, entry, stream, from_cache=False)
+
+        response.from_cache = False
+        profiling.record_http(profiling.content_length(response))
+        return response
+
+    def _cached_response(self, request, entry, stream, from_cache=True):
+        """
+        Build a 200 response whose body comes from the cached file.
+        Streaming callers read the file lazily; everyone else gets the body in memory.
+        """
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = request.url
+        response.request = request
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = entry['encoding']
+        if stream:
+            response.raw = open(self.cache.body_path(entry['digest']), 'rb')
+        else:
+            with open(self.cache.body_path(entry['digest']), 'rb') as f:
+                response._content = f.read()
+        response.connection = self
+        response.from_cache = from_cache
+        return response
+
+
+def cached_session(cache=None, pool_size=10):
+    """Return a `requests.Session` whose HTTP and HTTPS traffic goes through the response cache."""
+    session = requests.Session()
+    adapter = CachingAdapter(cache, pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
@@ -7,30 +7,34 @@
 # facilities nearby, and crime level. Based on the input, the script builds a dictionary `query_params` to 
 # filter apartment data and a list of `facilities` to filter facility columns.
 # The collected preferences are returned for further use in filtering apartment data.
+# The facility choices are the columns of the facility catalog (see `facility_catalog.py`).
+
+from facility_catalog import load_catalog
 
 
 # Define options
 borough_options = ['BRONX', 'BROOKLYN', 'MANHATTAN', 'QUEENS', 'Not to matter']
 price_range_options = ['< 2000', '2000-2800', '2800-3600', '3600-4400', '> 4400', 'Not to matter']
 pet_policy_options = ['Yes', 'No', 'Not to matter']  # 'Yes' means 'Allowed', 'No' means 'Not Allowed'
-facilities_options = ['BUS STATION', 'MUSEUM', 'COMMERCIAL GARAGE AND PARKING LOT', 'PUBLIC LIBRARY', 'Not to matter']
 crime_options = ['Caution Advised', 'Relatively Safe', 'Very Safe', 'Not to matter']
 
+
+def facilities_options():
+    """Facility columns the user can choose from."""
+    return load_catalog().columns + ['Not to matter']
+
+
 def collect_preferences():
     """
     Collect user preferences and return two outputs:
     - query_params: A dictionary of filtering conditions for row filtering.
     - facilities: A list of selected facility column names for filtering columns.
     """
-    query_params = {}  # Initialize empty dictionary for filters
-    
     # Asking for Borough
     print("\nWhich borough would you like to live in? (Enter number)")
     for idx, option in enumerate(borough_options):
         print(f"{idx + 1}. {option}")
     boro_choice = int(input()) - 1
-    if borough_options[boro_choice] != 'Not to matter':
-        query_params['BORO'] = ('==', borough_options[boro_choice])
 
     # Asking for Price Range
     print("\nWhat's your price range preference? (Enter number)")
@@ -38,38 +42,19 @@ def collect_preferences():
         print(f"{idx + 1}. {option}")
     price_choice = int(input()) - 1
 
-    # Handling Average Rent based on the selected range
-    if price_range_options[price_choice] == '< 2000':
-        query_params['AVERAGE RENT'] = ('<', 2000)
-    elif price_range_options[price_choice] == '2000-2800':
-        query_params['AVERAGE RENT'] = ('between', 2000, 2800)
-    elif price_range_options[price_choice] == '2800-3600':
-        query_params['AVERAGE RENT'] = ('between', 2800, 3600)
-    elif price_range_options[price_choice] == '3600-4400':
-        query_params['AVERAGE RENT'] = ('between', 3600, 4400)
-    elif price_range_options[price_choice] == '> 4400':
-        query_params['AVERAGE RENT'] = ('>', 4400)
-
     # Asking for Pet Policy
     print("\nDo you require pet-friendly apartments? (Enter number)")
     for idx, option in enumerate(pet_policy_options):
         print(f"{idx + 1}. {option}")
     pet_policy_choice = int(input()) - 1
 
-    # Handling Pet Policy:
-    if pet_policy_options[pet_policy_choice] == 'Yes':
-        query_params['IF_PETS_ALLOWED'] = ('==', 'Allowed')
-    elif pet_policy_options[pet_policy_choice] == 'No':
-        query_params['IF_PETS_ALLOWED'] = ('==', 'Not Allowed')
-
     # Asking for Facilities (multiple choices allowed)
     print("\nWhich facilities would you like nearby? (Enter numbers separated by commas)")
-    for idx, option in enumerate(facilities_options):
+    facility_choices = facilities_options()
+    for idx, option in enumerate(facility_choices):
         print(f"{idx + 1}. {option}")
     facilities_choice = input().split(',')
-
-    # Filter only for valid facility choices (skip "Not to matter")
-    facilities = [facilities_options[int(facility.strip()) - 1] for facility in facilities_choice if facilities_options[int(facility.strip()) - 1] != 'Not to matter']
+    facility_names = [facility_choices[int(facility.strip()) - 1] for facility in facilities_choice]
 
     # Asking for Crime Level
     while True:
@@ -84,8 +69,53 @@ def collect_preferences():
         else:
             print("Invalid choice. Please enter a number between 1 and", len(crime_options))
 
-    if crime_options[crime_choice] != 'Not to matter':
-        query_params['Safety_level'] = ('==', crime_options[crime_choice])
+    return build_query_params(borough_options[boro_choice], price_range_options[price_choice],
+                              pet_policy_options[pet_policy_choice], facility_names, crime_options[crime_choice])
+
+
+def build_query_params(borough='Not to matter', price_range='Not to matter', pet_policy='Not to matter',
+                       facilities=(), crime_level='Not to matter'):
+    """
+    Turn chosen options (the strings listed above) into the two outputs of `collect_preferences`.
+    Also used by `service.py` to read preferences from request parameters.
+    :raises ValueError: If an option is not one of the listed choices.
+    """
+    for value, options in [(borough, borough_options), (price_range, price_range_options),
+                           (pet_policy, pet_policy_options), (crime_level, crime_options)]:
+        if value not in options:
+            raise ValueError(f"Unknown option {value!r}; choose one of {options}")
+    facility_choices = facilities_options()
+    for facility in facilities:
+        if facility not in facility_choices:
+            raise ValueError(f"Unknown facility {facility!r}; choose from {facility_choices}")
+
+    query_params = {}  # Initialize empty dictionary for filters
+    if borough != 'Not to matter':
+        query_params['BORO'] = ('==', borough)
+
+    # Handling Average Rent based on the selected range
+    if price_range == '< 2000':
+        query_params['AVERAGE RENT'] = ('<', 2000)
+    elif price_range == '2000-2800':
+        query_params['AVERAGE RENT'] = ('between', 2000, 2800)
+    elif price_range == '2800-3600':
+        query_params['AVERAGE RENT'] = ('between', 2800, 3600)
+    elif price_range == '3600-4400':
+        query_params['AVERAGE RENT'] = ('between', 3600, 4400)
+    elif price_range == '> 4400':
+        query_params['AVERAGE RENT'] = ('>', 4400)
+
+    # Handling Pet Policy:
+    if pet_policy == 'Yes':
+        query_params['IF_PETS_ALLOWED'] = ('==', 'Allowed')
+    elif pet_policy == 'No':
+        query_params['IF_PETS_ALLOWED'] = ('==', 'Not Allowed')
+
+    # Filter only for valid facility choices (skip "Not to matter")
+    facilities = [facility for facility in facilities if facility != 'Not to matter']
+
+    if crime_level != 'Not to matter':
+        query_params['Safety_level'] = ('==', crime_level)
 
     return query_params, facilities
 
@@ -5,8 +5,9 @@
 # It fetches data from multiple sources (e.g., facilities, shooting incidents), processes apartment data,
 # merges datasets, applies user-defined filters, and saves the final recommendation list to a CSV file.
 # It imports modules like `facilities_crawler`, `shooting_crawler`, `apartment_crawler`, `processing_zillow`, 
-# `merger`, `interactive_page`, and `data_filter`. The file also imports configuration constants from `config.py`.
+# `dedup`, `rent_history`, `merger`, `interactive_page`, and `data_filter`. The file also imports configuration constants from `config.py`.
 # This script should be run to perform the full end-to-end apartment recommendation process.
+# Every step is measured (see `profiling.py`) and a JSON run report is written when the run ends.
 
 from config import *
 import pandas as pd
@@ -16,47 +17,91 @@ import shooting_crawler
 import apartment_crawler
 
 import processing_zillow
+import dedup
+from rent_history import RentHistory
 import merger
 import interactive_page
 import data_filter 
+import storage
+import profiling
 
 
 # %%
 def main():
+    profiling.start_run('pipeline')
+    try:
+        run_pipeline()
+    finally:
+        # Written even if a step failed, so the report shows where the time went up to that point
+        profiling.save_report()
+
+
+def run_pipeline():
+    # Ask every crawler's question up front, so the timed stages below do not include waiting for answers
+    use_predownloaded_facilities = facilities_crawler.ask_use_predownloaded()
+    use_predownloaded_shootings = shooting_crawler.ask_use_predownloaded()
+    use_predownloaded_apartments = apartment_crawler.ask_use_predownloaded()
+
     # Step 0: Download source data
     print("Running facilities crawler...")
-    facilities_crawler.run_crawler()
+    with profiling.stage('facilities crawler'):
+        facilities_crawler.run_crawler(use_predownloaded_facilities)
     
     print("Running shooting data crawler...")
-    shooting_crawler.run_crawler()
+    with profiling.stage('shooting crawler'):
+        shooting_crawler.run_crawler(use_predownloaded_shootings)
 
     # Step 1: Load the raw apartment data
     print("Scraping apartment data...")
-    apartment_df = apartment_crawler.scrape_apartment_data()
+    with profiling.stage('apartment crawler') as record:
+        apartment_df = apartment_crawler.scrape_apartment_data(use_predownloaded=use_predownloaded_apartments)
+        record.rows_out = len(apartment_df)
     
     # Step 2: Process the apartment data
     print("Processing apartment data...")
-    processed_apartment_data = processing_zillow.process_apartment_data(apartment_df)
+    with profiling.stage('process apartments', rows_in=len(apartment_df)) as record:
+        processed_apartment_data = processing_zillow.process_apartment_data(apartment_df)
+        record.rows_out = len(processed_apartment_data)
+
+    # Drop duplicate listings (address spelling variants of the same building) before they are stored
+    print("Removing duplicate listings...")
+    with profiling.stage('deduplicate', rows_in=len(processed_apartment_data)) as record:
+        processed_apartment_data = dedup.deduplicate_listings(processed_apartment_data)
+        record.rows_out = len(processed_apartment_data)
 
     # Step 3: Save the processed apartment data to the processed folder
     print("Saving processed apartment data...")
-    processed_apartment_data.to_csv(PROCESSED_APARTMENT_DATA_PATH, index=False)
+    with profiling.stage('save processed', rows_in=len(processed_apartment_data)):
+        storage.save_stage(processed_apartment_data, 'processed')
+
+    # The processed stage is overwritten on every run, so keep the snapshot in the rent history too
+    print("Recording rent history...")
+    with profiling.stage('rent history', rows_in=len(processed_apartment_data)):
+        RentHistory().append(processed_apartment_data)
 
     # Step 4: Merge the processed apartment data with facilities and shooting data
     print("Merging datasets...")
-    merger.merge_datasets_with_pivot()
+    with profiling.stage('merge'):
+        merger.merge_datasets_with_pivot()
 
-    # Step 5: Collect user preferences
+    # Step 5: Collect user preferences (not timed; it waits for the user)
     print("Collecting user preferences...")
     query_params, facilities = interactive_page.collect_preferences()
 
-    # Step 6: Filter the data based on user input
-    print("Filtering the dataset...")
-    filtered_df = data_filter.filter_dataframe(query_params, facilities)
+    # Step 6: Filter or rank the data based on user input
+    with profiling.stage(f'recommend ({RECOMMENDATION_MODE})') as record:
+        if RECOMMENDATION_MODE == 'rank':
+            print("Ranking the dataset...")
+            filtered_df = data_filter.rank_dataframe(query_params, facilities)
+        else:
+            print("Filtering the dataset...")
+            filtered_df = data_filter.filter_dataframe(query_params, facilities)
+        record.rows_out = len(filtered_df)
     
     # Step 7: Save the filtered data with a timestamp
     print("Saving filtered dataset...")
-    data_filter.to_csv_with_timestamp(filtered_df)
+    with profiling.stage('save recommendations', rows_in=len(filtered_df)):
+        data_filter.to_csv_with_timestamp(filtered_df)
 
 if __name__ == "__main__":
     main()
@@ -1,89 +1,115 @@
 #%%
-# File: interactive_page.py
+# File: merger.py
 # Group members: rivenl, leylal, chengkac, bangminp
 
-# This script collects user preferences for apartment searches and filters data based on the input.
-# The user is prompted to enter their preferred borough, price range, pet policy, school grade,
-# desired nearby facilities, and crime safety level. 
-# The collected preferences are then stored in `query_params` and `facilities` for filtering the dataset later.
+# This script merges the processed apartment data with facilities and shooting data.
+# Each apartment is geocoded offline (see `geocoder.py`), and the facilities around its coordinates are
+# counted exactly with grid indexes (see `facility_features.py`), giving the facilities of each type or
+# group in the catalog (see `facility_catalog.py`) within every radius of `FACILITY_RADII_METERS`.
+# The safety level comes from the local shooting incident density (see `crime_density.py`).
+# The merged dataset is saved as the 'merged' stage (see `storage.py`) for filtering the dataset later.
+# The lookup tables live in an `ApartmentEnricher`, so `streaming.py` can build them once and reuse them
+# for every chunk of apartments.
 
 
 import pandas as pd
-import numpy as np
 import sys
 sys.path.append('./')  # Add current directory to sys.path
-from config import PROCESSED_APARTMENT_DATA_PATH, FACILITIES_DATA_PATH, SHOOTING_DATA_PATH, MERGED_DATA_PATH
+from config import FACILITY_RADIUS_METERS, FACILITY_RADII_METERS
+import storage
+import profiling
+from profiling import profiled
+from facilities_crawler import load_facilities
+from crime_density import load_crime_surface
+from facility_features import load_facility_counts
+from facility_catalog import FacilityCatalog
+from geocoder import AddressPoints, Geocoder
+
+
+class ApartmentEnricher:
+    """
+    Lookup tables built once from the facilities and shooting data, used to enrich any number of
+    apartment batches (the whole processed stage, or chunks of it in `streaming.py`).
+
+    :param geocoder: Geocoder placing apartment addresses (see `geocoder.py`).
+    :param catalog: FacilityCatalog naming the facility count columns.
+    :param facility_counts: FacilityCounts indexes over the facilities in `catalog`.
+    :param crime_surface: CrimeSurface from `crime_density.load_crime_surface`.
+    """
+
+    def __init__(self, geocoder, catalog, facility_counts, crime_surface):
+        self.geocoder = geocoder
+        self.catalog = catalog
+        self.facility_counts = facility_counts
+        self.crime_surface = crime_surface
+
+    @classmethod
+    @profiled('merge: build lookup tables')
+    def from_sources(cls, facilities_path=None):
+        """Build the lookup tables from the downloaded facilities and shooting data."""
+        # Load the compact facilities table (parsed from the archive only when it changed)
+        facilities_data = load_facilities(facilities_path)
+        print(f"Facilities data loaded with shape: {facilities_data.shape}")
+
+        # Every facility is an address point, so apartments near any type of facility can be placed
+        geocoder = Geocoder(AddressPoints(facilities_data))
+
+        # Map every facility to the catalog columns it counts towards (its type and its group)
+        catalog = FacilityCatalog.from_facilities(facilities_data)
+        points = catalog.points(facilities_data)
+        print(f"{len(points)} facility points counted in {len(catalog.columns)} catalog columns\n")
+        facility_counts = load_facility_counts(points)
+
+        return cls(geocoder, catalog, facility_counts, load_crime_surface())
+
+    @profiled('merge: enrich')
+    def enrich(self, apartment_data):
+        """
+        Add coordinates, nearby facility counts, crime score and safety level to processed apartments.
+        :param apartment_data: Processed apartment data (columns as written by `processing_zillow.py`).
+        """
+        # Ensure consistent naming for 'BORO' across all datasets
+        apartment_data = apartment_data.rename(columns=str.upper)
+
+        # Step 1: Apartments only carry an address, so geocode it (cached addresses are not resolved again)
+        located = self.geocoder.geocode(apartment_data['ADDRESS'])
+        apartment_data = pd.concat([apartment_data, located.set_index(apartment_data.index)], axis=1)
+
+        # Step 2: Count nearby facilities around each apartment's coordinates, with the indexes built once
+        # The plain catalog columns hold the counts within FACILITY_RADIUS_METERS, the others are suffixed
+        facility_counts = []
+        for radius in [FACILITY_RADIUS_METERS] + [r for r in FACILITY_RADII_METERS if r != FACILITY_RADIUS_METERS]:
+            counts = self.facility_counts.count_frame(apartment_data['LATITUDE'], apartment_data['LONGITUDE'],
+                                                      radius, categories=self.catalog.columns)
+            counts.columns = self.catalog.column_names(radius)
+            facility_counts.append(counts)
+        final_data = pd.concat([apartment_data.reset_index(drop=True)] + facility_counts, axis=1)
+
+        # Step 3: Score crime density around each apartment (one array lookup per apartment)
+        final_data['CRIME_SCORE'] = self.crime_surface.score(final_data['LATITUDE'], final_data['LONGITUDE'])
+        final_data['Safety_level'] = self.crime_surface.safety_level(final_data['CRIME_SCORE'].to_numpy())
+        return final_data
+
 
 def merge_datasets_with_pivot():
-    """Merge processed apartment data with facilities and shooting data, and create a pivot table."""
+    """Merge processed apartment data with nearby facility counts and a crime density score."""
 
     # Load the processed apartment data
-    apartment_data = pd.read_csv(PROCESSED_APARTMENT_DATA_PATH)
+    with profiling.stage('merge: load processed') as record:
+        apartment_data = storage.load_stage('processed')
+        record.rows_out = len(apartment_data)
     print(f"Apartment data loaded with shape: {apartment_data.shape}\n")
 
-    # Load and filter facilities data
-    facilities_data = pd.read_csv(FACILITIES_DATA_PATH, usecols=['FACTYPE', 'BORO'])
-    print(f"Facilities data loaded with shape: {facilities_data.shape}")
-
-    # Filter based on FACTYPE
-    valid_factypes = ['BUS STATION', 'MUSEUM', 'COMMERCIAL GARAGE AND PARKING LOT', 'PUBLIC LIBRARY']
-    facilities_data = facilities_data[facilities_data['FACTYPE'].isin(valid_factypes)]
-    print(f"Facilities data shape after filtering: {facilities_data.shape}\n")
-
-    # Step 1: Merge Property and Facility Data
-    # Ensure consistent naming for 'BORO' across all datasets
-    apartment_data.columns = apartment_data.columns.str.upper()
-    facilities_data.columns = facilities_data.columns.str.upper()
-    print("Column names standardized.\n")
-
-    # Merge apartment data with facilities data on 'BORO'
-    merged_apartment_facilities = pd.merge(apartment_data, facilities_data, on='BORO', how='left')
-    print(f"Merged data shape: {merged_apartment_facilities.shape}\n")
-
-    # Step 2 Pivot Facility Data to return to 119 rows
-    # Index by apartment address
-    print("Creating pivot table from merged data...")
-    pivot_table = pd.pivot_table(
-        merged_apartment_facilities,
-        index=['ADDRESS'],
-        columns='FACTYPE',
-        aggfunc='size',
-        fill_value=0
-    ).reset_index()
-    print(f"Pivot table created with shape: {pivot_table.shape}\n")
-
-    # Merge the pivot table back to the apartment data
-    final_data = pd.merge(apartment_data, pivot_table, on='ADDRESS', how='left')
-    print(f"Final data shape after merging with pivot table: {final_data.shape}\n")
-
-    # Fill NaN values with zeros for facility counts
-    facility_columns = valid_factypes
-    final_data[facility_columns] = final_data[facility_columns].fillna(0)
-
-    # Step 3 Merge with Shooting Incident Data
-    shooting_data = pd.read_csv(SHOOTING_DATA_PATH, usecols=['boro'])
-    print(f"Shooting data loaded with shape: {shooting_data.shape}\n")
-    shooting_data.columns = shooting_data.columns.str.upper()
-
-    # Merge apartment data with shooting data on 'BORO'
-    final_data = pd.merge(final_data, shooting_data.drop_duplicates(), on='BORO', how='left', indicator=True)
-    print(f"Final data shape after merging with shooting data: {final_data.shape}\n")
-
-    # Add Safety_level column based on BORO
-    conditions = [
-        (final_data['BORO'] == 'BROOKLYN'),
-        (final_data['BORO'] == 'QUEENS'),
-        (final_data['BORO'] == 'BRONX'),
-        (final_data['BORO'] == 'MANHATTAN')
-    ]
-
-    # Values to assign for each condition
-    values = ['Caution Advised', 'Relatively Safe', 'Relatively Safe', 'Very Safe']
-
-    # Create the new column 'Safety_level' using np.select
-    final_data['Safety_level'] = np.select(conditions, values, default='Unknown')
-    print("'Safety_level' column added.\n")
+    # Build the facility and crime lookup tables, then enrich every apartment with them
+    enricher = ApartmentEnricher.from_sources()
+    print(f"Looking up facility counts within {FACILITY_RADII_METERS} meters of each apartment...")
+    final_data = enricher.enrich(apartment_data)
+    enricher.geocoder.save()
+    enricher.geocoder.report(final_data)
+    enricher.catalog.save()
+    print(f"Final data shape after adding facility counts and safety level: {final_data.shape}\n")
 
     # Save the final merged dataset
-    final_data.to_csv(MERGED_DATA_PATH, index=False)
+    with profiling.stage('merge: save', rows_in=len(final_data)):
+        storage.save_stage(final_data, 'merged')
     print("Final merged dataset saved successfully.")
@@ -5,81 +5,129 @@
 # This script processes apartment raw data scraped from Zillow. It includes functions to clean the data,
 # extract useful information like ZIP code, city, and borough, and calculate average rent.
 # It also handles pet policy information and outputs a cleaned DataFrame with necessary columns for further analysis.
+# Every step works on whole columns: boroughs come from a ZIP code lookup array, rents are parsed with one
+# regular expression into minimum/maximum/average columns, and the pet policy is a combination of boolean masks.
 
 
+import numpy as np
 import pandas as pd
 
+# Define boroughs and their corresponding ZIP code ranges
+# (earlier boroughs win where ranges overlap, e.g. 11201-11256 is Brooklyn, not Queens)
+boroughs = {
+    "MANHATTAN": range(10001, 10283),
+    "BROOKLYN": range(11201, 11257),
+    "QUEENS": list(range(11001, 11437)) + list(range(11691, 11698)),
+    "BRONX": range(10451, 10476),
+    "STATEN ISLAND": range(10301, 10315)
+}
+
+BOROUGH_NAMES = np.array(list(boroughs) + ['Unknown'], dtype=object)
+
+
+def build_borough_lookup(boroughs):
+    """Array mapping every ZIP code up to the largest one listed to an index into `BOROUGH_NAMES`."""
+    lookup = np.full(max(max(zip_range) for zip_range in boroughs.values()) + 1, len(boroughs), dtype=np.int8)
+    for code, zip_range in reversed(list(enumerate(boroughs.values()))):
+        lookup[list(zip_range)] = code
+    return lookup
+
+
+BOROUGH_LOOKUP = build_borough_lookup(boroughs)
+
+# A rent is one amount or a range of two, after removing '$', '/mo', ',' and '+'
+RENT_PATTERN = r'\s*\d+\s*(-\s*\d+\s*)?'
+
+PET_POLICY_COLUMNS = ['Dogs Policy', 'Cats Policy', 'Large Dogs Policy', 'Small Dogs Policy']
+
+
+def to_numbers(text, pattern):
+    """Numeric value of each string that fully matches `pattern`; NaN for the rest."""
+    text = text.astype('str')
+    return text.where(text.str.fullmatch(pattern).fillna(False)).str.strip().astype('float64')
+
+
+def find_boroughs(zip_codes):
+    """Borough name of each ZIP code string; 'Unknown' if it is not a number or not in NYC."""
+    numbers = to_numbers(zip_codes, r'\s*[+-]?\d+\s*').to_numpy()
+    known = (numbers >= 0) & (numbers < len(BOROUGH_LOOKUP))
+    codes = np.full(len(numbers), len(BOROUGH_NAMES) - 1, dtype=np.int8)
+    codes[known] = BOROUGH_LOOKUP[numbers[known].astype(np.int64)]
+    return pd.Series(BOROUGH_NAMES[codes], index=zip_codes.index, dtype='str')
+
+
+def extract_city(addresses):
+    """Text between the first and second comma of each address, stripped; NaN without a comma."""
+    addresses = addresses.astype('str')
+    city = addresses.str.replace(r'(?s)^[^,]*,([^,]*).*$', r'\1', regex=True).str.strip()
+    return city.where(addresses.str.contains(',', regex=False).fillna(False)).astype(object)
+
+
+def parse_rents(rents):
+    """
+    Parse rent strings such as '$2,500/mo' or '$2,500-$3,000/mo'.
+    :return: DataFrame with 'Min Rent', 'Max Rent' and 'Average Rent'; NaN where the rent cannot be read.
+    """
+    if rents.dtype == object:
+        rents = rents.where(rents.map(lambda value: isinstance(value, str)))  # Only text is parsed
+    cleaned = (rents.astype('str')
+               .str.replace('$', '', regex=False).str.replace('/mo', '', regex=False)
+               .str.replace(',', '', regex=False).str.replace('+', '', regex=False))
+    cleaned = cleaned.where(cleaned.str.fullmatch(RENT_PATTERN).fillna(False))
+
+    # Valid rents hold at most one '-', so the parts before and after it are plain numbers
+    low = cleaned.str.replace(r'-.*$', '', regex=True).str.strip().astype('float64')
+    high = cleaned.str.replace(r'^.*-', '', regex=True).str.strip().astype('float64')
+    return pd.DataFrame({'Min Rent': low, 'Max Rent': high, 'Average Rent': (low + high) / 2})
+
+
+def contains_text(column, text):
+    """Whether `text` appears in each value as printed by `str()` (so None reads as 'None')."""
+    found = column.astype('str').str.contains(text, regex=False).fillna(False).to_numpy(dtype=bool)
+    if text in 'None':
+        found = found | np.equal(column.to_numpy(dtype=object), None)
+    return found
+
+
+def process_pet_policies(df):
+    """'Allowed', 'Not Allowed' or 'N/A' for each listing, from the pet policy columns."""
+    allowed = np.logical_or.reduce([contains_text(df[column], 'Allowed') for column in PET_POLICY_COLUMNS])
+    not_allowed = np.logical_or.reduce([contains_text(df[column], 'Not allowed') for column in PET_POLICY_COLUMNS])
+    answer_yes = contains_text(df['Pets Allowed'], 'Yes')
+    answer_no = contains_text(df['Pets Allowed'], 'No')
+
+    # Checked in order: an explicit policy or a 'Yes' wins over a refusal
+    policy = np.select([allowed | answer_yes, not_allowed | answer_no], ['Allowed', 'Not Allowed'], 'N/A')
+    return pd.Series(policy, index=df.index, dtype='str')
+
 
 def process_apartment_data(df):
     # Drop rows where 'Address' is NaN
     df = df.dropna(subset=['Address'])
 
+    # Listings that disappeared from the search pages only stay in the raw snapshot
+    if 'Listing Status' in df.columns:
+        df = df[df['Listing Status'] != 'Removed']
+
     # Extract the ZIP code (last 5 characters in 'Address')
     df['ZIP Code'] = df['Address'].str[-5:]
 
     # Extract the city name (string between the first and second comma)
-    df['City'] = df['Address'].str.split(',').str[1].str.strip()
-
-    # Define boroughs and their corresponding ZIP code ranges
-    boroughs = {
-        "MANHATTAN": range(10001, 10283),
-        "BROOKLYN": range(11201, 11257),
-        "QUEENS": list(range(11001, 11437)) + list(range(11691, 11698)),
-        "BRONX": range(10451, 10476),
-        "STATEN ISLAND": range(10301, 10315)
-    }
-
-    # Function to determine borough based on ZIP code
-    def find_borough(zip_code):
-        try:
-            zip_code = int(zip_code)  # Convert ZIP code to integer
-            for borough, zip_range in boroughs.items():
-                if zip_code in zip_range:
-                    return borough
-        except ValueError:
-            return "Unknown"
-        return "Unknown"
-
-    # Apply the find_borough function to create the BORO column
-    df['BORO'] = df['ZIP Code'].apply(find_borough)
-
-    def calculate_average_rent(rent):
-        if pd.isna(rent) or not isinstance(rent, str):
-            return None
-
-        # Remove any dollar signs, commas, /mo, and split the range
-        rent_range = rent.replace('$', '').replace('/mo', '').replace(',', '').replace('+', '').split('-')
-
-        # Handle case where the rent contains non-numeric values (like 'N/A')
-        try:
-            if len(rent_range) == 2:  # If it's a range, calculate the average
-                average_rent = (int(rent_range[0].strip()) + int(rent_range[1].strip())) / 2
-                return average_rent
-            elif len(rent_range) == 1:  # If it's a single value, return it as an integer
-                return int(rent_range[0].strip())
-        except ValueError:
-            # Return None if there's any issue converting to int (e.g., if rent is 'N/A')
-            return None
-
-        return None
-
-    df['Average Rent'] = df['Rent'].apply(calculate_average_rent)
-
-    def process_pet_policy(row):
-        if 'Allowed' in str(row['Dogs Policy']) or 'Allowed' in str(row['Cats Policy']) or 'Allowed' in str(row['Large Dogs Policy']) or 'Allowed' in str(row['Small Dogs Policy']):
-            return 'Allowed'
-        elif 'Yes' in str(row['Pets Allowed']):
-            return 'Allowed'
-        elif 'Not allowed' in str(row['Dogs Policy']) or 'Not allowed' in str(row['Cats Policy']) or 'Not allowed' in str(row['Large Dogs Policy']) or 'Not allowed' in str(row['Small Dogs Policy']):
-            return 'Not Allowed'
-        elif 'No' in str(row['Pets Allowed']):
-            return 'Not Allowed'
-        else:
-            return 'N/A'
-
-    df['If_Pets_Allowed'] = df.apply(process_pet_policy, axis=1)
+    df['City'] = extract_city(df['Address'])
+
+    # Look up the borough of each ZIP code to create the BORO column
+    df['BORO'] = find_boroughs(df['ZIP Code'])
+
+    # Parse rents into numbers; a range is averaged
+    rents = parse_rents(df['Rent'])
+    df['Min Rent'] = rents['Min Rent']
+    df['Max Rent'] = rents['Max Rent']
+    df['Average Rent'] = rents['Average Rent']
+
+    df['If_Pets_Allowed'] = process_pet_policies(df)
 
     # Explicitly assigning the result to avoid the view vs. copy warning
     df = df.drop(columns=['Dogs Policy', 'Cats Policy', 'Large Dogs Policy', 'Small Dogs Policy', 'Pets Allowed'])
+    df = df.drop(columns=['Card Name', 'Card Price', 'Listing Status'], errors='ignore')
 
     return df
@@ -0,0 +1,279 @@
+#%%
+# File: profiling.py
+# Group members: rivenl, leylal, chengkac, bangminp
+
+# This file instruments the pipeline. A stage is a block of code wrapped in `with stage('name'):` or a
+# function decorated with `@profiled('name')`; for each stage it records wall time, CPU time, peak
+# resident memory, rows in and out, and the HTTP requests made (with cache hits and bytes received).
+# Stages may be nested (a crawler step inside a pipeline step); HTTP traffic from worker threads is
+# counted towards the stages open while it happens.
+# At the end of a run `save_report` writes all stages to a JSON file in `PROFILE_REPORT_DIR` and prints
+# a summary, so two runs can be compared stage by stage. With `PROFILE_CPROFILE` set, every top-level
+# stage is also run under cProfile and its statistics are dumped next to the report.
+# Peak memory is measured per stage on Linux (the kernel's high-water mark is reset when a stage starts);
+# elsewhere the peak of the whole process so far is recorded.
+
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from config import PROFILE_REPORT_DIR, PROFILE_CPROFILE
+import timestamp
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_STATUS_PATH = '/proc/self/status'
+_CLEAR_REFS_PATH = '/proc/self/clear_refs'
+
+
+def current_peak_rss():
+    """Peak resident memory in MB since the last reset (Linux) or since the process started."""
+    if os.path.exists(_STATUS_PATH):
+        with open(_STATUS_PATH) as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024  # Bytes on macOS, KB elsewhere
+    return None
+
+
+def reset_peak_rss():
+    """Start a new peak memory measurement; returns False where that is not possible."""
+    try:
+        with open(_CLEAR_REFS_PATH, 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class HttpCounter:
+    """Thread-safe running totals of HTTP traffic."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.cache_hits = 0
+        self.bytes = 0
+
+    def add(self, nbytes=0, from_cache=False):
+        with self.lock:
+            self.requests += 1
+            self.cache_hits += bool(from_cache)
+            self.bytes += nbytes
+
+    def add_totals(self, requests=0, cache_hits=0, nbytes=0):
+        """Fold in traffic counted elsewhere, e.g. by a worker process."""
+        with self.lock:
+            self.requests += requests
+            self.cache_hits += cache_hits
+            self.bytes += nbytes
+
+    def totals(self):
+        with self.lock:
+            return self.requests, self.cache_hits, self.bytes
+
+
+class StageRecord:
+    """Measurements of one stage; set `rows_in` / `rows_out` when they are not inferred."""
+
+    def __init__(self, name, depth, rows_in=None):
+        self.name = name
+        self.depth = depth
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        self.peak_rss_mb = None
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.http_requests = 0
+        self.http_cache_hits = 0
+        self.http_bytes = 0
+        self.profile_path = None
+        self.error = None
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class RunProfile:
+    """
+    Stage records of one pipeline run.
+
+    :param name: Name of the run, used for the report file.
+    :param cprofile: Also run top-level stages under cProfile.
+    """
+
+    def __init__(self, name='pipeline', cprofile=PROFILE_CPROFILE):
+        self.name = name
+        self.cprofile = cprofile
+        self.started = time.time()
+        self.stamp = timestamp.generate_timestamp()
+        self.records = []
+        self.http = HttpCounter()
+        self._open = []  # Stages currently running, outermost first
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """Measure the enclosed block as stage `name`; yields its `StageRecord`."""
+        with self._lock:
+            record = StageRecord(name, len(self._open), rows_in)
+            # The high-water mark is about to be reset, so open stages keep the peak they saw so far
+            peak = current_peak_rss()
+            for outer in self._open:
+                outer.peak_rss_mb = max(filter(None, [outer.peak_rss_mb, peak]), default=None)
+            reset_peak_rss()
+            self._open.append(record)
+            self.records.append(record)
+
+        profiler = cProfile.Profile() if self.cprofile and record.depth == 0 else None
+        http_start = self.http.totals()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        except BaseException as e:
+            record.error = repr(e)
+            raise
+        finally:
+            if profiler:
+                profiler.disable()
+            record.wall_seconds = round(time.perf_counter() - wall_start, 4)
+            record.cpu_seconds = round(time.process_time() - cpu_start, 4)
+            requests, cache_hits, nbytes = (end - start for end, start in zip(self.http.totals(), http_start))
+            record.http_requests, record.http_cache_hits, record.http_bytes = requests, cache_hits, nbytes
+
+            with self._lock:
+                peak = current_peak_rss()
+                self._open.remove(record)
+                for measured in self._open + [record]:
+                    measured.peak_rss_mb = max(filter(None, [measured.peak_rss_mb, peak]), default=None)
+                if record.peak_rss_mb is not None:
+                    record.peak_rss_mb = round(record.peak_rss_mb, 1)
+            if profiler:
+                record.profile_path = self.dump_profile(profiler, name)
+
+    def dump_profile(self, profiler, name):
+        """Write cProfile statistics of a stage next to the report; returns the file path."""
+        os.makedirs(PROFILE_REPORT_DIR, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', name).strip('_').lower()
+        path = os.path.join(PROFILE_REPORT_DIR, f"{self.file_stem()}-{len(self.records):02d}-{slug}.prof")
+        profiler.dump_stats(path)
+        return path
+
+    def file_stem(self):
+        return f"{self.name}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started))}"
+
+    def report(self):
+        """The run report as a JSON-serializable dictionary."""
+        return {
+            'run': self.name,
+            'started': self.stamp,
+            'wall_seconds': round(time.time() - self.started, 4),
+            'python': sys.version.split()[0],
+            'stages': [record.as_dict() for record in self.records],
+        }
+
+    def save_report(self, path=None):
+        """Write the run report as JSON, print a summary and return the file path."""
+        path = path or os.path.join(PROFILE_REPORT_DIR, f"{self.file_stem()}.json")
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        report = self.report()
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print_summary(report)
+        print(f"Run report saved to {path}")
+        return path
+
+
+def print_summary(report):
+    """Print one line per stage of a run report."""
+    print(f"{'stage':<40} {'wall (s)':>9} {'cpu (s)':>9} {'peak MB':>9} {'rows in':>9} {'rows out':>9} "
+          f"{'http':>6} {'MB in':>8}")
+    for record in report['stages']:
+        label = '  ' * record['depth'] + record['name']
+        print(f"{label:<40} {record['wall_seconds']:>9.2f} {record['cpu_seconds']:>9.2f} "
+              f"{record['peak_rss_mb'] or 0:>9.0f} {_count(record['rows_in']):>9} {_count(record['rows_out']):>9} "
+              f"{record['http_requests']:>6} {record['http_bytes'] / 1024 ** 2:>8.1f}")
+
+
+def _count(rows):
+    return '-' if rows is None else rows
+
+
+# The run that `stage`, `profiled` and `record_http` report to
+_run = RunProfile()
+
+
+def start_run(name='pipeline', cprofile=PROFILE_CPROFILE):
+    """Begin a new run report; stages recorded so far are dropped."""
+    global _run
+    _run = RunProfile(name, cprofile)
+    return _run
+
+
+def current_run():
+    return _run
+
+
+def stage(name, rows_in=None):
+    """Context manager measuring the enclosed block as a stage of the current run."""
+    return _run.stage(name, rows_in)
+
+
+def _rows(value):
+    """Number of rows of a DataFrame or list, or None."""
+    return len(value) if isinstance(value, (list, tuple)) or hasattr(value, 'shape') else None
+
+
+def profiled(name=None):
+    """
+    Decorator measuring every call of a function as a stage.
+    Rows in are taken from the first DataFrame (or list) argument, rows out from a DataFrame (or list) result.
+    """
+    def decorate(func):
+        stage_name = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            rows_in = next((rows for rows in map(_rows, args) if rows is not None), None)
+            with stage(stage_name, rows_in) as record:
+                result = func(*args, **kwargs)
+                if record.rows_out is None:
+                    record.rows_out = _rows(result)
+                return result
+        return wrapper
+    return decorate
+
+
+def record_http(nbytes=0, from_cache=False):
+    """Count one HTTP response (called by the HTTP adapters)."""
+    _run.http.add(nbytes, from_cache)
+
+
+def content_length(response):
+    """Body size announced by a response, or 0."""
+    try:
+        return int(response.headers.get('Content-Length', 0))
+    except ValueError:
+        return 0
+
+
+def count_response(response, *args, **kwargs):
+    """`requests` response hook counting responses of sessions without the response cache."""
+    record_http(content_length(response), getattr(response, 'from_cache', False))
+
+
+def save_report(path=None):
+    return _run.save_report(path)
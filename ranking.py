@@ -0,0 +1,130 @@
+#%%
+# File: ranking.py
+# Group members: rivenl, leylal, chengkac, bangminp
+
+# This file ranks apartments instead of only filtering them. Each preference collected by
+# `interactive_page.py` becomes a soft score between 0 and 1 (rent fit, borough, pet policy, safety,
+# nearby facilities and school ratings), and the weighted sum of those scores orders the apartments.
+# The per-apartment features are computed once when a `Ranker` is built, so a query is a handful of
+# float32 NumPy array operations, and only the best `top_k` apartments are selected with `np.argpartition`
+# (a full sort of the dataset is never done). Weights come from `RANKING_WEIGHTS` in `config.py`.
+
+import numpy as np
+import pandas as pd
+from config import RANKING_WEIGHTS, RANKING_RENT_TOLERANCE, RANKING_TOP_K
+from filter_engine import BASE_COLUMNS, RANGE_COLUMN, CategoryCodes, range_bounds
+from facility_catalog import load_catalog
+
+SCHOOL_RANK_COLUMNS = ['RANK_1', 'RANK_2', 'RANK_3']
+PET_SCORES = {'Allowed': 1.0, 'N/A': 0.5, 'Not Allowed': 0.0}
+
+
+def scaled_counts(counts):
+    """Scale counts to [0, 1] by their 95th percentile, so a few dense areas do not flatten the rest."""
+    counts = np.nan_to_num(np.asarray(counts, dtype=np.float32))
+    top = np.percentile(counts, 95) if len(counts) else 0
+    return np.clip(counts / np.float32(top), 0, 1) if top > 0 else np.zeros(len(counts), dtype=np.float32)
+
+
+def school_ratings(df):
+    """Mean GreatSchools rating (out of 10) of the listed schools, scaled to [0, 1]; 0 without schools."""
+    columns = [column for column in SCHOOL_RANK_COLUMNS if column in df.columns]
+    if not columns:
+        return np.zeros(len(df), dtype=np.float32)
+    # Ratings are stored as numbers or as scraped text such as '7/10'
+    ratings = pd.concat([pd.to_numeric(df[column].astype('string').str.extract(r'(\d+(?:\.\d+)?)')[0], errors='coerce')
+                         for column in columns], axis=1)
+    return np.nan_to_num(ratings.mean(axis=1).to_numpy(dtype=np.float32) / 10)
+
+
+def top_k(scores, k):
+    """Indices of the `k` highest scores, best first, selected without sorting every score."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best], kind='stable')]
+
+
+class Ranker:
+    """
+    Weighted preference scoring over the merged dataset.
+
+    :param df: Merged apartment DataFrame (as stored by the 'merged' stage).
+    :param weights: Weight of each score; defaults to `RANKING_WEIGHTS`.
+    """
+
+    def __init__(self, df, weights=None):
+        self.df = df.reset_index(drop=True)
+        self.weights = dict(RANKING_WEIGHTS if weights is None else weights)
+
+        self.rent = self.df[RANGE_COLUMN].to_numpy(dtype=np.float32)
+        self.boro = CategoryCodes(self.df['BORO'])
+        self.safety_level = CategoryCodes(self.df['Safety_level'])
+        self.pets = self.df['IF_PETS_ALLOWED'].map(PET_SCORES).to_numpy(dtype=np.float32, na_value=0.5)
+
+        # Low crime density is better; rank-based so the score does not depend on the density scale
+        crime = self.df['CRIME_SCORE'].to_numpy(dtype=float) if 'CRIME_SCORE' in self.df else np.full(len(self.df), np.nan)
+        self.safety = np.where(np.isnan(crime), 0.5, 1 - pd.Series(crime).rank(pct=True).to_numpy()).astype(np.float32)
+
+        # Facility count columns named in the catalog (see `facility_catalog.py`)
+        self.facilities = {column: scaled_counts(self.df[column]) for column in load_catalog().columns
+                           if column in self.df}
+        self.schools = school_ratings(self.df)
+
+    def __len__(self):
+        return len(self.df)
+
+    def rent_fit(self, condition):
+        """1 inside the preferred rent range, falling linearly to 0 at `RANKING_RENT_TOLERANCE` dollars outside it."""
+        low, _, high, _ = range_bounds(condition)
+        # Distance to the preferred range; apartments without a rent score 0
+        distance = np.zeros(len(self.rent), dtype=np.float32)
+        if low is not None:
+            np.fmax(distance, np.float32(low) - self.rent, out=distance)
+        if high is not None:
+            np.fmax(distance, self.rent - np.float32(high), out=distance)
+        distance[np.isnan(self.rent)] = RANKING_RENT_TOLERANCE
+        return np.clip(1 - distance / np.float32(RANKING_RENT_TOLERANCE), 0, 1)
+
+    def scores(self, query_params, facilities=None):
+        """
+        Preference score of every apartment.
+        :param query_params: Preferences in the `interactive_page.collect_preferences` format.
+        :param facilities: Facility columns the user wants nearby; all facility types if empty.
+        """
+        terms = {}
+        if query_params.get(RANGE_COLUMN):
+            terms['rent'] = self.rent_fit(query_params[RANGE_COLUMN])
+        if query_params.get('BORO'):
+            terms['boro'] = self.boro.codes == self.boro.code_of(query_params['BORO'][1])
+        if query_params.get('IF_PETS_ALLOWED'):
+            wants_pets = query_params['IF_PETS_ALLOWED'][1] == 'Allowed'
+            terms['pets'] = self.pets if wants_pets else 1 - self.pets
+        if query_params.get('Safety_level'):
+            terms['safety'] = self.safety_level.codes == self.safety_level.code_of(query_params['Safety_level'][1])
+        else:
+            terms['safety'] = self.safety
+
+        wanted = [column for column in (facilities or self.facilities) if column in self.facilities]
+        if wanted:
+            terms['facilities'] = sum(self.facilities[column] for column in wanted) / len(wanted)
+        terms['schools'] = self.schools
+
+        total = np.zeros(len(self.df), dtype=np.float32)
+        for name, term in terms.items():
+            weight = np.float32(self.weights.get(name, 0))
+            if term.dtype == bool:
+                total[term] += weight  # Matches add the full weight
+            else:
+                total += weight * term
+        return total
+
+    def rank(self, query_params, facilities=None, k=RANKING_TOP_K):
+        """The `k` best apartments, best first, with their score in a 'SCORE' column."""
+        scores = self.scores(query_params, facilities)
+        best = top_k(scores, k)
+        result = self.df.take(best)
+        if facilities:
+            result = result[BASE_COLUMNS + list(facilities)]
+        return result.assign(SCORE=scores[best])
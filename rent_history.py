@@ -0,0 +1,238 @@
+#%%
+# File: rent_history.py
+# Group members: rivenl, leylal, chengkac, bangminp
+
+# This file keeps the rent history that every pipeline run used to overwrite. Each processed snapshot is
+# appended to `RENT_HISTORY_DIR`, partitioned by crawl date and borough
+# (`snapshots/crawl_date=2024-11-30/BORO=BROOKLYN/<content hash>.parquet`). Files are only ever added.
+# Every append belongs to a crawl, identified by its start time; a crawl may append several snapshots (the
+# chunks of `streaming.py`), and a snapshot already stored for the same crawl is not appended twice.
+# A day is represented by its latest crawl: when a newer crawl of an already recorded day arrives, it
+# replaces that day's rollups instead of adding to them, so repeated crawls on one day (hourly runs) do not
+# count the same listings twice. An unchanged snapshot on a later date is stored again, so every crawl date
+# shows up in the trends.
+# Next to the snapshots, rollups of 'Average Rent' per crawl date, borough and ZIP code are maintained: count,
+# sum, minimum and maximum, plus a median sketch, a histogram over rent bins 1% wide. Appending a snapshot
+# only aggregates that snapshot and adds it to the rollups of its day, and every roll-up (ZIP -> borough -> city) is a
+# sum of histograms, so trend queries such as "median rent by borough over time" read the small rollup
+# tables instead of scanning every snapshot. Sketch medians are within 0.5% of the exact median.
+# `manifest.json` lists the stored snapshots and names the current rollup files. An append writes new rollup
+# files and then replaces the manifest in one step, so a crash in between leaves the previous rollups in
+# place and a retry counts the snapshot exactly once.
+# Run `python rent_history.py [BORO|ZIP]` to print the rent trend by borough (default) or ZIP code.
+
+import glob
+import json
+import os
+import sys
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+from config import RENT_HISTORY_DIR, STAGE_COMPRESSION
+
+KEYS = ['CRAWL_DATE', 'BORO', 'ZIP']
+RENT_COLUMN = 'Average Rent'
+
+# Log-spaced rent bins: bin i holds rents in [SKETCH_MIN * SKETCH_RATIO**i, SKETCH_MIN * SKETCH_RATIO**(i+1))
+SKETCH_MIN = 100.0
+SKETCH_RATIO = 1.01
+SKETCH_BINS = int(np.ceil(np.log(100_000 / SKETCH_MIN) / np.log(SKETCH_RATIO)))
+
+
+def rent_bins(rents):
+    """Sketch bin of each rent; rents outside $100-$100,000 go to the first or last bin."""
+    bins = np.floor(np.log(np.maximum(rents, SKETCH_MIN) / SKETCH_MIN) / np.log(SKETCH_RATIO))
+    return np.minimum(bins, SKETCH_BINS - 1).astype(np.int16)
+
+
+def bin_rent(bins):
+    """Representative rent of a sketch bin (its geometric middle)."""
+    return SKETCH_MIN * SKETCH_RATIO ** (np.asarray(bins) + 0.5)
+
+
+def summarize(snapshot, crawl_date):
+    """
+    Rollup and sketch rows of one processed snapshot.
+    :return: (rollups with KEYS, COUNT, SUM, MIN, MAX; sketches with KEYS, BIN, COUNT)
+    """
+    rents = pd.DataFrame({
+        'CRAWL_DATE': crawl_date,
+        'BORO': snapshot['BORO'].astype('str'),
+        'ZIP': snapshot['ZIP Code'].astype('str'),
+        'RENT': snapshot[RENT_COLUMN].astype('float64'),
+    }).dropna(subset=['RENT'])
+    rollups = rents.groupby(KEYS, sort=False)['RENT'].agg(COUNT='count', SUM='sum', MIN='min', MAX='max').reset_index()
+    rents['BIN'] = rent_bins(rents['RENT'].to_numpy())
+    sketches = rents.groupby(KEYS + ['BIN'], sort=False).size().rename('COUNT').reset_index()
+    return rollups, sketches
+
+
+def combine(rollups, sketches, keys):
+    """Merge rollup and sketch rows that share `keys` (sums of counts, sums and histograms)."""
+    rollups = rollups.groupby(keys, sort=True).agg(COUNT=('COUNT', 'sum'), SUM=('SUM', 'sum'),
+                                                   MIN=('MIN', 'min'), MAX=('MAX', 'max')).reset_index()
+    sketches = sketches.groupby(keys + ['BIN'], sort=True)['COUNT'].sum().reset_index()
+    return rollups, sketches
+
+
+def sketch_medians(sketches, keys):
+    """Approximate median per group of `keys` from summed histograms (sorted by bin within each group)."""
+    cumulative = sketches.groupby(keys, sort=False)['COUNT'].cumsum()
+    totals = sketches.groupby(keys, sort=False)['COUNT'].transform('sum')
+    # The first bin of each group whose cumulative count reaches half of the group
+    middle = sketches[cumulative >= totals / 2].drop_duplicates(keys)
+    return middle[keys].assign(MEDIAN=bin_rent(middle['BIN'].to_numpy()))
+
+
+def new_crawl_id(crawl_date=None):
+    """Identifier of a crawl started now: its date (default today) and the current time of day."""
+    return f"{crawl_date or time.strftime('%Y-%m-%d')}T{datetime.now().strftime('%H:%M:%S.%f')}"
+
+
+def in_dates(df, start=None, end=None):
+    """Rows of `df` with a CRAWL_DATE between `start` and `end` (ISO dates compare as text)."""
+    return df[(df['CRAWL_DATE'] >= (start or '')) & (df['CRAWL_DATE'] <= (end or '9999'))]
+
+
+class RentHistory:
+    """
+    Append-only store of processed snapshots with rent rollups.
+
+    :param history_dir: Directory holding `snapshots/`, the rollup and sketch files and `manifest.json`.
+    """
+
+    def __init__(self, history_dir=RENT_HISTORY_DIR):
+        self.history_dir = history_dir
+        self.snapshot_dir = os.path.join(history_dir, 'snapshots')
+        self.manifest_path = os.path.join(history_dir, 'manifest.json')
+        self.manifest = {'snapshots': {}, 'version': 0}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        if 'rollups' not in self.manifest and os.path.exists(os.path.join(history_dir, 'rollups.parquet')):
+            # Written before the manifest named the rollup files
+            self.manifest.update(rollups='rollups.parquet', sketches='sketches.parquet')
+        if 'crawls' not in self.manifest:
+            # Written before crawls were recorded: every snapshot of a day counts as one crawl of that day
+            self.manifest['crawls'] = {entry['crawl_date']: entry['crawl_date']
+                                       for entry in self.manifest['snapshots'].values()}
+
+    def append(self, snapshot, crawl_date=None, crawl_id=None):
+        """
+        Store a processed snapshot and add it to the rollups of its day.
+        :param snapshot: Processed apartment data (columns as written by `processing_zillow.py`).
+        :param crawl_date: 'YYYY-MM-DD' of the crawl; defaults to the date of `crawl_id`, or today.
+        :param crawl_id: Start time of the crawl (see `new_crawl_id`); pass the same one for every chunk of
+                         a crawl. Defaults to a new crawl started now.
+        :return: Number of rows appended (0 if this snapshot is already stored or its crawl is outdated).
+        """
+        crawl_date = crawl_date or (crawl_id[:10] if crawl_id else time.strftime('%Y-%m-%d'))
+        crawl_id = crawl_id or new_crawl_id(crawl_date)
+        content_hash = f"{pd.util.hash_pandas_object(snapshot, index=False).sum():016x}"
+        snapshot_id = f"{crawl_id}/{content_hash}"
+        if snapshot_id in self.manifest['snapshots']:
+            print(f"Snapshot {content_hash} is already in the rent history for crawl {crawl_id}")
+            return 0
+        current_crawl = self.manifest['crawls'].get(crawl_date)
+        if current_crawl and crawl_id < current_crawl:
+            print(f"Crawl {crawl_id} is older than crawl {current_crawl} already recorded for {crawl_date}")
+            return 0
+
+        # One new file per crawl date and borough; existing files are never rewritten
+        boroughs = snapshot['BORO'].astype('str')
+        for boro, part in snapshot.groupby(boroughs, sort=False):
+            part_dir = os.path.join(self.snapshot_dir, f"crawl_date={crawl_date}", f"BORO={boro}")
+            os.makedirs(part_dir, exist_ok=True)
+            part.drop(columns=['BORO']).to_parquet(os.path.join(part_dir, f"{content_hash}.parquet"), index=False,
+                                                   compression=STAGE_COMPRESSION)
+
+        # Only the new snapshot is aggregated; it is then folded into the stored rollups
+        rollups, sketches = summarize(snapshot, crawl_date)
+        stored_rollups, stored_sketches = self.rollups()
+        if current_crawl and crawl_id != current_crawl:
+            # A newer crawl of the day replaces the earlier one
+            print(f"Crawl {crawl_id} replaces crawl {current_crawl} in the rollups of {crawl_date}")
+            stored_rollups = stored_rollups[stored_rollups['CRAWL_DATE'] != crawl_date]
+            stored_sketches = stored_sketches[stored_sketches['CRAWL_DATE'] != crawl_date]
+        rollups, sketches = combine(pd.concat([stored_rollups, rollups]), pd.concat([stored_sketches, sketches]), KEYS)
+
+        # The rollups go to new files; replacing the manifest then records them and the snapshot together
+        previous_files = [self.manifest.get('rollups'), self.manifest.get('sketches')]
+        version = self.manifest.get('version', 0) + 1
+        manifest = {**self.manifest, 'version': version, 'rollups': f"rollups-{version}.parquet",
+                    'sketches': f"sketches-{version}.parquet",
+                    'crawls': {**self.manifest['crawls'], crawl_date: crawl_id},
+                    'snapshots': {**self.manifest['snapshots'],
+                                  snapshot_id: {'crawl_date': crawl_date, 'crawl_id': crawl_id,
+                                                'content_hash': content_hash, 'rows': len(snapshot)}}}
+        self._write(rollups, os.path.join(self.history_dir, manifest['rollups']))
+        self._write(sketches, os.path.join(self.history_dir, manifest['sketches']))
+        self._write_manifest(manifest)
+        self.manifest = manifest
+        for name in previous_files:
+            if name and os.path.exists(os.path.join(self.history_dir, name)):
+                os.remove(os.path.join(self.history_dir, name))
+        print(f"{len(snapshot)} listings added to the rent history for {crawl_date}")
+        return len(snapshot)
+
+    def rollups(self):
+        """Stored rollup and sketch rows (empty frames before the first snapshot)."""
+        if not self.manifest.get('rollups'):
+            return (pd.DataFrame(columns=KEYS + ['COUNT', 'SUM', 'MIN', 'MAX']),
+                    pd.DataFrame(columns=KEYS + ['BIN', 'COUNT']))
+        return (pd.read_parquet(os.path.join(self.history_dir, self.manifest['rollups'])),
+                pd.read_parquet(os.path.join(self.history_dir, self.manifest['sketches'])))
+
+    def trend(self, by='BORO', start=None, end=None):
+        """
+        Rent statistics per crawl date, read from the rollups only.
+        :param by: 'BORO', 'ZIP' or None for the whole city.
+        :param start: First crawl date to include ('YYYY-MM-DD'), or None.
+        :param end: Last crawl date to include, or None.
+        :return: DataFrame with CRAWL_DATE, `by`, COUNT, MEAN, MEDIAN, MIN and MAX.
+        """
+        keys = ['CRAWL_DATE'] + ([by] if by else [])
+        rollups, sketches = (in_dates(frame, start, end) for frame in self.rollups())
+        rollups, sketches = combine(rollups, sketches, keys)
+        trend = rollups.merge(sketch_medians(sketches, keys), on=keys, how='left')
+        trend['MEAN'] = trend['SUM'] / trend['COUNT']
+        return trend[keys + ['COUNT', 'MEAN', 'MEDIAN', 'MIN', 'MAX']]
+
+    def snapshots(self, start=None, end=None, boro=None, columns=None):
+        """
+        Read stored listings of the latest crawl of each day, touching only the partitions of the requested
+        crawl dates and borough.
+        :return: DataFrame of processed listings with 'crawl_date' and 'BORO' columns.
+        """
+        current = {(entry['crawl_date'], entry.get('content_hash', snapshot_id.rsplit('/', 1)[-1]))
+                   for snapshot_id, entry in self.manifest['snapshots'].items()
+                   if entry.get('crawl_id', entry['crawl_date']) == self.manifest['crawls'].get(entry['crawl_date'])}
+        paths = [path for crawl_date, content_hash in sorted(current)
+                 for path in glob.glob(os.path.join(self.snapshot_dir, f"crawl_date={crawl_date}", 'BORO=*',
+                                                    f"{content_hash}.parquet"))]
+        dataset = ds.dataset(paths, format='parquet', partitioning='hive', partition_base_dir=self.snapshot_dir)
+        condition = None
+        for part in [ds.field('crawl_date') >= start if start else None,
+                     ds.field('crawl_date') <= end if end else None,
+                     ds.field('BORO') == boro if boro else None]:
+            if part is not None:
+                condition = part if condition is None else condition & part
+        return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+    def _write(self, df, path):
+        temp_path = path + '.tmp'
+        df.to_parquet(temp_path, index=False, compression=STAGE_COMPRESSION)
+        os.replace(temp_path, path)
+
+    def _write_manifest(self, manifest):
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+
+if __name__ == "__main__":
+    by = sys.argv[1] if len(sys.argv) > 1 else 'BORO'
+    print(RentHistory().trend(by).to_string(index=False))
@@ -0,0 +1,213 @@
+#%%
+# File: service.py
+# Group members: rivenl, leylal, chengkac, bangminp
+
+# This file runs the recommender as a long-lived local HTTP/JSON service, so answering a user no longer
+# means running the crawlers and the merge first. The merged dataset is loaded once at startup into a
+# `Snapshot` (the filter engine of `filter_engine.py` and the ranker of `ranking.py`), and requests are
+# served concurrently from it by a threaded HTTP server.
+# A background thread checks the merged stage every `SERVICE_REFRESH_SECONDS`; when it changed, a new
+# snapshot is built next to the old one and swapped in with a single assignment, so requests in flight
+# keep using the snapshot they started with and never see a half-built index. `POST /refresh?rebuild=1`
+# also re-runs the merge step in the background before reloading.
+#
+# Endpoints:
+#   GET  /recommendations?boro=BROOKLYN&price=2000-2800&pets=Yes&facilities=MUSEUM,BUS STATION
+#        &crime=Very Safe&mode=rank&k=20      (options are the ones listed in `interactive_page.py`)
+#   GET  /health
+#   POST /refresh[?rebuild=1]
+#
+# Run it with `python service.py`; settings come from `config.py`.
+
+import json
+import os
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from config import *
+import storage
+from filter_engine import FilterEngine
+from ranking import Ranker
+from interactive_page import build_query_params
+
+
+def merged_version():
+    """Version of the merged stage on disk (its modification time)."""
+    return os.path.getmtime(STAGE_PATHS['merged'])
+
+
+def load_merged():
+    return storage.load_stage('merged')
+
+
+class Snapshot:
+    """Indexes over one version of the merged dataset; never modified after it is built."""
+
+    def __init__(self, df, version):
+        self.engine = FilterEngine(df)
+        self.ranker = Ranker(self.engine.df)
+        self.version = version
+        self.loaded_at = time.time()
+
+
+class RecommendationService:
+    """
+    Holds the current snapshot and answers preference queries from it.
+
+    :param load: Function returning the merged DataFrame.
+    :param version: Function returning the version of the data `load` would return.
+    """
+
+    def __init__(self, load=load_merged, version=merged_version):
+        self._load = load
+        self._version = version
+        self._refresh_lock = threading.Lock()
+        self.snapshot = Snapshot(load(), version())
+        self.last_error = None
+
+    def refresh(self, rebuild=False):
+        """
+        Rebuild the snapshot if the data changed, then swap it in.
+        :param rebuild: Re-run the merge step before reloading.
+        :return: False if another refresh is already running.
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            if rebuild:
+                import merger
+                merger.merge_datasets_with_pivot()
+            version = self._version()
+            if version != self.snapshot.version:
+                self.snapshot = Snapshot(self._load(), version)  # Atomic swap
+                print(f"Loaded merged data version {version} ({len(self.snapshot.engine)} apartments).")
+            self.last_error = None
+        except Exception as e:
+            # Keep serving the previous snapshot
+            self.last_error = str(e)
+            print(f"Refresh failed: {e}")
+        finally:
+            self._refresh_lock.release()
+        return True
+
+    def refresh_in_background(self, rebuild=False):
+        threading.Thread(target=self.refresh, args=(rebuild,), daemon=True).start()
+
+    def watch(self, interval=SERVICE_REFRESH_SECONDS):
+        """Check for new data every `interval` seconds in a daemon thread."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.refresh()
+        threading.Thread(target=loop, daemon=True).start()
+
+    def recommend(self, params):
+        """
+        Answer one request.
+        :param params: Request parameters (single values) as strings.
+        :return: JSON response body.
+        """
+        facilities = [name.strip() for name in params.get('facilities', '').split(',') if name.strip()]
+        query_params, facilities = build_query_params(
+            params.get('boro', 'Not to matter'), params.get('price', 'Not to matter'),
+            params.get('pets', 'Not to matter'), facilities, params.get('crime', 'Not to matter'))
+
+        mode = params.get('mode', RECOMMENDATION_MODE)
+        snapshot = self.snapshot  # The whole request uses one version of the data
+        if mode == 'rank':
+            results = snapshot.ranker.rank(query_params, facilities, int(params.get('k', RANKING_TOP_K)))
+            count = len(results)
+        elif mode == 'filter':
+            row_ids = snapshot.engine.match(query_params)
+            count = len(row_ids)
+            results = snapshot.engine.query_rows(row_ids[:int(params.get('limit', SERVICE_MAX_RESULTS))], facilities)
+        else:
+            raise ValueError(f"Unknown mode {mode!r}; use 'rank' or 'filter'")
+
+        # The records are serialized by pandas (NaN becomes null) and spliced in, not parsed again
+        header = json.dumps({'version': snapshot.version, 'mode': mode, 'count': count})
+        return f'{header[:-1]}, "results": {results.to_json(orient="records")}}}'.encode('utf-8')
+
+    def health(self):
+        snapshot = self.snapshot
+        return {
+            'status': 'ok',
+            'version': snapshot.version,
+            'apartments': len(snapshot.engine),
+            'loaded_at': snapshot.loaded_at,
+            'last_refresh_error': self.last_error,
+        }
+
+
+class RecommendationHandler(BaseHTTPRequestHandler):
+    """Routes requests to the `RecommendationService` attached to the server."""
+
+    def send_json(self, status, payload):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        service = self.server.service
+        try:
+            if url.path == '/recommendations':
+                self.send_json(200, service.recommend(params))
+            elif url.path == '/health':
+                self.send_json(200, service.health())
+            else:
+                self.send_json(404, {'error': f"Unknown path {url.path}"})
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+        except Exception as e:
+            # Answer instead of dropping the connection; the traceback goes to the server log
+            print(f"Request {self.path} failed: {e!r}")
+            traceback.print_exc()
+            self.send_json(500, {'error': 'internal server error'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/refresh':
+            self.send_json(404, {'error': f"Unknown path {url.path}"})
+            return
+        rebuild = parse_qs(url.query).get('rebuild', ['0'])[-1] == '1'
+        self.server.service.refresh_in_background(rebuild)
+        self.send_json(202, {'status': 'refresh started'})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(service, host=SERVICE_HOST, port=SERVICE_PORT, verbose=False):
+    """Threaded HTTP server answering requests with `service`."""
+    server = ThreadingHTTPServer((host, port), RecommendationHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+def run_service(host=SERVICE_HOST, port=SERVICE_PORT):
+    """Load the merged dataset once and serve recommendations until interrupted."""
+    print("Loading merged dataset...")
+    service = RecommendationService()
+    service.watch()
+    server = make_server(service, host, port, verbose=True)
+    print(f"Serving {len(service.snapshot.engine)} apartments on http://{host}:{port}/recommendations")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down.")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    run_service()
@@ -3,58 +3,190 @@
 # Group members: rivenl, leylal, chengkac, bangminp
 
 # This file fetches shooting incident data from NYC's open data API using Socrata.
-# It retrieves the data, converts it into a pandas DataFrame, and saves it to a CSV file.
-# The main modules imported by this file are `os`, `pandas`, and `sodapy`.
+# Only the columns the pipeline uses are requested ($select): date, borough, precinct and coordinates.
+# Records are requested page by page ($limit/$offset) and each page is written as its own typed Parquet
+# part (categorical borough, datetime, float32 coordinates) as soon as it arrives, so memory use is
+# bounded by the page size. Progress is kept in a small state file: an interrupted download resumes from
+# the last completed page, and a later run only asks for incidents newer than the latest `occur_date`
+# already on disk ($where). Read the result with `pd.read_parquet(SHOOTING_DATA_PATH, columns=[...])`.
+# The Socrata client's session goes through the shared HTTP response cache (`http_cache.py`), so
+# unchanged API responses are revalidated and served from disk.
+# The main modules imported by this file are `os`, `pandas` (with `pyarrow`), and `sodapy`.
 # It imports constants `DOWNLOAD_DIR` and `SHOOTING_FILE_NAME` from `config.py`.
 # This script can be run independently to download and save the latest data.
 
 # Make sure to install these packages before running:
 # pip install pandas
+# pip install pyarrow
 # pip install sodapy
 
 
 import os
+import json
 import pandas as pd
 from sodapy import Socrata
-from config import *  
+from config import *
+from http_cache import CachingAdapter
+import profiling
 
-# Unauthenticated client only works with public data sets. Note 'None'
-# in place of application token, and no username or password:
-client = Socrata("data.cityofnewyork.us", None)
+# NYPD Shooting Incident Data (Historic)
+DATASET_ID = "833y-fsy8"
 
-def fetch_shooting_data(download_dir, file_name, limit=999999999):
-    """Fetches shooting incident data from the NYC open data API."""
+# Columns requested from the API and the compact types they are stored with
+SHOOTING_COLUMNS = ['occur_date', 'boro', 'precinct', 'latitude', 'longitude']
+BOROUGH_TYPE = pd.CategoricalDtype(['BRONX', 'BROOKLYN', 'MANHATTAN', 'QUEENS', 'STATEN ISLAND'])
 
-    predownload_or_not = input("It takes less than one minute to scrape fresh apartment data.\n"
-                               "Use predownloaded shooting data? (y/n): ").strip().lower()
 
-    if predownload_or_not == "y" and os.path.exists(os.path.join(download_dir, file_name)):
-        print("Loading predownloaded shooting data...")
-        return pd.read_csv(os.path.join(download_dir, file_name))
+def socrata_client():
+    """Socrata client whose session goes through the HTTP response cache; close it to write the cache index."""
+    # Unauthenticated client only works with public data sets. Note 'None'
+    # in place of application token, and no username or password:
+    return Socrata(SOCRATA_DOMAIN, None,
+                   session_adapter={"prefix": "https://", "adapter": CachingAdapter()})
+
+
+def load_state(state_path):
+    """Load the download state, or an empty state if there is none."""
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(state_path, state):
+    """Write the download state atomically."""
+    temp_path = state_path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(temp_path, state_path)
+
+
+def to_typed_frame(results):
+    """Convert one page of API records to the stored schema."""
+    page_df = pd.DataFrame.from_records(results).reindex(columns=SHOOTING_COLUMNS)
+    return pd.DataFrame({
+        'occur_date': pd.to_datetime(page_df['occur_date'], errors='coerce'),
+        'boro': page_df['boro'].astype(BOROUGH_TYPE),
+        'precinct': pd.to_numeric(page_df['precinct'], errors='coerce').astype('Int16'),
+        'latitude': pd.to_numeric(page_df['latitude'], errors='coerce').astype('float32'),
+        'longitude': pd.to_numeric(page_df['longitude'], errors='coerce').astype('float32'),
+    })
+
+
+def part_files(data_dir):
+    """Parquet part files of the dataset, in the order they were written."""
+    if not os.path.isdir(data_dir):
+        return []
+    return sorted(name for name in os.listdir(data_dir) if name.endswith('.parquet'))
+
+
+def latest_occur_date(data_dir):
+    """Latest `occur_date` already stored, as an API timestamp string."""
+    if not part_files(data_dir):
+        return None
+    latest = pd.read_parquet(data_dir, columns=['occur_date'])['occur_date'].max()
+    return None if pd.isna(latest) else latest.strftime('%Y-%m-%dT%H:%M:%S.000')
+
+
+def download_shooting_pages(data_dir, state_path, page_size=SHOOTING_PAGE_SIZE, client=None):
+    """
+    Download shooting incidents page by page into Parquet parts under `data_dir`.
+    An unfinished previous run is resumed from its last completed page. Otherwise only incidents
+    newer than the latest `occur_date` on disk are requested.
+    :return: Number of records written.
+    """
+    if client is None:
+        with socrata_client() as client:
+            return download_shooting_pages(data_dir, state_path, page_size, client)
+    state = load_state(state_path)
+
+    if not part_files(data_dir):
+        state = {}  # The data is gone, so start over
+    elif not state:
+        # Data downloaded before the state file existed
+        state = {'max_occur_date': latest_occur_date(data_dir), 'run': len(part_files(data_dir))}
+    if state.get('complete', True):
+        # Start a new run, limited to records newer than what we already have
+        since = state.get('max_occur_date')
+        state = {
+            'run': state.get('run', 0) + 1,
+            'where': f"occur_date > '{since}'" if since else None,
+            'offset': 0,
+            'max_occur_date': since,
+            'complete': False,
+        }
     else:
-        print("Downloading fresh shooting data from the API...")
-        try:
-            # Fetch the data from the API
-            results = client.get("833y-fsy8", limit=limit)
+        print(f"Resuming shooting data download from record {state['offset']}...")
 
-            # Convert to pandas DataFrame
-            results_df = pd.DataFrame.from_records(results)
+    # Remove parts of this run written after the last recorded page
+    os.makedirs(data_dir, exist_ok=True)
+    run_prefix = f"part-{state['run']:05d}-"
+    for name in part_files(data_dir):
+        if name.startswith(run_prefix) and int(name[len(run_prefix):-len('.parquet')]) >= state['offset']:
+            os.remove(os.path.join(data_dir, name))
 
-            # Save the DataFrame to a CSV file
-            file_path = os.path.join(download_dir, file_name)
-            results_df.to_csv(file_path, index=False)
+    downloaded = 0
+    while True:
+        results = client.get(DATASET_ID, select=','.join(SHOOTING_COLUMNS), limit=page_size,
+                                     offset=state['offset'], order=':id', where=state['where'])
+        if not results:
+            break
+
+        page_df = to_typed_frame(results)
+        page_df.to_parquet(os.path.join(data_dir, f"{run_prefix}{state['offset']:09d}.parquet"), index=False)
+
+        downloaded += len(page_df)
+        state['offset'] += len(page_df)
+        page_dates = [record['occur_date'] for record in results if record.get('occur_date')]
+        if page_dates:
+            state['max_occur_date'] = max(filter(None, [state['max_occur_date'], max(page_dates)]))
+        save_state(state_path, state)
+        print(f"{state['offset']} records downloaded...")
+
+        if len(page_df) < page_size:
+            break
+
+    state['complete'] = True
+    save_state(state_path, state)
+    return downloaded
+
+
+def ask_use_predownloaded():
+    """Ask whether to use predownloaded shooting data."""
+    predownload_or_not = input("It takes less than one minute to scrape fresh shooting data.\n"
+                               "Use predownloaded shooting data? (y/n): ").strip().lower()
+    return predownload_or_not == "y"
 
-            print(f"Shooting incident data is saved to {file_path}")
-            print(f'{len(results_df)} records are downloaded')
 
-            return results_df  # Return the DataFrame if needed
+def fetch_shooting_data(download_dir, file_name, page_size=SHOOTING_PAGE_SIZE, use_predownloaded=None):
+    """
+    Fetches shooting incident data from the NYC open data API.
+    :param use_predownloaded: Answer to `ask_use_predownloaded`; asked here when None.
+    :return: Path of the Parquet dataset holding the shooting data.
+    """
+    file_path = os.path.join(download_dir, file_name)
+    if use_predownloaded is None:
+        use_predownloaded = ask_use_predownloaded()
+
+    if use_predownloaded and os.path.exists(file_path):
+        print("Using predownloaded shooting data...")
+        return file_path
+    else:
+        print("Downloading fresh shooting data from the API...")
+        try:
+            with profiling.stage('shooting: download pages') as record:
+                downloaded = download_shooting_pages(file_path, SHOOTING_STATE_PATH, page_size)
+                record.rows_out = downloaded
+            print(f"Shooting incident data is saved to {file_path}")
+            print(f'{downloaded} new records are downloaded')
+            return file_path
         except Exception as e:
             print(f"An error occurred while fetching data: {e}")
             return None
 
-def run_crawler():
+def run_crawler(use_predownloaded=None):
     """Main function to run the shooting incidents data crawler."""
-    fetch_shooting_data(DOWNLOAD_DIR, SHOOTING_FILE_NAME)
+    fetch_shooting_data(DOWNLOAD_DIR, SHOOTING_FILE_NAME, use_predownloaded=use_predownloaded)
 
 if __name__ == "__main__":
     run_crawler()
@@ -0,0 +1,137 @@
+#%%
+# File: spatial_index.py
+# Group members: rivenl, leylal, chengkac, bangminp
+
+# This file provides a uniform grid index over facility coordinates so that the pipeline can answer
+# "how many facilities of type X are within R meters of this apartment" without joining every
+# apartment to every facility in the same borough. Points are projected to local meters around NYC,
+# bucketed into square cells and sorted by cell key, so each query only looks at the few cells that
+# overlap its search circle. All queries are vectorized with NumPy and processed in blocks to keep
+# memory bounded.
+# The module only depends on `numpy` and `pandas` and is imported by `merger.py`.
+
+import numpy as np
+import pandas as pd
+
+# Reference point for the local projection (roughly the center of NYC)
+REFERENCE_LAT = 40.7
+REFERENCE_LON = -73.95
+METERS_PER_DEGREE_LAT = 110540.0
+METERS_PER_DEGREE_LON = 111320.0 * np.cos(np.radians(REFERENCE_LAT))
+
+# Offset used to pack (cell_x, cell_y) into a single non-negative integer key
+_KEY_BASE = 2 ** 20
+
+
+def project_to_meters(lat, lon):
+    """Project latitude/longitude arrays to x/y meters around the NYC reference point."""
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    x = (lon - REFERENCE_LON) * METERS_PER_DEGREE_LON
+    y = (lat - REFERENCE_LAT) * METERS_PER_DEGREE_LAT
+    return x, y
+
+
+def _cell_keys(cell_x, cell_y):
+    """Pack integer cell coordinates into one sortable key."""
+    return (cell_x + _KEY_BASE) * (2 * _KEY_BASE) + (cell_y + _KEY_BASE)
+
+
+def _expand_ranges(starts, stops):
+    """
+    Expand [start, stop) ranges into flat arrays of (owner, position) pairs.
+    owner[i] is the index of the range that position[i] came from.
+    """
+    lengths = stops - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    owner = np.repeat(np.arange(len(starts)), lengths)
+    range_offsets = np.cumsum(lengths) - lengths
+    positions = np.arange(total) - np.repeat(range_offsets - starts, lengths)
+    return owner, positions
+
+
+class GridIndex:
+    """
+    Uniform grid index over a set of categorized points.
+
+    :param lat: Array of point latitudes.
+    :param lon: Array of point longitudes.
+    :param categories: Array of category labels (e.g. FACTYPE), one per point.
+    :param cell_size: Grid cell edge length in meters.
+    """
+
+    def __init__(self, lat, lon, categories, cell_size=1000.0):
+        x, y = project_to_meters(lat, lon)
+        categories = pd.Categorical(categories)
+
+        # Points without usable coordinates or category cannot be indexed
+        valid = np.isfinite(x) & np.isfinite(y) & (categories.codes >= 0)
+        x, y, codes = x[valid], y[valid], categories.codes[valid]
+
+        self.cell_size = float(cell_size)
+        self.categories = list(categories.categories)
+
+        keys = _cell_keys(np.floor(x / self.cell_size).astype(np.int64),
+                          np.floor(y / self.cell_size).astype(np.int64))
+        order = np.argsort(keys, kind='stable')
+        self._keys = keys[order]
+        self._x = x[order]
+        self._y = y[order]
+        self._codes = codes[order].astype(np.int64)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def count_within(self, lat, lon, radius, block_size=4096):
+        """
+        Count indexed points of every category within `radius` meters of each query point.
+        :return: Integer array of shape (n_queries, n_categories). Queries without coordinates get zeros.
+        """
+        qx, qy = project_to_meters(lat, lon)
+        n_queries = len(qx)
+        n_categories = len(self.categories)
+        counts = np.zeros((n_queries, n_categories), dtype=np.int64)
+
+        for start in range(0, n_queries, block_size):
+            stop = min(start + block_size, n_queries)
+            counts[start:stop] = self._count_block(qx[start:stop], qy[start:stop], radius)
+        return counts
+
+    def _count_block(self, qx, qy, radius):
+        """Count matches for one block of projected query points."""
+        n_queries = len(qx)
+        n_categories = len(self.categories)
+        valid = np.isfinite(qx) & np.isfinite(qy)
+        query_ids = np.flatnonzero(valid)
+        qx, qy = qx[valid], qy[valid]
+
+        cell_x = np.floor(qx / self.cell_size).astype(np.int64)
+        cell_y = np.floor(qy / self.cell_size).astype(np.int64)
+        reach = int(np.ceil(radius / self.cell_size))
+        radius_sq = float(radius) ** 2
+
+        flat_counts = np.zeros(n_queries * n_categories, dtype=np.int64)
+        for dx in range(-reach, reach + 1):
+            for dy in range(-reach, reach + 1):
+                neighbor_keys = _cell_keys(cell_x + dx, cell_y + dy)
+                starts = np.searchsorted(self._keys, neighbor_keys, side='left')
+                stops = np.searchsorted(self._keys, neighbor_keys, side='right')
+                owner, positions = _expand_ranges(starts, stops)
+                if len(owner) == 0:
+                    continue
+
+                dist_sq = (self._x[positions] - qx[owner]) ** 2 + (self._y[positions] - qy[owner]) ** 2
+                hit = dist_sq <= radius_sq
+                flat_ids = query_ids[owner[hit]] * n_categories + self._codes[positions[hit]]
+                flat_counts += np.bincount(flat_ids, minlength=n_queries * n_categories)
+
+        return flat_counts.reshape(n_queries, n_categories)
+
+    def count_frame(self, lat, lon, radius, categories=None):
+        """Same as `count_within`, returned as a DataFrame with one column per category."""
+        counts = pd.DataFrame(self.count_within(lat, lon, radius), columns=self.categories)
+        if categories is not None:
+            counts = counts.reindex(columns=categories, fill_value=0)
+        return counts
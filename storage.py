@@ -0,0 +1,156 @@
+#%%
+# File: storage.py
+# Group members: rivenl, leylal, chengkac, bangminp
+
+# This file is the storage layer between pipeline stages. Each stage (raw apartments, processed
+# apartments, merged recommendations) is persisted as a compressed Parquet file with a fixed schema,
+# so later stages get back the same dtypes without re-parsing or re-coercing text, and can read only
+# the columns they need. CSV is kept as an export format for the stages listed in `CSV_EXPORT_STAGES`.
+# `StageWriter` writes a stage chunk by chunk (one Parquet row group per chunk) for the streaming pipeline.
+# Stage paths and export settings come from `config.py`.
+
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from config import STAGE_PATHS, CSV_EXPORT_PATHS, CSV_EXPORT_STAGES, STAGE_COMPRESSION, PIPELINE_CHUNK_SIZE
+
+# Column types enforced when a stage is saved; columns not listed keep the type pandas gives them
+STAGE_SCHEMAS = {
+    'raw': {},
+    'processed': {
+        'ZIP Code': 'string',
+        'City': 'category',
+        'BORO': 'category',
+        'Min Rent': 'float64',
+        'Max Rent': 'float64',
+        'Average Rent': 'float64',
+        'If_Pets_Allowed': 'category',
+    },
+    'merged': {
+        'ZIP CODE': 'string',
+        'CITY': 'category',
+        'BORO': 'category',
+        'MIN RENT': 'float64',
+        'MAX RENT': 'float64',
+        'AVERAGE RENT': 'float64',
+        'IF_PETS_ALLOWED': 'category',
+        'LATITUDE': 'float64',
+        'LONGITUDE': 'float64',
+        'GEOCODE_PRECISION': 'category',
+        'CRIME_SCORE': 'float32',
+        'Safety_level': 'category',
+    },
+}
+
+
+def apply_schema(df, stage):
+    """Cast the columns of `df` that have a declared type for `stage`."""
+    schema = {column: dtype for column, dtype in STAGE_SCHEMAS[stage].items() if column in df.columns}
+    return df.astype(schema)
+
+
+def save_stage(df, stage):
+    """
+    Persist the output of a pipeline stage as typed, compressed Parquet.
+    Stages listed in `CSV_EXPORT_STAGES` are also exported as CSV.
+    :return: Path of the Parquet file.
+    """
+    path = STAGE_PATHS[stage]
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    df = apply_schema(df, stage)
+    # Row groups no larger than a pipeline chunk, so stages can be streamed back in bounded memory
+    df.to_parquet(path, index=False, compression=STAGE_COMPRESSION, row_group_size=PIPELINE_CHUNK_SIZE)
+
+    if stage in CSV_EXPORT_STAGES:
+        export_csv(df, stage)
+    return path
+
+
+def load_stage(stage, columns=None):
+    """
+    Load the stored output of a pipeline stage.
+    :param columns: Optional list of columns to read; other columns are never read from disk.
+    """
+    return pd.read_parquet(STAGE_PATHS[stage], columns=columns)
+
+
+def stage_exists(stage):
+    return os.path.exists(STAGE_PATHS[stage])
+
+
+def export_csv(df, stage, path=None):
+    """Write a stage as CSV, by default to its export path in `config.py`."""
+    path = path or CSV_EXPORT_PATHS[stage]
+    df.to_csv(path, index=False)
+    return path
+
+
+class StageWriter:
+    """
+    Write a pipeline stage in chunks, so the whole stage never has to be in memory.
+    The first chunk fixes the file schema; later chunks are cast to it.
+    Use as a context manager; the stage file only replaces the previous one when the writer closes.
+    """
+
+    def __init__(self, stage, path=None):
+        self.stage = stage
+        self.path = path or STAGE_PATHS[stage]
+        self.temp_path = self.path + '.tmp'
+        self.csv_path = CSV_EXPORT_PATHS[stage] if stage in CSV_EXPORT_STAGES and path is None else None
+        self.writer = None
+        self.schema = None
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(commit=exc_type is None)
+
+    @staticmethod
+    def _file_schema(schema):
+        """Fixed types for a file: dictionary columns get 32-bit indices, all-null columns become strings."""
+        fields = []
+        for field in schema:
+            if pa.types.is_dictionary(field.type):
+                field = field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+            elif pa.types.is_null(field.type):
+                field = field.with_type(pa.string())
+            fields.append(field)
+        return pa.schema(fields, metadata=schema.metadata)
+
+    def write(self, df):
+        """Append one chunk to the stage."""
+        df = apply_schema(df, self.stage)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self.schema = self._file_schema(table.schema)
+            self.writer = pq.ParquetWriter(self.temp_path, self.schema, compression=STAGE_COMPRESSION)
+        self.writer.write_table(table.select(self.schema.names).cast(self.schema))
+
+        if self.csv_path:
+            df.to_csv(self.csv_path + '.tmp', mode='w' if self.rows == 0 else 'a', header=self.rows == 0, index=False)
+        self.rows += len(df)
+
+    def close(self, commit=True):
+        if self.writer is None:
+            return
+        self.writer.close()
+        self.writer = None
+        if commit:
+            os.replace(self.temp_path, self.path)
+            if self.csv_path:
+                os.replace(self.csv_path + '.tmp', self.csv_path)
+        else:
+            os.remove(self.temp_path)
+            if self.csv_path and os.path.exists(self.csv_path + '.tmp'):
+                os.remove(self.csv_path + '.tmp')
+
+
+def iter_stage(stage, chunk_size, columns=None):
+    """Read a stored stage as DataFrames of at most `chunk_size` rows."""
+    parquet_file = pq.ParquetFile(STAGE_PATHS[stage])
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+        yield batch.to_pandas()
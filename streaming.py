@@ -0,0 +1,85 @@
+#%%
+# File: streaming.py
+# Group members: rivenl, leylal, chengkac, bangminp
+
+# This file runs the processing half of the pipeline out of core: raw apartment records are read in
+# chunks of `PIPELINE_CHUNK_SIZE` rows and each chunk goes through process -> deduplicate -> enrich -> filter -> write
+# before the next one is read. The lookup tables for enrichment (the geocoder, the facility count indexes and
+# the crime density surface, see `merger.ApartmentEnricher`) are built once and shared by every chunk, and
+# the processed and merged stages are written one Parquet row group per chunk (`storage.StageWriter`).
+# Every processed chunk is also appended to the rent history (`rent_history.py`).
+# Memory use therefore depends on the chunk size and the lookup tables, not on the number of listings,
+# so a multi-million-row listing history can be processed on a small machine.
+# Run `python streaming.py [raw file]` with a raw Parquet stage or CSV file (default: the raw stage).
+
+import sys
+import pandas as pd
+import pyarrow.parquet as pq
+from config import *
+import storage
+import processing_zillow
+from merger import ApartmentEnricher
+from dedup import ListingIndex
+from rent_history import RentHistory, new_crawl_id
+from filter_engine import filter_frame
+from data_filter import recommendation_path
+
+
+def iter_raw_chunks(source, chunk_size=PIPELINE_CHUNK_SIZE):
+    """Raw apartment records from a Parquet or CSV file, `chunk_size` rows at a time."""
+    if source.endswith('.parquet'):
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(source, chunksize=chunk_size)
+
+
+def run_streaming_pipeline(source=None, chunk_size=PIPELINE_CHUNK_SIZE, query_params=None, output_path=None):
+    """
+    Process, enrich and store raw apartment records chunk by chunk.
+    :param source: Raw Parquet or CSV file; defaults to the stored raw stage.
+    :param query_params: Optional filter (the `interactive_page.collect_preferences` format); matching
+                         apartments are appended to `output_path` as they are found.
+    :param output_path: CSV file for the matches; defaults to a new timestamped recommendation file.
+    :return: Dictionary with the number of raw, processed and matching apartments.
+    """
+    source = source or STAGE_PATHS['raw']
+    enricher = ApartmentEnricher.from_sources()
+    listing_index = ListingIndex()  # Duplicates are dropped across chunks, not only within them
+    rent_history = RentHistory()
+    crawl_id = new_crawl_id()  # All chunks belong to one crawl
+    if query_params is not None:
+        output_path = output_path or recommendation_path()
+
+    counts = {'raw': 0, 'processed': 0, 'matched': 0}
+    with storage.StageWriter('processed') as processed_writer, storage.StageWriter('merged') as merged_writer:
+        for chunk_number, chunk in enumerate(iter_raw_chunks(source, chunk_size), start=1):
+            processed = listing_index.deduplicate(processing_zillow.process_apartment_data(chunk))
+            processed_writer.write(processed)
+            rent_history.append(processed, crawl_id=crawl_id)
+
+            merged = enricher.enrich(processed)
+            merged_writer.write(merged)
+
+            if query_params is not None:
+                matched = filter_frame(merged, query_params)
+                matched.to_csv(output_path, mode='w' if chunk_number == 1 else 'a', header=chunk_number == 1, index=False)
+                counts['matched'] += len(matched)
+
+            counts['raw'] += len(chunk)
+            counts['processed'] += len(processed)
+            print(f"Chunk {chunk_number}: {counts['raw']} raw records processed...")
+
+    listing_index.save()
+    listing_index.report()
+    enricher.geocoder.save()
+    enricher.geocoder.report()
+    enricher.catalog.save()
+    print(f"{counts['processed']} apartments processed and merged in chunks of {chunk_size}.")
+    if query_params is not None:
+        print(f"{counts['matched']} apartments match your preferences; saved to {output_path}")
+    return counts
+
+
+if __name__ == "__main__":
+    run_streaming_pipeline(sys.argv[1] if len(sys.argv) > 1 else None)
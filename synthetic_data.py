@@ -0,0 +1,268 @@
+#%%
+# File: synthetic_data.py
+# Group members: rivenl, leylal, chengkac, bangminp
+
+# This file generates NYC-shaped test data for the benchmarks, so nothing has to be downloaded or crawled
+# to measure the pipeline. Every generator takes a seed and returns the same data for the same seed.
+# Addresses are drawn from a fixed street map: each borough has its ZIP codes (in the ranges
+# `processing_zillow` maps to boroughs), every ZIP code has a centroid and a set of streets, and a house
+# number is placed along its street. Apartments ('2385 3rd Ave, Bronx, NY 10451') and facilities
+# ('2385 3 AVENUE') use the same map, so the geocoder places apartments as it would with real data.
+# Raw apartments carry rent strings ('$2,814-$3,518/mo'), pet policies and school columns as the crawler
+# writes them, with a share of re-listed buildings under spelling variants of their address.
+# `write_sources` writes the facilities and shooting files the merge reads, into the current directory
+# layout of `config.py`. Columns are built with vectorized string operations, so 10 million rows take
+# seconds per column rather than minutes.
+
+import os
+import numpy as np
+import pandas as pd
+from config import FACILITIES_DATA_PATH, SHOOTING_DATA_PATH, FACILITY_TYPES
+
+BOROUGHS = ['BRONX', 'BROOKLYN', 'MANHATTAN', 'QUEENS', 'STATEN ISLAND']
+FACTYPES = ['BUS STATION', 'MUSEUM', 'COMMERCIAL GARAGE AND PARKING LOT', 'PUBLIC LIBRARY']
+
+# Borough -> (city in addresses, ZIP codes, latitude range, longitude range, share of listings)
+BOROUGH_AREAS = {
+    'MANHATTAN': ('New York', range(10001, 10041), (40.70, 40.87), (-74.02, -73.92), 0.35),
+    'BROOKLYN': ('Brooklyn', range(11201, 11240), (40.58, 40.73), (-74.03, -73.86), 0.28),
+    'QUEENS': ('Queens', range(11354, 11380), (40.55, 40.79), (-73.95, -73.72), 0.20),
+    'BRONX': ('Bronx', range(10451, 10476), (40.80, 40.90), (-73.92, -73.78), 0.12),
+    'STATEN ISLAND': ('Staten Island', range(10301, 10315), (40.51, 40.64), (-74.22, -74.06), 0.05),
+}
+# (name as listed on Zillow, name as written in the facilities database)
+STREETS = [
+    ('Main St', 'MAIN STREET'), ('Broadway', 'BROADWAY'), ('Park Ave', 'PARK AVENUE'), ('3rd Ave', '3 AVENUE'),
+    ('W 43rd St', 'WEST 43 STREET'), ('E 86th St', 'EAST 86 STREET'), ('Atlantic Ave', 'ATLANTIC AVENUE'),
+    ('Ocean Pkwy', 'OCEAN PARKWAY'), ('Grand Concourse', 'GRAND CONCOURSE'), ('Jamaica Ave', 'JAMAICA AVENUE'),
+    ('Bedford Ave', 'BEDFORD AVENUE'), ('Wharf Dr', 'WHARF DRIVE'), ('Lincoln Ave', 'LINCOLN AVENUE'),
+    ('Carroll St', 'CARROLL STREET'), ('Suffolk St', 'SUFFOLK STREET'), ('Victory Blvd', 'VICTORY BOULEVARD'),
+    ('Northern Blvd', 'NORTHERN BOULEVARD'), ('Fulton St', 'FULTON STREET'), ('Court St', 'COURT STREET'),
+    ('Riverside Dr', 'RIVERSIDE DRIVE'),
+]
+STREETS_PER_ZIP = 16
+MAX_HOUSE_NUMBER = 3000
+DEGREES_PER_HOUSE_NUMBER = 0.00001  # About one meter
+
+BUILDING_NAMES = ['The Ellery', 'Third at Bankside', 'West Wharf', 'The Suffolk', 'Lincoln at Bankside',
+                  'The Carroll', 'Park Tower', 'Riverview', 'The Grand', 'Hudson House']
+FEATURES = ['Apartment buildingStudio-2 bedsOther parking + 1In-unit dryer + 1',
+            'Apartment buildingStudio-3 bedsPet-friendlyAir conditioning availableIn-unit dryer + 2',
+            'Apartment building1-2 bedsDoormanElevator', 'Apartment building2-3 bedsGarage parking']
+APPLIANCES = ['Dishwasher, Dryer, Washer', 'Dishwasher, Dryer, Microwave oven, Washer', 'Dishwasher', 'N/A']
+SCHOOLS = ['Ps 154 Jonathan D Hyatt', 'Bronx Academy Of Letters', 'Is 318 Eugenio Maria De Hostos',
+           'Ps 321 William Penn', 'Brooklyn Tech High School', 'Ms 51 William Alexander']
+GRADES = ['PK-5', 'K-5', '6-8', '9-12', '6-12']
+
+
+def synthetic_points(n, seed):
+    """Random points inside the NYC bounding box with a borough label."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'LATITUDE': rng.uniform(40.50, 40.91, n),
+        'LONGITUDE': rng.uniform(-74.25, -73.70, n),
+        'BORO': rng.choice(BOROUGHS, n),
+    })
+
+
+def street_map(seed=0):
+    """
+    The synthetic street layout: one row per ZIP code and street, with where house number 0 is and the
+    direction numbers run in. Fixed for a seed, so apartments and facilities share it.
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for boro, (city, zips, lat_range, lon_range, share) in BOROUGH_AREAS.items():
+        for zip_code in zips:
+            lat, lon = rng.uniform(*lat_range), rng.uniform(*lon_range)
+            for street in rng.choice(len(STREETS), STREETS_PER_ZIP, replace=False):
+                angle = rng.uniform(0, 2 * np.pi)
+                rows.append((boro, city, str(zip_code), street, lat, lon, np.cos(angle), np.sin(angle), share / len(zips)))
+    streets = pd.DataFrame(rows, columns=['BORO', 'CITY', 'ZIP', 'STREET', 'LAT0', 'LON0', 'DLAT', 'DLON', 'WEIGHT'])
+    streets['WEIGHT'] /= streets['WEIGHT'].sum()
+    return streets
+
+
+def synthetic_addresses(n, seed=0, map_seed=0):
+    """
+    `n` addresses on the street map.
+    :return: DataFrame with BORO, CITY, ZIP, STREET (index into `STREETS`), NUMBER, LATITUDE and LONGITUDE.
+    """
+    rng = np.random.default_rng(seed)
+    streets = street_map(map_seed)
+    picked = streets.iloc[rng.choice(len(streets), n, p=streets['WEIGHT'].to_numpy())].reset_index(drop=True)
+    number = rng.integers(1, MAX_HOUSE_NUMBER, n)
+    offset = number * DEGREES_PER_HOUSE_NUMBER
+    return pd.DataFrame({
+        'BORO': picked['BORO'], 'CITY': picked['CITY'], 'ZIP': picked['ZIP'], 'STREET': picked['STREET'],
+        'NUMBER': number,
+        'LATITUDE': picked['LAT0'] + offset * picked['DLAT'],
+        'LONGITUDE': picked['LON0'] + offset * picked['DLON'],
+    })
+
+
+def text(values):
+    """Numbers or objects as a string column (for vectorized concatenation)."""
+    return pd.Series(values).astype('str')
+
+
+def dollars(amounts):
+    """Whole dollar amounts from $1,000 to $999,999 as '$2,814'."""
+    amounts = pd.Series(amounts)
+    return '$' + text(amounts // 1000) + ',' + text(amounts % 1000).str.zfill(3)
+
+
+def synthetic_raw(n, seed=0, duplicate_rate=0.05):
+    """
+    A raw-stage frame (the columns the crawler writes) with `n` synthetic listings.
+    About `duplicate_rate` of them re-list an earlier building under another spelling of its address.
+    """
+    rng = np.random.default_rng(seed)
+    places = synthetic_addresses(n, seed)
+
+    # Re-listed buildings: an earlier address, spelled out in full or with a unit number
+    duplicates = np.flatnonzero(rng.random(n) < duplicate_rate)
+    duplicates = duplicates[duplicates > 0]
+    places.iloc[duplicates] = places.iloc[rng.integers(0, duplicates)].to_numpy()
+    street = text(np.array([name for name, _ in STREETS], dtype=object)[places['STREET']])
+    variants = rng.random(len(duplicates))
+    street.iloc[duplicates] = np.where(
+        variants < 0.5,
+        street.iloc[duplicates].str.replace(' St', ' Street').str.replace(' Ave', ' Avenue'),
+        street.iloc[duplicates] + ' Apt ' + text(rng.integers(1, 30, len(duplicates))).to_numpy() + 'B')
+    street_address = text(places['NUMBER']) + ' ' + street
+    address = street_address + ', ' + places['CITY'] + ', NY ' + places['ZIP']
+
+    low = rng.integers(1500, 6000, n)
+    high = low + rng.integers(100, 1500, n)
+    rent = np.where(rng.random(n) < 0.6, dollars(low) + '-' + dollars(high) + '/mo', dollars(low) + '/mo')
+    rent = np.where(rng.random(n) < 0.03, 'Contact for price', rent)
+
+    # Buildings without a name are listed under their street address
+    name = np.where(rng.random(n) < 0.2, street_address, np.array(BUILDING_NAMES, dtype=object)[rng.integers(0, len(BUILDING_NAMES), n)])
+    policies = np.array(['Allowed', 'Not allowed', 'N/A'], dtype=object)
+    df = pd.DataFrame({
+        'Apartment Name': name,
+        'Address': address,
+        'Rent': rent,
+        'Features': rng.choice(np.array(FEATURES, dtype=object), n),
+        'Appliances': rng.choice(np.array(APPLIANCES, dtype=object), n),
+        'Dogs Policy': rng.choice(policies, n),
+        'Cats Policy': rng.choice(policies, n),
+        'Large Dogs Policy': rng.choice(policies, n),
+        'Small Dogs Policy': rng.choice(policies, n),
+        'Pets Allowed': rng.choice(np.array(['Pets allowed: Yes', 'Pets allowed: No', 'N/A'], dtype=object), n),
+    }).astype('str')  # Text columns get the string dtype `pd.read_csv` and the crawler's DataFrame produce
+    for k in range(1, 4):
+        listed = rng.random(n) < 0.9 - 0.2 * k  # Fewer listings name a second and third school
+        df[f'school_name_{k}'] = pd.Series(rng.choice(np.array(SCHOOLS, dtype=object), n), dtype='str').where(listed)
+        df[f'Grades_{k}'] = pd.Series(rng.choice(np.array(GRADES, dtype=object), n), dtype='str').where(listed)
+        df[f'Rank_{k}'] = pd.Series(rng.integers(1, 11, n), dtype='float64').where(listed)
+    return df
+
+
+def synthetic_facilities(n, seed=1, map_seed=0):
+    """Facilities in the columns of the facilities database, at addresses of the street map."""
+    rng = np.random.default_rng(seed)
+    places = synthetic_addresses(n, seed, map_seed)
+    factypes = np.array(FACILITY_TYPES + ['PUBLIC SCHOOL', 'DAY CARE', 'PARK'], dtype=object)
+    factype = rng.choice(factypes, n)
+    groups = {'BUS STATION': 'TRANSPORTATION', 'COMMERCIAL GARAGE AND PARKING LOT': 'TRANSPORTATION',
+              'MUSEUM': 'CULTURAL INSTITUTIONS', 'PUBLIC LIBRARY': 'LIBRARIES', 'PUBLIC SCHOOL': 'SCHOOLS (K-12)',
+              'DAY CARE': 'DAY CARE AND PRE-KINDERGARTEN', 'PARK': 'PARKS AND PLAZAS'}
+    streets = np.array([name for _, name in STREETS], dtype=object)
+    return pd.DataFrame({
+        'ADDRESS': text(places['NUMBER']) + ' ' + text(streets[places['STREET']]),
+        'FACTYPE': factype,
+        'FACGROUP': pd.Series(factype).map(groups).fillna('OTHER'),
+        'BORO': places['BORO'],
+        'ZIPCODE': places['ZIP'].astype('int64'),
+        'LATITUDE': places['LATITUDE'],
+        'LONGITUDE': places['LONGITUDE'],
+    })
+
+
+def synthetic_shootings(n, seed=2, map_seed=0):
+    """Shooting incidents in the columns `shooting_crawler` stores, clustered around street map addresses."""
+    rng = np.random.default_rng(seed)
+    places = synthetic_addresses(n, seed, map_seed)
+    return pd.DataFrame({
+        'occur_date': pd.Timestamp('2006-01-01') + pd.to_timedelta(rng.integers(0, 18 * 365, n), unit='D'),
+        'boro': places['BORO'].astype('category'),
+        'precinct': pd.array(rng.integers(1, 124, n), dtype='Int16'),
+        'latitude': (places['LATITUDE'] + rng.normal(0, 0.002, n)).astype('float32'),
+        'longitude': (places['LONGITUDE'] + rng.normal(0, 0.002, n)).astype('float32'),
+    })
+
+
+def write_sources(n_facilities=30_000, n_shootings=30_000, seed=0):
+    """Write the facilities CSV and shooting data the merge reads, at their `config.py` paths."""
+    synthetic_facilities(n_facilities, seed + 1, seed).to_csv(FACILITIES_DATA_PATH, index=False)
+    os.makedirs(SHOOTING_DATA_PATH, exist_ok=True)
+    synthetic_shootings(n_shootings, seed + 2, seed).to_parquet(os.path.join(SHOOTING_DATA_PATH, 'part-00000.parquet'),
+                                                               index=False)
+
+
+def synthetic_merged(n, seed=0):
+    """A merged-stage frame (the columns `data_filter` reads) with `n` synthetic listings."""
+    rng = np.random.default_rng(seed)
+    zips = rng.integers(10001, 11698, n)
+    low = rng.integers(1500, 6000, n)
+    df = pd.DataFrame({
+        'ADDRESS': [f"{i} Main St, New York, NY {z}" for i, z in enumerate(zips)],
+        'APARTMENT NAME': [f"Building {i}" for i in range(n)],
+        'RENT': [f"${a:,}-${a + 500:,}/mo" for a in low],
+        'ZIP CODE': zips.astype(str),
+        'CITY': rng.choice(['New York', 'Brooklyn', 'Bronx', 'Queens'], n),
+        'BORO': rng.choice(BOROUGHS, n),
+        'AVERAGE RENT': low + 250.0,
+        'IF_PETS_ALLOWED': rng.choice(['Allowed', 'Not Allowed', 'N/A'], n),
+        'LATITUDE': rng.uniform(40.50, 40.91, n),
+        'LONGITUDE': rng.uniform(-74.25, -73.70, n),
+        'CRIME_SCORE': rng.exponential(5, n),
+        'Safety_level': rng.choice(['Very Safe', 'Relatively Safe', 'Caution Advised'], n),
+    })
+    for factype in FACTYPES:
+        df[factype] = rng.integers(0, 300, n)
+    return df
+
+
+def synthetic_detail_page(i, filler_blocks=300):
+    """A Zillow-like detail page with the elements the extraction helpers look for, padded with filler markup."""
+    filler = ''.join(f'<div class="filler"><p>Lorem ipsum {j}</p><span>text</span></div>' for j in range(filler_blocks))
+    policy = ('<div data-test-id="building-null-dogs-policy"><ul>'
+              '<li class="ListItem-c11n-8-101-4__sc-13rwu5a-0 fxuoli"><span class="Text-c11n-8-101-4__sc-aiai24-0 gtFYdd">Allowed</span></li>'
+              '</ul></div>') if i % 2 else ''
+    appliances = ('<div data-test-id="building-amenity-appliances"><ul>'
+                  '<li class="ListItem-c11n-8-101-4__sc-13rwu5a-0 fxuoli"><span class="Text-c11n-8-101-4__sc-aiai24-0 gtFYdd">Dishwasher</span></li>'
+                  '</ul></div>')
+    management = ('<div data-testid="fact-category"><h6>Management</h6><ul>'
+                  '<li class="ListItem-c11n-8-100-1__sc-13rwu5a-0 dWrjmG"><span class="Text-c11n-8-100-1__sc-aiai24-0 jbRdkh">Pets allowed: Yes</span></li>'
+                  '</ul></div>') if i % 3 == 0 else ''
+    schools = ''.join(
+        '<li class="ListItem-c11n-8-100-1__sc-13rwu5a-0 sc-fiDBSu sjBJu ekjldB">'
+        f'<a class="StyledTextButton-c11n-8-100-1__sc-1nwmfqo-0 hcHpXi notranslate">IS {k}</a>'
+        '<span class="Text-c11n-8-100-1__sc-aiai24-0 kbVOjR">6-8</span>'
+        f'<span class="Text-c11n-8-100-1__sc-aiai24-0 bENqXR">{k + 5}/10</span></li>' for k in range(3))
+    return (f'<html><body>{filler}'
+            f'<h1 data-test-id="bdp-building-title">Building {i}</h1>'
+            f'<h2 data-test-id="bdp-building-address">{i} Main St, New York, NY 10001</h2>'
+            f'<span data-test-id="base-rent">${2000 + i:,}-${3000 + i:,}/mo</span>'
+            '<div class="hdp__sc-1nwbd1e-0 dcGsBQ">Cats, dogs OK</div>'
+            f'{appliances}{policy}{management}'
+            f'<h5>GreatSchools rating</h5><div class="Spacer-c11n-8-100-1__sc-17suqs2-0 sc-jRWcDx dQqFYn"><ul>{schools}</ul></div>'
+            f'{filler}</body></html>')
+
+
+SEARCH_LIST_CLASS = ('List-c11n-8-105-0__sc-1smrmqp-0 StyledSearchListWrapper-srp-8-105-0__sc-1ieen0c-0 fNTnXQ dtRiBi '
+                     'photo-cards photo-cards_extra-attribution')
+SEARCH_CARD_CLASS = 'ListItem-c11n-8-105-0__sc-13rwu5a-0 StyledListCardWrapper-srp-8-105-0__sc-wtsrtn-0 gpgmwS cXzrsE'
+
+
+def synthetic_search_page(base_url, listing_ids):
+    """A Zillow-like search-result page with one card per listing id."""
+    cards = ''.join(
+        f'<li class="{SEARCH_CARD_CLASS}"><a class="property-card-link" href="{base_url}/homedetails/{i}/">'
+        f'<address data-test="property-card-addr">{i} Main St, New York, NY 10001</address></a>'
+        f'<span data-test="property-card-price">${2000 + i:,}/mo</span></li>' for i in listing_ids)
+    return f'<html><body><ul class="{SEARCH_LIST_CLASS}">{cards}</ul></body></html>'
@@ -0,0 +1,111 @@
+# File: tests/test_shooting_crawler.py
+# Group members: rivenl, leylal, chengkac, bangminp
+
+# Paging and resume of `shooting_crawler.download_shooting_pages`, run against a local stand-in for the
+# Socrata API instead of the NYC open data portal.
+
+import re
+import pandas as pd
+import pytest
+import shooting_crawler
+
+
+class FakeSocrata:
+    """
+    Stand-in for `sodapy.Socrata` serving a fixed list of incident records in `:id` order.
+    Supports the `$limit`, `$offset` and `occur_date > '...'` `$where` parameters the crawler sends,
+    and raises on the requests listed in `fail_offsets` (once each).
+    """
+
+    def __init__(self, records, fail_offsets=()):
+        self.records = records
+        self.fail_offsets = set(fail_offsets)
+        self.requests = []
+
+    def get(self, dataset_id, select=None, limit=1000, offset=0, order=None, where=None):
+        self.requests.append({'offset': offset, 'where': where})
+        if offset in self.fail_offsets:
+            self.fail_offsets.discard(offset)
+            raise ConnectionError(f"connection reset at offset {offset}")
+        records = self.records
+        if where:
+            since = re.fullmatch(r"occur_date > '(.+)'", where).group(1)
+            records = [record for record in records if record['occur_date'] > since]
+        return [dict(record) for record in records[offset:offset + limit]]
+
+
+def incidents(n, first_day=0):
+    """`n` distinct incident records, one per day from 2020-01-01 + `first_day`."""
+    dates = pd.date_range('2020-01-01', periods=first_day + n, freq='D')[first_day:]
+    return [{'occur_date': date.strftime('%Y-%m-%dT%H:%M:%S.000'), 'boro': 'BROOKLYN', 'precinct': str(60 + i % 30),
+             'latitude': str(40.6 + i * 1e-4), 'longitude': str(-73.9 - i * 1e-4)}
+            for i, date in zip(range(first_day, first_day + n), dates)]
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / 'shooting_data.parquet'), str(tmp_path / 'shooting_data.state.json')
+
+
+def stored(data_dir):
+    return pd.read_parquet(data_dir).sort_values('occur_date').reset_index(drop=True)
+
+
+def test_pages_through_all_records(paths):
+    data_dir, state_path = paths
+    client = FakeSocrata(incidents(25))
+
+    assert shooting_crawler.download_shooting_pages(data_dir, state_path, page_size=10, client=client) == 25
+    assert [request['offset'] for request in client.requests] == [0, 10, 20]
+    assert len(stored(data_dir)) == 25
+    assert shooting_crawler.load_state(state_path)['complete']
+
+
+def test_resumes_after_a_failed_page_without_duplicates(paths):
+    data_dir, state_path = paths
+    client = FakeSocrata(incidents(25), fail_offsets=[10])
+
+    with pytest.raises(ConnectionError):
+        shooting_crawler.download_shooting_pages(data_dir, state_path, page_size=10, client=client)
+    state = shooting_crawler.load_state(state_path)
+    assert state['offset'] == 10 and not state['complete']
+
+    client.requests.clear()
+    assert shooting_crawler.download_shooting_pages(data_dir, state_path, page_size=10, client=client) == 15
+    assert client.requests[0]['offset'] == 10  # Resumed, not restarted
+    data = stored(data_dir)
+    assert len(data) == 25
+    assert not data.duplicated().any()
+
+
+def test_resume_drops_a_page_written_before_the_state_was_saved(paths, monkeypatch):
+    data_dir, state_path = paths
+    client = FakeSocrata(incidents(25))
+    save_state = shooting_crawler.save_state
+
+    def crash_after_second_page(path, state):
+        if state['offset'] == 20 and not state['complete']:
+            raise KeyboardInterrupt  # The part of offset 10 is on disk, the state still says offset 10
+        save_state(path, state)
+
+    monkeypatch.setattr(shooting_crawler, 'save_state', crash_after_second_page)
+    with pytest.raises(KeyboardInterrupt):
+        shooting_crawler.download_shooting_pages(data_dir, state_path, page_size=10, client=client)
+    monkeypatch.setattr(shooting_crawler, 'save_state', save_state)
+
+    shooting_crawler.download_shooting_pages(data_dir, state_path, page_size=10, client=client)
+    data = stored(data_dir)
+    assert len(data) == 25
+    assert not data.duplicated().any()
+
+
+def test_later_run_only_requests_newer_incidents(paths):
+    data_dir, state_path = paths
+    shooting_crawler.download_shooting_pages(data_dir, state_path, page_size=10, client=FakeSocrata(incidents(25)))
+
+    client = FakeSocrata(incidents(25) + incidents(7, first_day=25))
+    assert shooting_crawler.download_shooting_pages(data_dir, state_path, page_size=10, client=client) == 7
+    assert client.requests[0]['where'] == "occur_date > '2020-01-25T00:00:00.000'"
+    data = stored(data_dir)
+    assert len(data) == 32
+    assert not data.duplicated().any()